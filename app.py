@@ -1,8 +1,13 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+import hashlib
 import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel
 
 app = FastAPI()
@@ -32,15 +37,93 @@ class WebsiteGeneration(BaseModel):
 
 VALID_TEMPLATES = ['minimal', 'corporate', 'creative']
 
+# Marcadores {{nombre}} o {{ nombre }}
+PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+class CompiledTemplate:
+    """Fichero de template en memoria con su plan de sustitución.
+
+    El plan es la lista de fragmentos literales y marcadores, de modo que
+    `render` recorre el documento una sola vez sea cual sea el número de
+    marcadores. Los marcadores sin valor se dejan tal cual.
+    """
+
+    def __init__(self, path: str, content: bytes, mtime_ns: int, size: int):
+        self.path = path
+        self.content = content
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.etag = '"' + hashlib.md5(content).hexdigest() + '"'
+        self.checked_at = time.monotonic()
+
+        text = content.decode("utf-8")
+        self.plan: List[Tuple[str, Optional[str], str]] = []
+        position = 0
+        for match in PLACEHOLDER.finditer(text):
+            self.plan.append((text[position:match.start()], match.group(1), match.group(0)))
+            position = match.end()
+        self.tail = text[position:]
+
+    def render(self, values: Dict[str, str]) -> str:
+        parts = []
+        for literal, name, raw in self.plan:
+            parts.append(literal)
+            parts.append(values.get(name, raw))
+        parts.append(self.tail)
+        return "".join(parts)
+
+class TemplateRegistry:
+    """Templates cargados una vez y recargados solo si cambia el fichero.
+
+    El mtime y el tamaño se comprueban como mucho una vez cada
+    `check_interval` segundos por fichero.
+    """
+
+    def __init__(self, directory: str = "templates", check_interval: float = 1.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self.templates: Dict[str, CompiledTemplate] = {}
+        self.loads = 0
+        self._lock = threading.Lock()
+
+    def get(self, filename: str) -> CompiledTemplate:
+        entry = self.templates.get(filename)
+        now = time.monotonic()
+        if entry is not None and now - entry.checked_at < self.check_interval:
+            return entry
+
+        path = os.path.join(self.directory, filename)
+        stat = os.stat(path)
+        if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+            entry.checked_at = now
+            return entry
+
+        with self._lock:
+            with open(path, 'rb') as f:
+                entry = CompiledTemplate(path, f.read(), stat.st_mtime_ns, stat.st_size)
+            self.templates[filename] = entry
+            self.loads += 1
+        return entry
+
+    def response(self, filename: str, request: Request, media_type: str = "text/html") -> Response:
+        """Respuesta con el contenido en memoria; 304 si el cliente ya lo tiene"""
+        entry = self.get(filename)
+        headers = {"ETag": entry.etag}
+        if request.headers.get("if-none-match") == entry.etag:
+            return Response(status_code=304, headers=headers)
+        return Response(entry.content, media_type=media_type, headers=headers)
+
+template_registry = TemplateRegistry()
+
 @app.get("/")
-async def template_selection():
-    return FileResponse("templates/preview.html")
+async def template_selection(request: Request):
+    return template_registry.response("preview.html", request)
 
 @app.get("/{template_name}.html")
-async def get_template(template_name: str):
+async def get_template(template_name: str, request: Request):
     if template_name not in VALID_TEMPLATES:
         raise HTTPException(status_code=404, detail="Template not found")
-    return FileResponse(f"templates/{template_name}.html")
+    return template_registry.response(f"{template_name}.html", request)
 
 @app.post("/api/select-template")
 async def select_template(template_data: TemplateSelect):
@@ -57,8 +140,8 @@ async def select_template(template_data: TemplateSelect):
     }
 
 @app.get("/editor")
-async def editor():
-    return FileResponse("templates/test_ui.html")
+async def editor(request: Request):
+    return template_registry.response("test_ui.html", request)
 
 @app.post("/api/generate-frontpage")
 async def generate_frontpage(data: WebsiteGeneration):
@@ -69,24 +152,21 @@ async def generate_frontpage(data: WebsiteGeneration):
         )
     
     try:
-        # Read the template file
-        template_path = f"templates/{data.template}.html"
-        css_path = f"templates/{data.template}.css"
-        
-        with open(template_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        
-        with open(css_path, 'r', encoding='utf-8') as f:
-            css_content = f.read()
-        
-        # Replace placeholders in the template
-        html_content = html_content.replace("{{title}}", data.title)
-        html_content = html_content.replace("{{subtitle}}", data.subtitle)
-        css_content = css_content.replace("{{primaryColor}}", data.primaryColor)
-        
+        # Templates en memoria, recargados solo si cambian en disco
+        html_template = template_registry.get(f"{data.template}.html")
+        css_template = template_registry.get(f"{data.template}.css")
+
+        # Sustituir todos los marcadores en una sola pasada
+        values = {
+            "title": data.title,
+            "subtitle": data.subtitle,
+            "primaryColor": data.primaryColor,
+            "primary_color": data.primaryColor,
+        }
+
         return JSONResponse({
-            "html": html_content,
-            "css": css_content
+            "html": html_template.render(values),
+            "css": css_template.render(values)
         })
     
     except Exception as e:
@@ -1,30 +1,49 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Body, HTTPException, Depends, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError as SchemaValidationError
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, Response, StreamingResponse
+import asyncio
 import secrets
 from datetime import datetime
-from typing import Dict
+from typing import Any, Dict, Literal, Optional
 
 from app.models.schemas import (
     FrontPageRequest,
     FrontPageResponse,
+    BulkExportRequest,
     WebhookConfig,
     GenerationEvent,
     TemplateType,
     FontFamily
 )
-from app.services.renderer import get_cached_render, PreviewData
+from app.services.renderer import get_cached_render, get_template, is_cached, read_template_sources, reload_templates, PreviewData
+from app.services.export import render_page, stream_site, stream_sites
+from app.services.images import attach_hero_image, pipeline as image_pipeline, srcset
 from app.services.webhooks import webhooks, notify_generation_event
+from app.services.outbox import outbox
+from app.services.circuit_breaker import get_health, reset_health
+from app.services.profiling import profile_store
+from app.services import editor
+from app.services.editor import SessionPreview, editor_sessions, merge_changes, patch_session
 from app.core.config import settings
 from app.core.error_handling import NotFoundError, ValidationError, ServerError
-from app.core.json_rate_limiter import rate_limiter_dependency
+from app.core.json_rate_limiter import editor_rate_limiter_dependency, rate_limiter_dependency
+from app.core.admission import Priority, admission_controlled
+from app.core.idempotency import idempotent
 from fastapi.security import OAuth2PasswordBearer
-from app.core.auth import decode_access_token
+from app.core.auth import decode_access_token, token_subject
+from app.core.metrics import gauge, stage_timer
+from app.api.routing import InstrumentedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
 
 # Almacenamiento temporal para las previsualizaciones
 preview_storage: Dict[str, PreviewData] = {}
 
+gauge("frontpage_preview_store_size", "Previsualizaciones almacenadas", function=lambda: len(preview_storage))
+_auth_timer = stage_timer("auth")
+
 def cleanup_expired_previews():
     """Limpia las previsualizaciones expiradas"""
     expired = [token for token, data in preview_storage.items() if data.is_expired()]
@@ -33,12 +52,30 @@ def cleanup_expired_previews():
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    payload = decode_access_token(token)
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    with _auth_timer.time():
+        payload = decode_access_token(token)
     if payload is None:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     return payload
 
+async def _render_priority(request: Request) -> Priority:
+    """Alta si la página ya está en caché (con el `srcset` de la imagen hero si ya está procesada)"""
+    try:
+        page = FrontPageRequest.model_validate_json(await request.body())
+    except SchemaValidationError:
+        # El handler responderá 422
+        return Priority.NORMAL
+    context = page.model_dump(mode="json")
+    if page.heroImage is not None:
+        # Mismo contexto que renderizará el handler, sin descargar nada
+        manifest = image_pipeline.cached_variants(str(page.heroImage))
+        if manifest is not None:
+            context["hero"] = srcset(manifest)
+    if is_cached(page.template.value, context):
+        return Priority.HIGH
+    return Priority.NORMAL
+
 @router.get("/", dependencies=[Depends(rate_limiter_dependency), Depends(get_current_user)])
 def root():
     """Página principal"""
@@ -66,16 +103,21 @@ def root():
     """)
 
 @router.post("/generate-frontpage", response_model=FrontPageResponse, dependencies=[Depends(rate_limiter_dependency), Depends(get_current_user)])
+@admission_controlled(_render_priority)
+@idempotent
 async def generate_frontpage(request: FrontPageRequest):
     """Genera una front page basada en el template y parámetros proporcionados"""
+    # Generar token único para previsualización
+    token = secrets.token_urlsafe(16)
     try:
-        rendered = get_cached_render(request.template.value, request.model_dump())
+        context = await attach_hero_image(request.model_dump(mode="json"))
+        rendered = get_cached_render(request.template.value, context)
         if not rendered:
             raise ServerError()
         
-        # Generar token único para previsualización
-        token = secrets.token_urlsafe(16)
-        preview_storage[token] = PreviewData(**rendered)
+        preview_storage[token] = PreviewData(
+            rendered["html"], rendered["css"], request.template.value, rendered.get("template_version")
+        )
         preview_url = f"/preview/{token}"
         
         # Notificar evento
@@ -91,23 +133,35 @@ async def generate_frontpage(request: FrontPageRequest):
         return FrontPageResponse(
             html=rendered["html"],
             css=rendered["css"],
-            preview_url=preview_url
+            preview_url=preview_url,
+            css_stats=rendered.get("css_stats")
         )
-    except ValidationError as e:
-        raise HTTPException(status_code=e.code, detail=str(e))
-    except ServerError as e:
+    except (ValidationError, ServerError) as e:
+        # Notificar el fallo a los webhooks suscritos a errores
+        await notify_generation_event(GenerationEvent(
+            event_id=token,
+            template_type=request.template.value,
+            timestamp=datetime.now().isoformat(),
+            status="error",
+            details={**request.model_dump(), "error": str(e)}
+        ))
         raise HTTPException(status_code=e.code, detail=str(e))
 
 @router.post("/generate-preview", dependencies=[Depends(rate_limiter_dependency), Depends(get_current_user)])
+@admission_controlled(_render_priority)
+@idempotent
 async def generate_preview(request: FrontPageRequest):
     """Genera una previsualización temporal"""
     try:
-        rendered = get_cached_render(request.template.value, request.model_dump())
+        context = await attach_hero_image(request.model_dump(mode="json"))
+        rendered = get_cached_render(request.template.value, context)
         if not rendered:
             raise ServerError()
         
         token = secrets.token_urlsafe(16)
-        preview_storage[token] = PreviewData(**rendered)
+        preview_storage[token] = PreviewData(
+            rendered["html"], rendered["css"], request.template.value, rendered.get("template_version")
+        )
         
         return {"preview_url": f"/preview/{token}"}
     except ValidationError as e:
@@ -115,7 +169,48 @@ async def generate_preview(request: FrontPageRequest):
     except ServerError as e:
         raise HTTPException(status_code=e.code, detail=str(e))
 
+def _check_templates(requests):
+    """Comprueba los templates antes de empezar a enviar el ZIP"""
+    for name in {request.template.value for request in requests}:
+        try:
+            get_template(name)
+        except Exception:
+            raise HTTPException(status_code=400, detail=f"Template {name} is not available")
+
+def _zip_response(chunks, filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        chunks,
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/export", dependencies=[Depends(rate_limiter_dependency), Depends(get_current_user)])
+@admission_controlled()
+async def export_frontpage(request: FrontPageRequest):
+    """Exporta la página como ZIP con index.html, CSS y recursos"""
+    _check_templates([request])
+    context = await attach_hero_image(request.model_dump(mode="json"))
+    rendered = render_page(request.template.value, context)
+    return _zip_response(stream_site(rendered), "frontpage.zip")
+
+@router.post("/export/bulk", dependencies=[Depends(rate_limiter_dependency), Depends(get_current_user)])
+@admission_controlled()
+async def export_frontpages(request: BulkExportRequest):
+    """Exporta varias páginas en un único ZIP, generado a medida que se envía"""
+    _check_templates(request.pages)
+    pages = ((page.template.value, page.model_dump(mode="json")) for page in request.pages)
+    return _zip_response(stream_sites(pages), "frontpages.zip")
+
+@router.get("/images/{digest}/{filename}")
+async def get_image(digest: str, filename: str):
+    """Sirve una versión de una imagen hero (pública: la cargan los navegadores de las páginas)"""
+    path = image_pipeline.path_for(digest, filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
 @router.get("/preview/{token}", dependencies=[Depends(rate_limiter_dependency), Depends(get_current_user)])
+@admission_controlled(Priority.HIGH)
 async def get_preview(token: str):
     """Obtiene una previsualización por su token"""
     cleanup_expired_previews()
@@ -145,6 +240,13 @@ async def list_templates():
     ]
     return templates
 
+@router.post("/templates/reload", dependencies=[Depends(rate_limiter_dependency), Depends(get_current_user)])
+async def reload_template_files():
+    """Recarga los templates modificados e invalida solo sus renderizados y previsualizaciones"""
+    result = reload_templates(await asyncio.to_thread(read_template_sources))
+    cleanup_expired_previews()
+    return result
+
 @router.get("/info", dependencies=[Depends(rate_limiter_dependency), Depends(get_current_user)])
 async def api_info():
     """Retorna información sobre la API"""
@@ -188,14 +290,20 @@ async def register_webhook(webhook: WebhookConfig):
 
 @router.get("/webhooks", dependencies=[Depends(rate_limiter_dependency), Depends(get_current_user)])
 async def list_webhooks():
-    """Lista todos los webhooks registrados"""
-    return [{"id": id, **webhook.model_dump()} for id, webhook in webhooks.items()]
+    """Lista todos los webhooks registrados con su estado de salud"""
+    return [
+        {"id": id, **webhook.model_dump(), "health": get_health(id).snapshot()}
+        for id, webhook in webhooks.items()
+    ]
 
 @router.put("/webhooks/{webhook_id}", dependencies=[Depends(rate_limiter_dependency), Depends(get_current_user)])
 async def update_webhook(webhook_id: str, webhook: WebhookConfig):
     """Actualiza un webhook existente"""
     if webhook_id not in webhooks:
         raise NotFoundError()
+    # Un endpoint distinto empieza con un historial de salud limpio
+    if str(webhooks[webhook_id].url) != str(webhook.url):
+        reset_health(webhook_id)
     webhooks[webhook_id] = webhook
     return {"id": webhook_id, **webhook.model_dump()}
 
@@ -205,4 +313,159 @@ async def delete_webhook(webhook_id: str):
     if webhook_id not in webhooks:
         raise NotFoundError()
     del webhooks[webhook_id]
+    reset_health(webhook_id)
+    await outbox.discard_webhook(webhook_id)
     return {"message": "Webhook deleted"}
+
+@router.get("/webhooks/dead-letters", dependencies=[Depends(rate_limiter_dependency), Depends(get_current_user)])
+async def list_dead_letters(limit: int = 100):
+    """Lista las entregas que agotaron sus reintentos"""
+    return await outbox.list_dead_letters(limit)
+
+@router.post("/webhooks/dead-letters/replay", dependencies=[Depends(rate_limiter_dependency), Depends(get_current_user)])
+async def replay_dead_letters():
+    """Devuelve todas las entregas fallidas al outbox para reintentarlas"""
+    return {"replayed": await outbox.replay_dead_letters()}
+
+@router.post("/webhooks/dead-letters/{dead_letter_id}/replay", dependencies=[Depends(rate_limiter_dependency), Depends(get_current_user)])
+async def replay_dead_letter(dead_letter_id: int):
+    """Devuelve una entrega fallida al outbox para reintentarla"""
+    if not await outbox.replay_dead_letters([dead_letter_id]):
+        raise NotFoundError()
+    return {"replayed": 1}
+
+@router.get("/profiles", dependencies=[Depends(rate_limiter_dependency)])
+async def list_profiles(user: dict = Depends(get_current_user)):
+    """Lista los perfiles de peticiones almacenados del usuario"""
+    return profile_store.list(token_subject(user))
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(rate_limiter_dependency)])
+async def download_profile(
+    profile_id: str,
+    format: Literal["pstats", "collapsed", "text"] = "pstats",
+    user: dict = Depends(get_current_user)
+):
+    """Descarga un perfil del usuario: pstats (binario), pilas colapsadas o resumen en texto"""
+    artifact = profile_store.get(profile_id)
+    if artifact is None or artifact.user != token_subject(user):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        return PlainTextResponse(artifact.to_collapsed())
+    if format == "text":
+        return PlainTextResponse(artifact.to_text())
+    return Response(
+        artifact.to_pstats(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.pstats"'}
+    )
+
+def _get_session(session_id: str, user: dict):
+    session = editor_sessions.get(session_id, user.get("sub"))
+    if session is None:
+        raise HTTPException(status_code=404, detail="Editor session not found")
+    return session
+
+def _session_preview_url(session) -> str:
+    """Token de previsualización único de la sesión, renovado en cada cambio"""
+    preview = preview_storage.get(session.preview_token)
+    if preview is None:
+        session.preview_token = secrets.token_urlsafe(16)
+        preview_storage[session.preview_token] = SessionPreview(session)
+    else:
+        preview.refresh()
+    return f"/preview/{session.preview_token}"
+
+async def _apply_changes(session, changes: dict) -> dict:
+    try:
+        request = merge_changes(session, changes)
+    except SchemaValidationError as e:
+        raise RequestValidationError(e.errors())
+    if request.template.value != session.template_name:
+        _check_templates([request])
+    result = await patch_session(session, request)
+    result["preview_url"] = _session_preview_url(session)
+    return result
+
+@router.post("/editor/sessions", dependencies=[Depends(rate_limiter_dependency)])
+@admission_controlled()
+async def create_editor_session(request: FrontPageRequest, user: dict = Depends(get_current_user)):
+    """Crea una sesión del editor y devuelve la página completa y sus fragmentos"""
+    _check_templates([request])
+    context = await attach_hero_image(request.model_dump(mode="json"))
+    session = editor_sessions.create(user.get("sub"), context)
+    return {**session.snapshot(), "preview_url": _session_preview_url(session)}
+
+@router.get("/editor/sessions/{session_id}", dependencies=[Depends(editor_rate_limiter_dependency)])
+async def get_editor_session(session_id: str, user: dict = Depends(get_current_user)):
+    """Estado completo de una sesión del editor"""
+    session = _get_session(session_id, user)
+    return {**session.snapshot(), "preview_url": _session_preview_url(session)}
+
+@router.patch("/editor/sessions/{session_id}", dependencies=[Depends(editor_rate_limiter_dependency)])
+async def patch_editor_session(
+    session_id: str,
+    changes: Dict[str, Any] = Body(...),
+    user: dict = Depends(get_current_user)
+):
+    """Aplica solo los campos cambiados y devuelve los fragmentos HTML/CSS afectados"""
+    return await _apply_changes(_get_session(session_id, user), changes)
+
+@router.delete("/editor/sessions/{session_id}", dependencies=[Depends(editor_rate_limiter_dependency)])
+async def delete_editor_session(session_id: str, user: dict = Depends(get_current_user)):
+    """Cierra una sesión del editor y su previsualización"""
+    session = _get_session(session_id, user)
+    editor_sessions.delete(session_id, user.get("sub"))
+    preview_storage.pop(session.preview_token, None)
+    return {"message": "Editor session deleted"}
+
+@router.websocket("/editor/sessions/{session_id}/live")
+async def live_editor_session(websocket: WebSocket, session_id: str, token: Optional[str] = None):
+    """Canal de edición en vivo.
+
+    Se autentica una vez al conectar (cabecera `Authorization` o `?token=`).
+    El cliente envía `{"changes": {...}}`; las ediciones seguidas se agrupan y
+    el servidor responde con un `update` por grupo, con los fragmentos
+    cambiados y la previsualización de la sesión actualizada.
+    """
+    authorization = websocket.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    with _auth_timer.time():
+        payload = decode_access_token(token) if token else None
+    session = editor_sessions.get(session_id, payload.get("sub")) if payload else None
+    if session is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    await websocket.send_json({"type": "ready", **session.snapshot(), "preview_url": _session_preview_url(session)})
+
+    async def receive():
+        # Los mensajes mal formados se rechazan sin perder las ediciones pendientes
+        while True:
+            message = await websocket.receive_json()
+            if isinstance(message, dict) and isinstance(message.get("changes"), dict):
+                return message
+            await websocket.send_json({"type": "error", "detail": 'Expected {"changes": {...}}'})
+
+    editor.connection_opened()
+    try:
+        while True:
+            changes = await editor.receive_edits(
+                receive, settings.EDITOR_DEBOUNCE_MS / 1000, settings.EDITOR_MAX_DELAY_MS / 1000
+            )
+            if editor_sessions.get(session_id, payload.get("sub")) is None:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+            try:
+                result = await _apply_changes(session, changes)
+            except RequestValidationError as e:
+                await websocket.send_json({"type": "error", "detail": jsonable_encoder(e.errors())})
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "detail": e.detail})
+            else:
+                await websocket.send_json({"type": "update", **result})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        editor.connection_closed()
@@ -0,0 +1,93 @@
+import random
+import time
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core.admission import admission_handler
+from app.core.auth import bearer_subject
+from app.core.config import settings
+from app.core.idempotency import idempotency_handler
+from app.core.metrics import histogram
+from app.services.profiling import RequestProfiler
+
+REQUEST_SECONDS = histogram(
+    "frontpage_http_request_duration_seconds",
+    "Duración de las peticiones a la API, incluidas dependencias y validación",
+    ("route", "method", "status")
+)
+
+PROFILE_HEADER = "x-profile"
+
+def _profile_requester(request: Request) -> Optional[str]:
+    """Usuario que pide perfilar la petición con la cabecera X-Profile, si su token es válido"""
+    if request.headers.get(PROFILE_HEADER) not in ("1", "true"):
+        return None
+    return bearer_subject(request.headers.get("authorization", ""))
+
+class InstrumentedRoute(APIRoute):
+    """Ruta que registra la duración total de cada petición por ruta y estado.
+
+    Los endpoints marcados con `admission_controlled` pasan por el control de
+    admisión antes de resolver sus dependencias, y los marcados con `idempotent`
+    devuelven la respuesta guardada a las peticiones repetidas con la misma
+    `Idempotency-Key`.
+
+    Si el perfilado está activado, una petición con `X-Profile: 1` y un token
+    válido (o una elegida por `PROFILE_SAMPLE_RATE`) se ejecuta bajo cProfile
+    y la respuesta incluye `X-Profile-Id` para descargar el resultado.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        route = self.path_format
+        priority = getattr(self.endpoint, "admission_priority", None)
+        if priority is not None:
+            handler = admission_handler(handler, priority)
+        if getattr(self.endpoint, "idempotent", False):
+            handler = idempotency_handler(handler)
+
+        async def instrumented_handler(request: Request) -> Response:
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            finally:
+                REQUEST_SECONDS.labels(route=route, method=request.method, status=status).observe(
+                    time.perf_counter() - start
+                )
+
+        if not settings.PROFILING_ENABLED:
+            return instrumented_handler
+
+        sample_rate = settings.PROFILE_SAMPLE_RATE
+
+        async def profiling_handler(request: Request) -> Response:
+            user = _profile_requester(request)
+            if user is None and sample_rate > 0 and random.random() < sample_rate:
+                # Solo se muestrean peticiones con token válido: cada perfil tiene dueño
+                user = bearer_subject(request.headers.get("authorization", ""))
+            if user is None:
+                return await instrumented_handler(request)
+
+            profiler = RequestProfiler.try_start()
+            if profiler is None:
+                return await instrumented_handler(request)
+            response = None
+            try:
+                response = await instrumented_handler(request)
+                return response
+            finally:
+                artifact = profiler.finish(route, request.method, user)
+                if response is not None:
+                    response.headers["X-Profile-Id"] = artifact.id
+
+        return profiling_handler
@@ -0,0 +1,290 @@
+"""Control de admisión para el trabajo de renderizado.
+
+Como mucho `max_concurrent` peticiones renderizan a la vez; el resto espera en
+una cola acotada. Las esperas se atienden por prioridad (aciertos de caché y
+previsualizaciones antes que los renderizados en frío) y, dentro de cada
+prioridad, por turnos entre usuarios (`sub` del JWT), de modo que un usuario
+con muchas peticiones no retrasa a los demás.
+
+Si la cola está llena o la espera estimada supera `latency_target`, la
+petición se rechaza de inmediato con 503 y `Retry-After` en lugar de esperar
+hasta que el cliente se rinda. Una petición que ya espera en la cola tampoco
+espera más de `queue_timeout`: también recibe 503.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Awaitable, Callable, Deque, Dict, Optional, Union
+
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.core.auth import bearer_subject
+from app.core.config import settings
+from app.core.metrics import counter, gauge, stage_timer
+
+class Priority(IntEnum):
+    HIGH = 0  # aciertos de caché y previsualizaciones
+    NORMAL = 1  # renderizados en frío
+
+PriorityFunction = Callable[[Request], Awaitable[Priority]]
+
+ADMISSION_REQUESTS = counter(
+    "frontpage_admission_requests_total", "Decisiones del control de admisión", ("result",)
+)
+_admitted = ADMISSION_REQUESTS.labels(result="admitted")
+_queued = ADMISSION_REQUESTS.labels(result="queued")
+_rejected = ADMISSION_REQUESTS.labels(result="rejected")
+_timed_out = ADMISSION_REQUESTS.labels(result="timeout")
+_wait_timer = stage_timer("admission_wait")
+
+# Peso de cada nueva observación en la media móvil del tiempo de servicio
+_SERVICE_TIME_WEIGHT = 0.1
+
+class Ticket:
+    """Plaza concedida; `release` es idempotente"""
+
+    def __init__(self, controller: "AdmissionController"):
+        self.controller = controller
+        self.started = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(time.perf_counter() - self.started)
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queue: int,
+        latency_target: float,
+        service_time: float = 0.05,
+        queue_timeout: Optional[float] = None
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.latency_target = latency_target
+        # Espera máxima en la cola; None = sin límite
+        self.queue_timeout = queue_timeout
+        # Media móvil del tiempo que se ocupa cada plaza, para estimar la espera
+        self.service_time = service_time
+        self.active = 0
+        self.queues: Dict[Priority, "OrderedDict[str, Deque[asyncio.Future]]"] = {
+            priority: OrderedDict() for priority in Priority
+        }
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for queue in self.queues.values() for waiters in queue.values())
+
+    def estimated_wait(self, user: str, priority: Priority) -> float:
+        """Espera estimada de una nueva petición según las que se atenderán antes"""
+        ahead = 0
+        for level, queue in self.queues.items():
+            if level < priority:
+                ahead += sum(len(waiters) for waiters in queue.values())
+            elif level == priority:
+                # Por turnos: de cada usuario se atienden como mucho tantas como tenga ya este usuario, más una
+                turn = len(queue.get(user, ())) + 1
+                ahead += sum(min(len(waiters), turn) for waiters in queue.values())
+        if self.active < self.max_concurrent and not ahead:
+            return 0.0
+        return (ahead // self.max_concurrent + 1) * self.service_time
+
+    def check(self, user: Optional[str], priority: Priority = Priority.NORMAL):
+        """503 con `Retry-After` si la petición tendría que esperar más que el objetivo"""
+        if self.active < self.max_concurrent and not self.queued:
+            return
+        wait = self.estimated_wait(user or "", priority)
+        if self.queued >= self.max_queue or wait > self.latency_target:
+            _rejected.inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, retry later",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))}
+            )
+
+    async def acquire(self, user: Optional[str], priority: Priority = Priority.NORMAL) -> Ticket:
+        user = user or ""
+        if self.active < self.max_concurrent and not self.queued:
+            self.active += 1
+            _admitted.inc()
+            ticket = Ticket(self)
+            # Cede el loop una vez: las peticiones que ya esperan en el event loop
+            # pasan por la admisión (y se encolan o se rechazan) antes de este renderizado
+            try:
+                await asyncio.sleep(0)
+            except asyncio.CancelledError:
+                ticket.release()
+                raise
+            return ticket
+
+        self.check(user, priority)
+        _queued.inc()
+        future = asyncio.get_running_loop().create_future()
+        queue = self.queues[priority]
+        queue.setdefault(user, deque()).append(future)
+        with _wait_timer.time():
+            try:
+                await asyncio.wait_for(future, self.queue_timeout)
+            except asyncio.TimeoutError:
+                # wait_for ya canceló el futuro: no se concede plaza
+                self._remove(priority, user, future)
+                _timed_out.inc()
+                raise HTTPException(
+                    status_code=503,
+                    detail="Server is busy, retry later",
+                    headers={"Retry-After": str(max(1, math.ceil(self.estimated_wait(user, priority))))}
+                )
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # La plaza ya se había concedido: se devuelve
+                    self._release(0.0, observe=False)
+                else:
+                    self._remove(priority, user, future)
+                raise
+        return Ticket(self)
+
+    @asynccontextmanager
+    async def slot(self, user: Optional[str], priority: Priority = Priority.NORMAL):
+        ticket = await self.acquire(user, priority)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def _remove(self, priority: Priority, user: str, future: asyncio.Future):
+        waiters = self.queues[priority].get(user)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self.queues[priority][user]
+
+    def _release(self, elapsed: float, observe: bool = True):
+        if observe:
+            self.service_time += _SERVICE_TIME_WEIGHT * (elapsed - self.service_time)
+        self.active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Concede las plazas libres: primero por prioridad, después por turnos entre usuarios"""
+        while self.active < self.max_concurrent:
+            future = self._next_waiter()
+            if future is None:
+                return
+            loop = future.get_loop()
+            if loop.is_closed():
+                continue
+            self.active += 1
+            if loop is _running_loop():
+                future.set_result(None)
+            else:
+                loop.call_soon_threadsafe(_grant, future, self)
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for queue in self.queues.values():
+            while queue:
+                user, waiters = next(iter(queue.items()))
+                future = waiters.popleft()
+                if waiters:
+                    queue.move_to_end(user)
+                else:
+                    del queue[user]
+                if not future.done():
+                    return future
+        return None
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+def _grant(future: asyncio.Future, controller: AdmissionController):
+    if future.done():
+        # Se canceló mientras se concedía: la plaza pasa al siguiente
+        controller._release(0.0, observe=False)
+    else:
+        future.set_result(None)
+
+admission = AdmissionController(
+    settings.ADMISSION_MAX_CONCURRENT,
+    settings.ADMISSION_MAX_QUEUE,
+    settings.ADMISSION_LATENCY_TARGET,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT
+)
+
+gauge("frontpage_admission_active", "Peticiones renderizando", function=lambda: admission.active)
+gauge("frontpage_admission_queued", "Peticiones esperando plaza", function=lambda: admission.queued)
+
+def admission_controlled(priority: Union[Priority, PriorityFunction] = Priority.NORMAL):
+    """Marca un endpoint para pasar por el control de admisión antes de resolver sus dependencias.
+
+    `priority` es fija o una corrutina que la calcula a partir de la petición
+    (por ejemplo, alta si el renderizado ya está en caché).
+    """
+    def decorator(endpoint):
+        endpoint.admission_priority = priority
+        return endpoint
+    return decorator
+
+def admission_handler(handler: Callable, priority: Union[Priority, PriorityFunction]) -> Callable:
+    """Envuelve el handler de una ruta con el control de admisión.
+
+    Se decide antes de las dependencias y la validación, así que rechazar una
+    petición cuesta poco. Las peticiones sin token válido no esperan plaza:
+    el handler las rechaza con 401. En las respuestas en streaming la plaza se
+    mantiene hasta terminar de enviar la respuesta, o hasta que el cliente se
+    desconecta.
+    """
+    async def admitted_handler(request: Request) -> Response:
+        if not settings.ADMISSION_ENABLED:
+            return await handler(request)
+        user = bearer_subject(request.headers.get("authorization", ""))
+        if user is None:
+            return await handler(request)
+        if isinstance(priority, Priority):
+            level = priority
+        else:
+            # Calcular la prioridad cuesta (lee y valida el cuerpo): antes se descarta
+            # lo que no entraría ni con prioridad alta
+            admission.check(user, Priority.HIGH)
+            level = await priority(request)
+
+        ticket = await admission.acquire(user, level)
+        try:
+            response = await handler(request)
+        except BaseException:
+            ticket.release()
+            raise
+        if isinstance(response, StreamingResponse):
+            return AdmittedStreamingResponse(response, ticket)
+        ticket.release()
+        return response
+
+    return admitted_handler
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """Respuesta en streaming que devuelve la plaza al terminar de enviarse.
+
+    La plaza se libera alrededor de la llamada ASGI y no dentro del generador
+    del cuerpo: si el cliente se desconecta antes de empezar el cuerpo,
+    Starlette cancela el envío sin llegar a ejecutar el generador.
+    """
+
+    def __init__(self, response: StreamingResponse, ticket: Ticket):
+        self.__dict__.update(response.__dict__)
+        self.ticket = ticket
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.ticket.release()
@@ -1,26 +1,40 @@
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-
 # Configuración
 SECRET_KEY = "your_secret_key_here"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# passlib y python-jose se importan en el primer uso para acelerar el arranque
+_pwd_context = None
+
+# Tokens ya verificados: un cliente envía el mismo token en cada petición y no
+# hace falta repetir la verificación de la firma hasta que caduque
+_verified_tokens: "OrderedDict[str, dict]" = OrderedDict()
+VERIFIED_TOKENS_MAX = 1024
+
+
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
 
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    from jose import jwt
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -32,8 +46,36 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 
 def decode_access_token(token: str):
+    payload = _verified_tokens.get(token)
+    if payload is not None:
+        if payload.get("exp", 0) > time.time():
+            _verified_tokens.move_to_end(token)
+            return dict(payload)
+        del _verified_tokens[token]
+
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
         return None
+    if "exp" in payload:
+        _verified_tokens[token] = dict(payload)
+        if len(_verified_tokens) > VERIFIED_TOKENS_MAX:
+            _verified_tokens.popitem(last=False)
+    return payload
+
+
+def token_subject(payload: dict) -> str:
+    """Usuario de un token ya verificado; "" si el token no tiene `sub`"""
+    return str(payload.get("sub", ""))
+
+
+def bearer_subject(authorization: str) -> Optional[str]:
+    """`sub` del token de una cabecera `Authorization: Bearer ...`, o None si no es válido"""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    payload = decode_access_token(token)
+    if payload is None:
+        return None
+    return token_subject(payload)
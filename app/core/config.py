@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -24,8 +26,72 @@ class Settings(BaseSettings):
 
     # Configuración de caché
     CACHE_TTL: int = 3600  # 1 hora en segundos
+
+    # Eliminación de reglas CSS que no se usan en la página generada. Opcional:
+    # duplica el coste de un renderizado en frío y en los templates incluidos
+    # ahorra pocos bytes; compensa con `customCss` grandes
+    CSS_PRUNING: bool = False
     PREVIEW_EXPIRY_HOURS: int = 24
 
+    # Imágenes hero
+    IMAGE_CACHE_DIR: str = "image_cache"
+    IMAGE_WIDTHS: List[int] = [480, 960, 1600]
+    IMAGE_QUALITY: int = 80
+    IMAGE_WORKERS: int = 2  # procesos para Pillow; 0 usa un hilo
+    IMAGE_MAX_BYTES: int = 15 * 1024 * 1024
+    IMAGE_FETCH_TIMEOUT: float = 10.0
+    IMAGE_FAILURE_TTL: int = 300  # segundos sin reintentar una URL que no se pudo descargar o procesar
+    IMAGE_PREFETCH_CONCURRENCY: int = 4  # descargas en segundo plano simultáneas
+    IMAGE_INDEX_MAX_ENTRIES: int = 10000  # URLs, manifiestos y fallos recordados en memoria
+
+    # Control de admisión del renderizado
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENT: int = 4
+    ADMISSION_MAX_QUEUE: int = 64
+    ADMISSION_LATENCY_TARGET: float = 2.0  # segundos de espera estimada a partir de los que se responde 503
+    ADMISSION_QUEUE_TIMEOUT: float = 10.0  # segundos máximos en la cola antes de responder 503
+
+    # Claves de idempotencia (cabecera Idempotency-Key) de las peticiones de generación
+    IDEMPOTENCY_TTL: int = 3600  # segundos; menos que la caducidad de las previsualizaciones
+    IDEMPOTENCY_MAX_KEYS: int = 1000
+    IDEMPOTENCY_WAIT_TIMEOUT: float = 30.0  # espera máxima de un duplicado a la petición original
+
+    # Recarga de templates: cada cuántos segundos se comprueban (0 = solo con POST /api/templates/reload)
+    TEMPLATE_RELOAD_INTERVAL: float = 0.0
+
+    # Sesiones del editor
+    EDITOR_SESSION_TTL: int = 1800  # segundos sin actividad
+    EDITOR_MAX_SESSIONS: int = 1000
+    EDITOR_MAX_SESSIONS_PER_USER: int = 10
+    EDITOR_DEBOUNCE_MS: int = 50  # espera de nuevas ediciones antes de renderizar
+    EDITOR_MAX_DELAY_MS: int = 250  # máximo retraso de una edición con escritura continua
+
+    # Exportación
+    EXPORT_MAX_PAGES: int = 100  # páginas por exportación masiva
+
+    # Configuración de webhooks
+    WEBHOOK_OUTBOX_PATH: str = "webhook_outbox.db"
+    WEBHOOK_TIMEOUT: float = 10.0
+    WEBHOOK_MAX_ATTEMPTS: int = 5
+    WEBHOOK_BACKOFF_BASE: float = 1.0  # segundos
+    WEBHOOK_BACKOFF_MAX: float = 300.0
+    WEBHOOK_RETRY_INTERVAL: float = 1.0  # frecuencia del planificador de reintentos
+    WEBHOOK_RETRY_BATCH: int = 200
+    OUTBOX_MAX_BATCH: int = 500  # operaciones por transacción en el outbox
+    WEBHOOK_BREAKER_THRESHOLD: int = 5  # fallos consecutivos para abrir el circuito
+    WEBHOOK_BREAKER_RESET: float = 30.0  # segundos hasta la primera prueba
+    WEBHOOK_BREAKER_MAX_RESET: float = 600.0
+    WEBHOOK_MIN_TIMEOUT: float = 1.0
+
+    # Observabilidad
+    METRICS_ENABLED: bool = True
+    LOOP_LAG_INTERVAL: float = 0.5  # segundos entre mediciones del event loop
+
+    # Perfilado de peticiones (cabecera X-Profile con un token válido o muestreo)
+    PROFILING_ENABLED: bool = True
+    PROFILE_SAMPLE_RATE: float = 0.0  # fracción de peticiones perfiladas sin cabecera
+    PROFILE_MAX_STORED: int = 50
+
     # Configuración de seguridad
     MAX_CSS_LENGTH: int = 10000  # Máximo número de caracteres en el CSS personalizado
 
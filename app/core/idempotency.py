@@ -0,0 +1,197 @@
+"""Claves de idempotencia para las peticiones de generación.
+
+Un cliente que reintenta una petición con la misma cabecera `Idempotency-Key`
+recibe la respuesta original (con la misma URL de previsualización) sin volver
+a renderizar ni a notificar a los webhooks. Si la primera petición sigue en
+curso, los duplicados esperan a que termine en lugar de ejecutarse a la vez.
+
+Las claves son por usuario (`sub` del JWT) y se guardan `IDEMPOTENCY_TTL`
+segundos, como mucho `IDEMPOTENCY_MAX_KEYS`; al llenarse se descartan las
+más antiguas ya terminadas, nunca las que siguen en curso (si todas lo están, la
+nueva petición recibe 503). Solo se guardan las respuestas 2xx: si la petición
+falla, la clave se libera y el reintento se ejecuta.
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+from app.core.auth import bearer_subject
+from app.core.config import settings
+from app.core.metrics import counter, gauge
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+MAX_KEY_LENGTH = 255
+
+IDEMPOTENCY_REQUESTS = counter(
+    "frontpage_idempotency_requests_total", "Peticiones con Idempotency-Key", ("result",)
+)
+_executed = IDEMPOTENCY_REQUESTS.labels(result="executed")
+_replayed = IDEMPOTENCY_REQUESTS.labels(result="replayed")
+_mismatched = IDEMPOTENCY_REQUESTS.labels(result="mismatch")
+
+class StoredResponse(NamedTuple):
+    status_code: int
+    body: bytes
+    raw_headers: List[Tuple[bytes, bytes]]
+
+class IdempotencyEntry:
+    """Petición con una clave: en curso hasta `finish`, después con su respuesta (o sin ella si falló)"""
+
+    def __init__(self, fingerprint: str, expires: float):
+        self.fingerprint = fingerprint
+        self.expires = expires
+        self.done = False
+        self.response: Optional[StoredResponse] = None
+        self.waiters: List[asyncio.Future] = []
+
+    def finish(self, response: Optional[StoredResponse]):
+        self.done = True
+        self.response = response
+        waiters, self.waiters = self.waiters, []
+        for future in waiters:
+            _wake(future)
+
+class IdempotencyStore:
+    def __init__(self, ttl: int, max_keys: int):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        # Por orden de creación, que es también el de caducidad
+        self.entries: "OrderedDict[Tuple[str, str], IdempotencyEntry]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _purge(self):
+        now = time.monotonic()
+        while self.entries and next(iter(self.entries.values())).expires <= now:
+            self.entries.popitem(last=False)
+
+    def begin(self, key: Tuple[str, str], fingerprint: str) -> Tuple[IdempotencyEntry, bool]:
+        """Entrada de la clave y si esta petición es la primera (y debe ejecutarse)"""
+        self._purge()
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                _mismatched.inc()
+                raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
+            return entry, False
+        if len(self.entries) >= self.max_keys and not self._evict_completed():
+            # Descartar una clave en curso dejaría ejecutar su duplicado a la vez
+            raise HTTPException(
+                status_code=503,
+                detail="Too many requests in progress, retry later",
+                headers={"Retry-After": "1"}
+            )
+        entry = IdempotencyEntry(fingerprint, time.monotonic() + self.ttl)
+        self.entries[key] = entry
+        return entry, True
+
+    def _evict_completed(self) -> bool:
+        """Descarta la entrada terminada más antigua; False si todas siguen en curso"""
+        for key, entry in self.entries.items():
+            if entry.done:
+                del self.entries[key]
+                return True
+        return False
+
+    def complete(self, key: Tuple[str, str], entry: IdempotencyEntry, response: Optional[StoredResponse]):
+        """Guarda la respuesta y despierta a los duplicados; sin respuesta se libera la clave"""
+        if response is None and self.entries.get(key) is entry:
+            del self.entries[key]
+        entry.finish(response)
+
+    async def wait(self, entry: IdempotencyEntry, timeout: float):
+        """Espera a que termine la petición original; 409 si tarda más de `timeout`"""
+        if entry.done:
+            return
+        future = asyncio.get_running_loop().create_future()
+        entry.waiters.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        finally:
+            if future in entry.waiters:
+                entry.waiters.remove(future)
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+def _set_done(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+def _wake(future: asyncio.Future):
+    loop = future.get_loop()
+    if future.done() or loop.is_closed():
+        return
+    if loop is _running_loop():
+        future.set_result(None)
+    else:
+        loop.call_soon_threadsafe(_set_done, future)
+
+idempotency_keys = IdempotencyStore(settings.IDEMPOTENCY_TTL, settings.IDEMPOTENCY_MAX_KEYS)
+
+gauge("frontpage_idempotency_keys", "Claves de idempotencia guardadas", function=lambda: len(idempotency_keys))
+
+def idempotent(endpoint):
+    """Marca un endpoint para aceptar la cabecera `Idempotency-Key`"""
+    endpoint.idempotent = True
+    return endpoint
+
+def _replay(stored: StoredResponse) -> Response:
+    response = Response(content=stored.body, status_code=stored.status_code)
+    response.raw_headers = stored.raw_headers + [(REPLAYED_HEADER, b"true")]
+    return response
+
+def idempotency_handler(handler: Callable) -> Callable:
+    """Envuelve el handler de una ruta con las claves de idempotencia.
+
+    Va por fuera del control de admisión: los duplicados no ocupan plaza
+    mientras esperan ni al repetir la respuesta guardada.
+    """
+    async def idempotent_handler(request: Request) -> Response:
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return await handler(request)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key must have 1 to {MAX_KEY_LENGTH} characters")
+        user = bearer_subject(request.headers.get("authorization", ""))
+        if user is None:
+            # El handler responderá 401
+            return await handler(request)
+
+        body = await request.body()
+        fingerprint = hashlib.sha256(f"{request.method} {request.url.path}\n".encode() + body).hexdigest()
+        scoped_key = (user, key)
+        while True:
+            entry, first = idempotency_keys.begin(scoped_key, fingerprint)
+            if first:
+                break
+            await idempotency_keys.wait(entry, settings.IDEMPOTENCY_WAIT_TIMEOUT)
+            if entry.response is not None:
+                _replayed.inc()
+                return _replay(entry.response)
+            # La petición original falló: esta se ejecuta (o espera a otro reintento)
+
+        _executed.inc()
+        stored = None
+        try:
+            response = await handler(request)
+            if 200 <= response.status_code < 300 and not isinstance(response, StreamingResponse):
+                stored = StoredResponse(response.status_code, bytes(response.body), list(response.raw_headers))
+            return response
+        finally:
+            idempotency_keys.complete(scoped_key, entry, stored)
+
+    return idempotent_handler
@@ -1,11 +1,18 @@
 import json
 import time
+from typing import Optional
+
 from fastapi import Request, HTTPException
 
+from app.core.metrics import stage_timer
+
 RATE_LIMIT = 100  # requests per hour
+EDITOR_RATE_LIMIT = 3600  # editor requests per hour: one PATCH per edit
 RATE_LIMIT_FILE = "rate_limit.json"
 BLOCK_DURATION = 3600  # 1 hour in seconds
 
+_rate_limit_timer = stage_timer("rate_limit")
+
 
 def load_rate_limit_data():
     try:
@@ -20,7 +27,9 @@ def save_rate_limit_data(data):
         json.dump(data, file)
 
 
-def check_rate_limit(ip: str):
+def check_rate_limit(ip: str, limit: Optional[int] = None):
+    if limit is None:
+        limit = RATE_LIMIT
     data = load_rate_limit_data()
     current_time = time.time()
     if ip in data and 'blocked_until' in data[ip]:
@@ -34,7 +43,7 @@ def check_rate_limit(ip: str):
     else:
         elapsed_time = current_time - data[ip]['last_request']
         if elapsed_time < 3600:
-            if data[ip]['count'] >= RATE_LIMIT:
+            if data[ip]['count'] >= limit:
                 data[ip]['blocked_until'] = current_time + BLOCK_DURATION
                 save_rate_limit_data(data)
                 raise HTTPException(status_code=429, detail="Rate limit exceeded. IP blocked.")
@@ -47,4 +56,12 @@ def check_rate_limit(ip: str):
 
 async def rate_limiter_dependency(request: Request):
     client_ip = request.client.host
-    check_rate_limit(client_ip)
+    with _rate_limit_timer.time():
+        check_rate_limit(client_ip)
+
+
+async def editor_rate_limiter_dependency(request: Request):
+    # Presupuesto aparte: editar no consume ni bloquea el del resto de la API
+    client_ip = request.client.host
+    with _rate_limit_timer.time():
+        check_rate_limit(f"editor:{client_ip}", EDITOR_RATE_LIMIT)
@@ -1,13 +1,16 @@
-from fastapi import FastAPI, Request
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
-import aioredis
+from fastapi import FastAPI
 
 
 async def init_rate_limiter(app: FastAPI):
+    # Dependencias opcionales: solo se cargan si se usa el limitador con Redis
+    import aioredis
+    from fastapi_limiter import FastAPILimiter
+
     redis = await aioredis.from_url("redis://localhost")
     await FastAPILimiter.init(redis)
 
 
 async def rate_limiter_dependency():
+    from fastapi_limiter.depends import RateLimiter
+
     return RateLimiter(times=100, seconds=3600)  # 100 requests per hour
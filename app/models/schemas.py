@@ -1,7 +1,13 @@
 from enum import Enum
-from typing import Optional
-from pydantic import BaseModel, field_validator, HttpUrl
+from typing import List, Optional
+from pydantic import BaseModel, field_validator, model_validator, HttpUrl
 import re
+import time
+
+from app.core.config import settings
+from app.core.metrics import stage_timer
+
+_validation_timer = stage_timer("validation")
 
 class TemplateType(str, Enum):
     minimal = "minimal"
@@ -60,16 +66,64 @@ class FrontPageRequest(BaseModel):
             raise ValueError('Custom CSS must be less than 1000 characters')
         return v
 
+    @model_validator(mode='wrap')
+    def measure_validation(cls, values, handler):
+        start = time.perf_counter()
+        try:
+            return handler(values)
+        finally:
+            _validation_timer.observe(time.perf_counter() - start)
+
+class BulkExportRequest(BaseModel):
+    pages: List[FrontPageRequest]
+
+    @field_validator('pages')
+    def validate_pages(cls, v):
+        if not 0 < len(v) <= settings.EXPORT_MAX_PAGES:
+            raise ValueError(f'Between 1 and {settings.EXPORT_MAX_PAGES} pages can be exported at once')
+        return v
+
 class FrontPageResponse(BaseModel):
     html: str
     css: str
     preview_url: str
+    # Bytes de CSS eliminados por la poda de reglas sin uso
+    css_stats: Optional[dict] = None
+
+EVENT_STATUSES = ("success", "error")
 
 class WebhookConfig(BaseModel):
     url: HttpUrl
     secret: Optional[str] = None
     description: Optional[str] = None
     active: bool = True
+    # Entrega por lotes: si batch_max_events está definido, los eventos se
+    # acumulan y se envían como un array al alcanzar cualquiera de los límites
+    batch_max_events: Optional[int] = None
+    batch_max_bytes: int = 256 * 1024
+    batch_linger_ms: int = 1000
+    # Filtros de suscripción: None recibe todos los eventos
+    templates: Optional[List[TemplateType]] = None
+    statuses: Optional[List[str]] = None
+    sample_rate: float = 1.0
+
+    @field_validator('batch_max_events', 'batch_max_bytes', 'batch_linger_ms')
+    def validate_batch_limits(cls, v):
+        if v is not None and v < 1:
+            raise ValueError('Batch limits must be positive')
+        return v
+
+    @field_validator('statuses')
+    def validate_statuses(cls, v):
+        if v is not None and not set(v) <= set(EVENT_STATUSES):
+            raise ValueError(f'Statuses must be any of: {", ".join(EVENT_STATUSES)}')
+        return v
+
+    @field_validator('sample_rate')
+    def validate_sample_rate(cls, v):
+        if not 0 < v <= 1:
+            raise ValueError('Sample rate must be greater than 0 and at most 1')
+        return v
 
 class GenerationEvent(BaseModel):
     event_id: str
@@ -0,0 +1,171 @@
+import time
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import gauge
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class EndpointHealth:
+    """Salud de un endpoint de webhook: circuit breaker y latencia observada.
+
+    El circuito se abre tras `failure_threshold` fallos consecutivos. Pasado
+    el tiempo de apertura se permite una única petición de prueba (half-open):
+    si tiene éxito el circuito se cierra, si falla se vuelve a abrir durante el
+    doble de tiempo, hasta `max_reset_timeout`.
+
+    El timeout de cada envío se adapta a la latencia observada con el mismo
+    estimador que TCP usa para el RTO (media y desviación suavizadas).
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        max_reset_timeout: float = 600.0,
+        min_timeout: float = 1.0,
+        max_timeout: float = 10.0
+    ):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.latency_avg: Optional[float] = None
+        self.latency_dev = 0.0
+        self.last_error: Optional[str] = None
+        self.last_success_at: Optional[float] = None
+        self.last_failure_at: Optional[float] = None
+
+    @property
+    def timeout(self) -> float:
+        """Timeout adaptativo para el siguiente envío"""
+        if self.latency_avg is None:
+            return self.max_timeout
+        estimate = self.latency_avg + 4 * self.latency_dev
+        return min(self.max_timeout, max(self.min_timeout, estimate))
+
+    def allow_request(self, now: Optional[float] = None) -> bool:
+        """Indica si se puede intentar un envío ahora"""
+        now = now if now is not None else time.time()
+        if self.state == CLOSED:
+            return True
+
+        if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self.probe_in_flight = False
+
+        if self.state == HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+
+        self.rejected += 1
+        return False
+
+    def retry_after(self, now: Optional[float] = None) -> float:
+        """Segundos hasta que el circuito admita una petición de prueba"""
+        now = now if now is not None else time.time()
+        if self.state == CLOSED:
+            return 0.0
+        if self.state == HALF_OPEN:
+            return self.min_timeout
+        return max(0.0, self.opened_at + self.reset_timeout - now)
+
+    def release_probe(self):
+        """Libera la prueba en curso sin resultado (envío cancelado): la siguiente entrega será la prueba"""
+        if self.state == HALF_OPEN:
+            self.probe_in_flight = False
+
+    def record_success(self, latency: float):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.last_success_at = time.time()
+        self._observe_latency(latency)
+
+        if self.state != CLOSED:
+            self.state = CLOSED
+            self.opened_at = None
+            self.probe_in_flight = False
+            self.reset_timeout = self.base_reset_timeout
+
+    def record_failure(self, error: str, latency: Optional[float] = None):
+        now = time.time()
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        self.last_failure_at = now
+        if latency is not None:
+            self._observe_latency(latency)
+
+        if self.state == HALF_OPEN:
+            # La prueba falló: reabrir con una espera mayor
+            self.reset_timeout = min(self.max_reset_timeout, self.reset_timeout * 2)
+            self._open(now)
+        elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._open(now)
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self.opened_at = now
+        self.probe_in_flight = False
+
+    def _observe_latency(self, latency: float):
+        if self.latency_avg is None:
+            self.latency_avg = latency
+            self.latency_dev = latency / 2
+        else:
+            self.latency_dev = 0.75 * self.latency_dev + 0.25 * abs(self.latency_avg - latency)
+            self.latency_avg = 0.875 * self.latency_avg + 0.125 * latency
+
+    def snapshot(self) -> dict:
+        """Estado y estadísticas para los listados de la API"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "latency_avg_ms": round(self.latency_avg * 1000, 1) if self.latency_avg is not None else None,
+            "timeout_s": round(self.timeout, 3),
+            "retry_after_s": round(self.retry_after(), 1),
+            "last_error": self.last_error,
+            "last_success_at": self.last_success_at,
+            "last_failure_at": self.last_failure_at,
+        }
+
+# Salud por webhook
+endpoint_health: Dict[str, EndpointHealth] = {}
+
+gauge(
+    "frontpage_webhook_circuits_open",
+    "Webhooks con el circuito abierto o en prueba",
+    function=lambda: sum(1 for health in endpoint_health.values() if health.state != CLOSED)
+)
+
+def get_health(webhook_id: str) -> EndpointHealth:
+    health = endpoint_health.get(webhook_id)
+    if health is None:
+        health = EndpointHealth(
+            failure_threshold=settings.WEBHOOK_BREAKER_THRESHOLD,
+            reset_timeout=settings.WEBHOOK_BREAKER_RESET,
+            max_reset_timeout=settings.WEBHOOK_BREAKER_MAX_RESET,
+            min_timeout=settings.WEBHOOK_MIN_TIMEOUT,
+            max_timeout=settings.WEBHOOK_TIMEOUT
+        )
+        endpoint_health[webhook_id] = health
+    return health
+
+def reset_health(webhook_id: str):
+    endpoint_health.pop(webhook_id, None)
@@ -0,0 +1,205 @@
+"""Eliminación de reglas CSS que no pueden aplicarse a una página.
+
+Se extraen del HTML renderizado las etiquetas, clases e ids usados y se
+descartan los selectores que exigen alguno que no aparece. La comprobación es
+conservadora: pseudo-clases, selectores de atributo y combinadores se ignoran,
+de modo que un selector solo se elimina si es seguro que no coincide con
+ningún elemento. Las reglas @media/@supports se podan por dentro; el resto de
+reglas @ (@font-face, @keyframes, @import...) se conservan tal cual.
+"""
+import re
+from typing import FrozenSet, List, NamedTuple, Optional, Tuple
+
+_TAG = re.compile(r"<([a-zA-Z][a-zA-Z0-9-]*)([^>]*)>")
+_ATTRIBUTE = re.compile(r"""\b(class|id)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.IGNORECASE)
+
+# Componentes de un selector compuesto
+_PSEUDO = re.compile(r"::?[a-zA-Z-]+(\((?:[^()]|\([^()]*\))*\))?")
+_ATTRIBUTE_SELECTOR = re.compile(r"\[[^\]]*\]")
+_COMBINATOR = re.compile(r"\s*[>+~]\s*|\s+")
+_SIMPLE = re.compile(r"([.#]?)(-?[_a-zA-Z][_a-zA-Z0-9-]*|\*)")
+
+# Bloques cuyo contenido son reglas que también se pueden podar
+_NESTED_AT_RULES = ("@media", "@supports", "@layer", "@container")
+
+class PageFeatures(NamedTuple):
+    tags: FrozenSet[str]
+    classes: FrozenSet[str]
+    ids: FrozenSet[str]
+
+class PruneStats(NamedTuple):
+    original_bytes: int
+    pruned_bytes: int
+    removed_rules: int
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_bytes - self.pruned_bytes
+
+    def to_dict(self) -> dict:
+        return {
+            "original_bytes": self.original_bytes,
+            "pruned_bytes": self.pruned_bytes,
+            "saved_bytes": self.saved_bytes,
+            "removed_rules": self.removed_rules,
+        }
+
+def extract_features(html: str) -> PageFeatures:
+    """Etiquetas, clases e ids presentes en el HTML"""
+    tags, classes, ids = set(), set(), set()
+    for tag in _TAG.finditer(html):
+        tags.add(tag.group(1).lower())
+        for attribute in _ATTRIBUTE.finditer(tag.group(2)):
+            value = attribute.group(2) or attribute.group(3) or attribute.group(4) or ""
+            if attribute.group(1).lower() == "class":
+                classes.update(value.split())
+            else:
+                ids.add(value.strip())
+    return PageFeatures(frozenset(tags), frozenset(classes), frozenset(ids))
+
+def selector_may_match(selector: str, features: PageFeatures) -> bool:
+    """False solo si el selector no puede coincidir con ningún elemento de la página"""
+    if "\\" in selector or "&" in selector:
+        # Escapes o anidamiento: no se analizan
+        return True
+    simplified = _ATTRIBUTE_SELECTOR.sub("", _PSEUDO.sub("", selector))
+    for compound in _COMBINATOR.split(simplified.strip()):
+        position = 0
+        while position < len(compound):
+            match = _SIMPLE.match(compound, position)
+            if match is None:
+                return True
+            prefix, name = match.groups()
+            if prefix == "." and name not in features.classes:
+                return False
+            if prefix == "#" and name not in features.ids:
+                return False
+            if not prefix and name != "*" and name.lower() not in features.tags:
+                return False
+            position = match.end()
+    return True
+
+def _strip_comments(css: str) -> Optional[str]:
+    """CSS sin comentarios (respetando las cadenas); None si hay un comentario sin cerrar"""
+    if "/*" not in css:
+        return css
+    output = []
+    start = 0
+    i = 0
+    length = len(css)
+    while i < length:
+        char = css[i]
+        if char in "\"'":
+            end = i + 1
+            while end < length and css[end] != char:
+                end += 2 if css[end] == "\\" else 1
+            i = end + 1
+        elif css.startswith("/*", i):
+            end = css.find("*/", i + 2)
+            if end == -1:
+                return None
+            output.append(css[start:i])
+            start = i = end + 2
+        else:
+            i += 1
+    output.append(css[start:])
+    return "".join(output)
+
+def _split_blocks(css: str) -> Optional[List[Tuple[str, Optional[str]]]]:
+    """Divide el CSS sin comentarios en (preludio, cuerpo) de primer nivel.
+
+    El cuerpo es None en sentencias como `@import ...;`. Devuelve None si las
+    llaves no están equilibradas.
+    """
+    blocks = []
+    depth = 0
+    start = 0
+    body_start = 0
+    prelude = ""
+    i = 0
+    length = len(css)
+    while i < length:
+        char = css[i]
+        if char in "\"'":
+            end = i + 1
+            while end < length and css[end] != char:
+                end += 2 if css[end] == "\\" else 1
+            i = end + 1
+            continue
+        if char == "{":
+            if depth == 0:
+                prelude = css[start:i]
+                body_start = i + 1
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth < 0:
+                return None
+            if depth == 0:
+                blocks.append((prelude.strip(), css[body_start:i]))
+                start = i + 1
+        elif char == ";" and depth == 0:
+            blocks.append((css[start:i + 1].strip(), None))
+            start = i + 1
+        i += 1
+    if depth != 0:
+        return None
+    if css[start:].strip():
+        blocks.append((css[start:].strip(), None))
+    return blocks
+
+def _split_selectors(prelude: str) -> List[str]:
+    """Lista de selectores, sin partir en las comas de :is(...) o [attr="a,b"]"""
+    selectors = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(prelude):
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == "," and depth == 0:
+            selectors.append(prelude[start:i].strip())
+            start = i + 1
+    selectors.append(prelude[start:].strip())
+    return [selector for selector in selectors if selector]
+
+def _prune(css: str, features: PageFeatures) -> Tuple[str, int]:
+    blocks = _split_blocks(css)
+    if blocks is None:
+        return css, 0
+
+    output = []
+    removed = 0
+    for prelude, body in blocks:
+        if body is None:
+            output.append(prelude)
+            continue
+        if prelude.startswith("@"):
+            if prelude.lower().startswith(_NESTED_AT_RULES):
+                inner, inner_removed = _prune(body, features)
+                removed += inner_removed
+                if inner.strip():
+                    output.append(f"{prelude} {{\n{inner}\n}}")
+            else:
+                output.append(f"{prelude} {{{body}}}")
+            continue
+        selectors = _split_selectors(prelude)
+        kept = [s for s in selectors if selector_may_match(s, features)]
+        if kept:
+            output.append(f"{', '.join(kept)} {{{body}}}")
+        else:
+            removed += 1
+    return "\n".join(output), removed
+
+def prune_css(css: str, html: str) -> Tuple[str, PruneStats]:
+    """CSS sin las reglas que no pueden aplicarse al HTML, y los bytes ahorrados"""
+    return prune_css_for(css, extract_features(html))
+
+def prune_css_for(css: str, features: PageFeatures) -> Tuple[str, PruneStats]:
+    stripped = _strip_comments(css)
+    pruned, removed = _prune(stripped, features) if stripped is not None else (css, 0)
+    if not removed:
+        # Sin cambios: se conserva el CSS original (formato incluido)
+        pruned = css
+    return pruned, PruneStats(len(css.encode()), len(pruned.encode()), removed)
@@ -0,0 +1,329 @@
+"""Sesiones del editor con renderizado incremental.
+
+Una sesión guarda el contexto de la página y cada bloque Jinja ya renderizado:
+los bloques del template de página (`title`, `header`, `hero`, `main`...) y los
+del template de estilos (`variables`, `base`, `custom`). Las dependencias de
+cada bloque se obtienen del AST del template, así que un cambio en `title`
+solo vuelve a renderizar los bloques que usan `title`, y un cambio de color
+solo el bloque de variables CSS.
+
+El CSS de la sesión se poda con las etiquetas, clases e ids acumulados de la
+página (el conjunto solo crece, de modo que la poda es conservadora) y se
+minifica por bloques.
+"""
+import asyncio
+import secrets
+import time
+from datetime import datetime
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import counter, gauge, stage_timer
+from app.services import renderer
+from app.services.css_pruner import PageFeatures, extract_features
+from app.services.images import attach_hero_image
+
+# Variables del template calculadas a partir de campos de la petición
+DERIVED_FIELDS = {"hero": frozenset({"heroImage"})}
+
+# Bloque del template de página con el CSS: en las sesiones se envía por bloques
+STYLE_BLOCK = "style"
+
+_patch_timer = stage_timer("editor_patch")
+EDITOR_EDITS = counter(
+    "frontpage_editor_edits_total", "Ediciones recibidas por WebSocket", ("result",)
+)
+_edits_applied = EDITOR_EDITS.labels(result="applied")
+_edits_coalesced = EDITOR_EDITS.labels(result="coalesced")
+_live_connections = 0
+gauge("frontpage_editor_live_connections", "Conexiones WebSocket del editor", function=lambda: _live_connections)
+
+def block_dependencies(source: str) -> Dict[str, FrozenSet[str]]:
+    """Campos del contexto usados por cada bloque del template"""
+    from jinja2 import nodes
+
+    dependencies = {}
+    for block in renderer.get_env().parse(source).find_all(nodes.Block):
+        names = set()
+        for node in block.find_all(nodes.Name):
+            if node.ctx == "load":
+                names |= DERIVED_FIELDS.get(node.name, {node.name})
+        dependencies[block.name] = frozenset(names)
+    return dependencies
+
+class TemplateLayout:
+    """Templates de página y estilos de un tipo de página, con sus bloques"""
+
+    def __init__(self, template_set: renderer.TemplateSet):
+        self.page = template_set.page
+        self.styles = template_set.styles
+        self.version = template_set.version
+        self.page_blocks = {
+            name: deps for name, deps in block_dependencies(template_set.page_source).items() if name != STYLE_BLOCK
+        }
+        self.css_blocks = block_dependencies(template_set.styles_source)
+
+    @staticmethod
+    def render_block(template, name: str, context: dict) -> str:
+        return "".join(template.blocks[name](template.new_context(context)))
+
+_layouts: Dict[str, TemplateLayout] = {}
+
+def get_layout(template_name: str) -> TemplateLayout:
+    """Bloques del template, recalculados si el template se ha recargado"""
+    template_set = renderer.get_template_set(template_name)
+    layout = _layouts.get(template_name)
+    if layout is None or layout.version != template_set.version:
+        layout = _layouts[template_name] = TemplateLayout(template_set)
+    return layout
+
+def _empty_features() -> PageFeatures:
+    return PageFeatures(frozenset(), frozenset(), frozenset())
+
+def _merge_features(a: PageFeatures, b: PageFeatures) -> PageFeatures:
+    return PageFeatures(a.tags | b.tags, a.classes | b.classes, a.ids | b.ids)
+
+class EditorSession:
+    def __init__(self, session_id: str, user: Optional[str], context: dict):
+        self.id = session_id
+        self.user = user
+        self.context = context
+        self.version = 0
+        self.touched = time.monotonic()
+        self.html_fragments: Dict[str, str] = {}
+        self.css_sources: Dict[str, str] = {}
+        self.css_fragments: Dict[str, str] = {}
+        self.features = _empty_features()
+        self.preview_token: Optional[str] = None
+        self.template_version: Optional[str] = None
+        self.render_all()
+
+    @property
+    def template_name(self) -> str:
+        return self.context["template"]
+
+    @property
+    def css(self) -> str:
+        return "".join(self.css_fragments.values())
+
+    def render_all(self):
+        """Renderiza todos los bloques (creación de la sesión o cambio de template)"""
+        layout = get_layout(self.template_name)
+        self.template_version = layout.version
+        self.html_fragments = {
+            name: layout.render_block(layout.page, name, self.context) for name in layout.page_blocks
+        }
+        self.features = _empty_features()
+        for fragment in self.html_fragments.values():
+            self.features = _merge_features(self.features, extract_features(fragment))
+        # Etiquetas fuera de los bloques (html, head, body...)
+        self.features = _merge_features(self.features, extract_features(self.page_html()))
+        self.css_sources = {
+            name: layout.render_block(layout.styles, name, self.context) for name in layout.css_blocks
+        }
+        self.css_fragments = {name: self._compile_css(source) for name, source in self.css_sources.items()}
+
+    def _compile_css(self, source: str) -> str:
+        if settings.CSS_PRUNING:
+            source, _ = renderer.prune_css_with_features(source, self.features)
+        return renderer.minify_css(source)
+
+    def is_stale(self) -> bool:
+        """True si el template se ha recargado desde el último renderizado"""
+        return get_layout(self.template_name).version != self.template_version
+
+    def page_html(self) -> str:
+        """Página completa con el CSS actual de la sesión"""
+        layout = get_layout(self.template_name)
+        return layout.page.render(**{**self.context, "css": self.css})
+
+    def apply(self, context: dict) -> Tuple[List[str], Dict[str, str], Dict[str, str]]:
+        """Aplica un contexto nuevo; devuelve los campos cambiados y los fragmentos HTML y CSS que cambian"""
+        changed = sorted(
+            name for name in set(context) | set(self.context)
+            if name != "css" and name not in DERIVED_FIELDS and context.get(name) != self.context.get(name)
+        )
+        if not changed and not self.is_stale():
+            return [], {}, {}
+
+        template_changed = context["template"] != self.context["template"] or self.is_stale()
+        self.context = context
+        self.version += 1
+        self.touched = time.monotonic()
+        if template_changed:
+            self.render_all()
+            return changed, dict(self.html_fragments), dict(self.css_fragments)
+
+        changed_set = frozenset(changed)
+        layout = get_layout(self.template_name)
+
+        html_changes = {}
+        features = self.features
+        for name, dependencies in layout.page_blocks.items():
+            if dependencies & changed_set:
+                fragment = layout.render_block(layout.page, name, context)
+                if fragment != self.html_fragments.get(name):
+                    self.html_fragments[name] = fragment
+                    html_changes[name] = fragment
+                    features = _merge_features(features, extract_features(fragment))
+
+        dirty_css = set()
+        for name, dependencies in layout.css_blocks.items():
+            if dependencies & changed_set:
+                source = layout.render_block(layout.styles, name, context)
+                if source != self.css_sources.get(name):
+                    self.css_sources[name] = source
+                    dirty_css.add(name)
+        if features != self.features:
+            # Nuevas etiquetas o clases: reglas antes podadas pueden aplicarse ahora
+            self.features = features
+            if settings.CSS_PRUNING:
+                dirty_css = set(layout.css_blocks)
+
+        css_changes = {}
+        for name in dirty_css:
+            fragment = self._compile_css(self.css_sources[name])
+            if fragment != self.css_fragments.get(name):
+                self.css_fragments[name] = fragment
+                css_changes[name] = fragment
+        return changed, html_changes, css_changes
+
+    def snapshot(self) -> dict:
+        if self.is_stale():
+            self.render_all()
+        return {
+            "session_id": self.id,
+            "version": self.version,
+            "html": self.page_html(),
+            "css": self.css,
+            "fragments": {"html": dict(self.html_fragments), "css": dict(self.css_fragments)},
+        }
+
+class SessionPreview(renderer.PreviewData):
+    """Previsualización de una sesión: siempre muestra su estado actual"""
+
+    def __init__(self, session: EditorSession):
+        self.session = session
+        # Sigue el estado de la sesión, que se vuelve a renderizar si el template cambia
+        self.template = self.version = None
+        self.created_at = datetime.now()
+        self.refresh()
+
+    @property
+    def html(self) -> str:
+        return self.session.page_html()
+
+    @property
+    def css(self) -> str:
+        return self.session.css
+
+class EditorSessionStore:
+    """Sesiones activas, expiradas por inactividad y limitadas en número (LRU).
+
+    Cada usuario tiene como mucho `max_per_user` sesiones: al superarlo se
+    descarta la suya menos usada, de modo que un usuario no desplaza las
+    sesiones de los demás.
+    """
+
+    def __init__(self, ttl: float, max_sessions: int, max_per_user: int):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_per_user = max_per_user
+        self.sessions: "OrderedDict[str, EditorSession]" = OrderedDict()
+
+    def create(self, user: Optional[str], context: dict) -> EditorSession:
+        self.cleanup()
+        own = [session_id for session_id, session in self.sessions.items() if session.user == user]
+        # Del más antiguo al más reciente: se descartan las que sobran para hacer sitio a la nueva
+        for session_id in own[:max(0, len(own) - self.max_per_user + 1)]:
+            del self.sessions[session_id]
+        session = EditorSession(secrets.token_urlsafe(16), user, context)
+        self.sessions[session.id] = session
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id: str, user: Optional[str]) -> Optional[EditorSession]:
+        session = self.sessions.get(session_id)
+        if session is None or session.user != user:
+            return None
+        if time.monotonic() - session.touched > self.ttl:
+            del self.sessions[session_id]
+            return None
+        session.touched = time.monotonic()
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str, user: Optional[str]) -> bool:
+        if self.get(session_id, user) is None:
+            return False
+        del self.sessions[session_id]
+        return True
+
+    def cleanup(self):
+        now = time.monotonic()
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            if now - oldest.touched <= self.ttl:
+                break
+            self.sessions.popitem(last=False)
+
+editor_sessions = EditorSessionStore(
+    settings.EDITOR_SESSION_TTL, settings.EDITOR_MAX_SESSIONS, settings.EDITOR_MAX_SESSIONS_PER_USER
+)
+
+gauge("frontpage_editor_sessions", "Sesiones del editor activas", function=lambda: len(editor_sessions.sessions))
+
+def merge_changes(session: EditorSession, changes: dict):
+    """`FrontPageRequest` con los campos actuales de la sesión y los cambios enviados"""
+    from app.models.schemas import FrontPageRequest
+
+    fields = {name: session.context[name] for name in FrontPageRequest.model_fields if name in session.context}
+    return FrontPageRequest.model_validate({**fields, **changes})
+
+async def patch_session(session: EditorSession, request) -> dict:
+    """Aplica una petición ya validada a la sesión y devuelve solo lo que cambió"""
+    context = request.model_dump(mode="json")
+    if context.get("heroImage") == session.context.get("heroImage") and "hero" in session.context:
+        context["hero"] = session.context["hero"]
+    else:
+        await attach_hero_image(context)
+    with _patch_timer.time():
+        changed, html_changes, css_changes = session.apply(context)
+    return {
+        "session_id": session.id,
+        "version": session.version,
+        "changed": changed,
+        "fragments": {"html": html_changes, "css": css_changes},
+    }
+
+async def receive_edits(receive, debounce: float, max_delay: float):
+    """Espera ediciones y las agrupa hasta que pasan `debounce` segundos sin
+    recibir otra (o `max_delay` desde la primera); los campos repetidos se
+    quedan con el último valor.
+
+    `receive` devuelve el siguiente mensaje con la forma `{"changes": {...}}`.
+    """
+    changes = dict((await receive())["changes"])
+    deadline = time.monotonic() + max_delay
+    while True:
+        timeout = min(debounce, deadline - time.monotonic())
+        if timeout <= 0:
+            break
+        try:
+            message = await asyncio.wait_for(receive(), timeout)
+        except asyncio.TimeoutError:
+            break
+        _edits_coalesced.inc()
+        changes.update(message["changes"])
+    _edits_applied.inc()
+    return changes
+
+def connection_opened():
+    global _live_connections
+    _live_connections += 1
+
+def connection_closed():
+    global _live_connections
+    _live_connections -= 1
@@ -0,0 +1,194 @@
+"""Exportación de páginas generadas como archivo ZIP.
+
+El ZIP se escribe sobre un flujo no posicionable: `zipfile` añade un
+descriptor de datos tras cada entrada, así que cada fragmento comprimido se
+puede enviar al cliente en cuanto se produce. La memoria usada es la de una
+página (y un fragmento de cada recurso), no la del archivo completo.
+
+El renderizado, la lectura de los recursos y la compresión se hacen en un hilo,
+fragmento a fragmento, para no bloquear el event loop durante una exportación
+grande.
+"""
+import asyncio
+import hashlib
+import re
+import zipfile
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from app.services.images import attach_hero_image, pipeline as image_pipeline
+from app.services.renderer import get_cached_render
+
+STATIC_DIR = Path(__file__).parent.parent.parent / "static"
+CHUNK_SIZE = 64 * 1024
+
+# Formatos ya comprimidos: se guardan sin volver a comprimir
+STORED_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif", ".woff", ".woff2",
+    ".zip", ".gz", ".br", ".mp4", ".webm", ".pdf",
+}
+
+_STYLE_BLOCK = re.compile(r"<style[^>]*>(.*?)</style>", re.DOTALL)
+_STATIC_REF = re.compile(r'(src|href)="/static/([^"]+)"')
+_IMAGE_REF = re.compile(r'/api/images/([0-9a-f]{64})/(\d+\.(?:webp|jpg))')
+
+class _ChunkBuffer:
+    """Flujo de solo escritura cuyo contenido se vacía tras cada entrada"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        chunks, self.chunks = self.chunks, []
+        if chunks:
+            yield b"".join(chunks)
+
+class SiteFiles:
+    """Ficheros de una página: index.html, CSS con hash y recursos locales"""
+
+    def __init__(self, html: str, css: str, prefix: str = "", assets_prefix: str = "assets/"):
+        self.css = css.strip()
+        self.css_name = f"{assets_prefix}style.{hashlib.sha256(self.css.encode()).hexdigest()[:12]}.css"
+        self.assets: Dict[str, Path] = {}
+
+        relative = "../" * prefix.count("/")
+        link = f'<link rel="stylesheet" href="{relative}{self.css_name}">'
+        html, replaced = _STYLE_BLOCK.subn(lambda _: link, html, count=1)
+        if not replaced:
+            html = html.replace("</head>", f"    {link}\n</head>", 1)
+
+        def rewrite(match: re.Match) -> str:
+            source = _static_file(match.group(2))
+            if source is None:
+                return match.group(0)
+            name = f"{assets_prefix}{match.group(2)}"
+            self.assets[name] = source
+            return f'{match.group(1)}="{relative}{name}"'
+
+        def rewrite_image(match: re.Match) -> str:
+            source = image_pipeline.path_for(match.group(1), match.group(2))
+            if source is None:
+                return match.group(0)
+            name = f"{assets_prefix}images/{match.group(1)[:16]}-{match.group(2)}"
+            self.assets[name] = source
+            return f"{relative}{name}"
+
+        html = _STATIC_REF.sub(rewrite, html)
+        self.html = _IMAGE_REF.sub(rewrite_image, html)
+        self.index_name = f"{prefix}index.html"
+
+    @classmethod
+    def from_rendered(cls, rendered: Dict[str, str], prefix: str = "", assets_prefix: str = "assets/") -> "SiteFiles":
+        """Extrae el CSS minificado incrustado en el HTML para servirlo como fichero"""
+        match = _STYLE_BLOCK.search(rendered["html"])
+        css = match.group(1) if match else rendered["css"]
+        return cls(rendered["html"], css, prefix, assets_prefix)
+
+def _static_file(name: str) -> Optional[Path]:
+    path = (STATIC_DIR / name).resolve()
+    if STATIC_DIR.resolve() not in path.parents or not path.is_file():
+        return None
+    return path
+
+def _compression(name: str) -> int:
+    return zipfile.ZIP_STORED if Path(name).suffix.lower() in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+class ZipStream:
+    """Escritor de ZIP incremental; cada método devuelve los bytes ya listos"""
+
+    def __init__(self):
+        self.buffer = _ChunkBuffer()
+        self.zip = zipfile.ZipFile(self.buffer, mode="w", compression=zipfile.ZIP_DEFLATED, compresslevel=6)
+        self.written: Set[str] = set()
+
+    def add_bytes(self, name: str, data: bytes) -> Iterator[bytes]:
+        if name in self.written:
+            return
+        self.written.add(name)
+        info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+        info.compress_type = _compression(name)
+        info.external_attr = 0o644 << 16
+        with self.zip.open(info, "w") as entry:
+            entry.write(data)
+        yield from self.buffer.drain()
+
+    def add_file(self, name: str, path: Path) -> Iterator[bytes]:
+        if name in self.written:
+            return
+        self.written.add(name)
+        info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+        info.compress_type = _compression(name)
+        info.external_attr = 0o644 << 16
+        with self.zip.open(info, "w") as entry, open(path, "rb") as source:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                entry.write(chunk)
+                yield from self.buffer.drain()
+        yield from self.buffer.drain()
+
+    def add_site(self, site: SiteFiles) -> Iterator[bytes]:
+        yield from self.add_bytes(site.index_name, site.html.encode("utf-8"))
+        yield from self.add_bytes(site.css_name, site.css.encode("utf-8"))
+        for name, path in site.assets.items():
+            yield from self.add_file(name, path)
+
+    def close(self) -> Iterator[bytes]:
+        self.zip.close()
+        yield from self.buffer.drain()
+
+def page_slug(index: int, title: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-")[:40]
+    return f"{index + 1:03d}-{slug or 'page'}"
+
+def render_page(template_name: str, context: dict) -> Dict[str, str]:
+    """Renderizado de la página, reutilizando el caché de renderizado"""
+    rendered = get_cached_render(template_name, context)
+    if not rendered:
+        raise ValueError(f"Template {template_name} could not be rendered")
+    return rendered
+
+async def _in_thread(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """Avanza un iterador síncrono en un hilo, un fragmento cada vez"""
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+def _site_chunks(archive: ZipStream, rendered: Dict[str, str]) -> Iterator[bytes]:
+    yield from archive.add_site(SiteFiles.from_rendered(rendered))
+    yield from archive.close()
+
+def _page_chunks(archive: ZipStream, index: int, template_name: str, context: dict) -> Iterator[bytes]:
+    rendered = render_page(template_name, context)
+    site = SiteFiles.from_rendered(rendered, prefix=f"{page_slug(index, context.get('title', ''))}/")
+    yield from archive.add_site(site)
+
+async def stream_site(rendered: Dict[str, str]) -> AsyncIterator[bytes]:
+    """ZIP de una sola página: index.html en la raíz"""
+    async for chunk in _in_thread(_site_chunks(ZipStream(), rendered)):
+        yield chunk
+
+async def stream_sites(pages: Iterable[Tuple[str, dict]]) -> AsyncIterator[bytes]:
+    """ZIP con varias páginas, renderizadas y enviadas de una en una.
+
+    Cada página va en su propio directorio; los CSS idénticos se guardan una
+    sola vez en `assets/` gracias al hash del nombre.
+    """
+    archive = ZipStream()
+    for index, (template_name, context) in enumerate(pages):
+        # La imagen hero se resuelve en el loop (puede iniciar su procesado en segundo plano)
+        context = await attach_hero_image(context)
+        async for chunk in _in_thread(_page_chunks(archive, index, template_name, context)):
+            yield chunk
+    async for chunk in _in_thread(archive.close()):
+        yield chunk
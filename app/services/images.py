@@ -0,0 +1,414 @@
+"""Procesado de imágenes hero.
+
+Cada imagen se descarga una vez y se generan versiones redimensionadas en WebP
+y JPEG en un pool de procesos (Pillow libera poco el GIL). Las versiones se
+guardan en un caché en disco direccionado por el SHA-256 de la imagen
+original:
+
+    IMAGE_CACHE_DIR/ab/abcdef.../manifest.json, 480.webp, 480.jpg, ...
+    IMAGE_CACHE_DIR/urls/<sha256 de la URL>   -> digest de la imagen
+
+Así una misma URL no se vuelve a descargar y una misma imagen publicada en
+varias URLs no se vuelve a procesar. El `manifest.json` se escribe al final,
+de modo que su presencia indica que todas las versiones están completas.
+
+Las peticiones nunca esperan a la descarga: una imagen que aún no está en el
+caché se procesa en segundo plano y la página se genera con la URL original.
+Como mucho se descargan `IMAGE_PREFETCH_CONCURRENCY` imágenes a la vez; las
+que llegan con el cupo lleno se descartan y se vuelven a pedir con la siguiente
+página que las use. Las URLs que fallan no se reintentan hasta pasados
+`IMAGE_FAILURE_TTL` segundos, y solo se descargan imágenes de direcciones
+públicas.
+"""
+import asyncio
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import re
+import socket
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+from app.core.config import settings
+from app.core.metrics import counter, stage_timer
+
+logger = logging.getLogger(__name__)
+
+IMAGE_URL_PREFIX = "/api/images"
+FORMATS = (("webp", "image/webp"), ("jpg", "image/jpeg"))
+
+IMAGE_REQUESTS = counter(
+    "frontpage_hero_image_requests_total",
+    "Imágenes hero solicitadas por resultado (hit, miss, error, skipped)",
+    ("result",)
+)
+_processing_timer = stage_timer("image_processing")
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+MAX_REDIRECTS = 5
+_FILENAME = re.compile(r"^\d+\.(webp|jpg)$")
+
+class ImageError(Exception):
+    pass
+
+Fetcher = Callable[[str], Awaitable[bytes]]
+
+async def check_public_url(url: str) -> List[str]:
+    """Direcciones a las que resuelve el host de la URL, todas públicas.
+
+    ImageError si la URL no es http(s) o alguna dirección no es pública. Las
+    versiones se sirven sin autenticación en `/api/images`: descargar de
+    localhost o de la red interna expondría esos recursos.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ImageError(f"URL not allowed: {url}")
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except OSError as e:
+        raise ImageError(f"Cannot resolve {parts.hostname}: {e}") from None
+    addresses = []
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ImageError(f"Address {address} not allowed for {url}")
+        if str(address) not in addresses:
+            addresses.append(str(address))
+    return addresses
+
+def _pinned_request(url: str, address: str):
+    """URL con el host sustituido por `address`, cabecera Host y extensiones (SNI) del host original"""
+    parts = urlsplit(url)
+    host = f"[{parts.hostname}]" if ":" in parts.hostname else parts.hostname
+    pinned = f"[{address}]" if ":" in address else address
+    if parts.port is not None:
+        host, pinned = f"{host}:{parts.port}", f"{pinned}:{parts.port}"
+    extensions = {"sni_hostname": parts.hostname} if parts.scheme == "https" else {}
+    return urlunsplit((parts.scheme, pinned, parts.path or "/", parts.query, "")), {"Host": host}, extensions
+
+async def fetch_url(url: str) -> bytes:
+    """Descarga la imagen con un límite de tamaño, comprobando cada redirección.
+
+    La conexión va a la dirección ya comprobada y no a una nueva resolución del
+    host, que podría apuntar a otra (DNS rebinding). El certificado TLS se
+    valida contra el host original mediante SNI.
+    """
+    import httpx
+
+    chunks = []
+    size = 0
+    for _ in range(MAX_REDIRECTS + 1):
+        addresses = await check_public_url(url)
+        target, headers, extensions = _pinned_request(url, addresses[0])
+        # Un cliente por salto: una conexión TLS no se reutiliza para otro host con la misma IP
+        async with httpx.AsyncClient(timeout=settings.IMAGE_FETCH_TIMEOUT, follow_redirects=False) as client:
+            async with client.stream("GET", target, headers=headers, extensions=extensions) as response:
+                if response.has_redirect_location:
+                    url = urljoin(url, response.headers["Location"])
+                    continue
+                if response.status_code != 200:
+                    raise ImageError(f"HTTP {response.status_code} fetching {url}")
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > settings.IMAGE_MAX_BYTES:
+                        raise ImageError(f"Image larger than {settings.IMAGE_MAX_BYTES} bytes")
+                    chunks.append(chunk)
+                return b"".join(chunks)
+    raise ImageError(f"Too many redirects fetching {url}")
+
+def _write_atomic(path: Path, data: bytes):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+def target_widths(original_width: int, widths: Sequence[int]) -> List[int]:
+    """Anchos a generar: los configurados menores que el original y el original acotado"""
+    targets = {width for width in widths if width < original_width}
+    targets.add(min(original_width, max(widths)))
+    return sorted(targets)
+
+def make_derivatives(source: bytes, directory: str, widths: Sequence[int], quality: int) -> dict:
+    """Genera las versiones de una imagen (se ejecuta en el pool de procesos)"""
+    import io
+    from PIL import Image, ImageOps
+
+    try:
+        image = Image.open(io.BytesIO(source))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except Exception as e:
+        raise ImageError(f"Invalid image: {e}") from None
+
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    original_width, original_height = image.size
+
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    variants = []
+    for width in target_widths(original_width, widths):
+        height = max(1, round(original_height * width / original_width))
+        resized = image if width == original_width else image.resize((width, height), Image.LANCZOS)
+        for extension, _ in FORMATS:
+            buffer = io.BytesIO()
+            if extension == "jpg":
+                flattened = resized
+                if has_alpha:
+                    flattened = Image.new("RGB", resized.size, (255, 255, 255))
+                    flattened.paste(resized, mask=resized.getchannel("A"))
+                flattened.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+            else:
+                resized.save(buffer, "WEBP", quality=quality, method=4)
+            _write_atomic(path / f"{width}.{extension}", buffer.getvalue())
+        variants.append({"width": width, "height": height})
+
+    manifest = {
+        "width": original_width,
+        "height": original_height,
+        "source_bytes": len(source),
+        "variants": variants,
+    }
+    _write_atomic(path / "manifest.json", json.dumps(manifest).encode())
+    return manifest
+
+class HeroImagePipeline:
+    """Descarga, procesa y cachea imágenes hero"""
+
+    def __init__(
+        self,
+        cache_dir: str,
+        widths: Sequence[int] = (480, 960, 1600),
+        quality: int = 80,
+        workers: int = 2,
+        fetcher: Optional[Fetcher] = None,
+        failure_ttl: float = 300.0,
+        prefetch_concurrency: int = 4,
+        max_entries: int = 10000
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.widths = tuple(sorted(widths))
+        self.quality = quality
+        self.workers = workers
+        # Sustituible en tests o por un servidor de ficheros local
+        self.fetcher: Fetcher = fetcher or fetch_url
+        self.failure_ttl = failure_ttl
+        self.prefetch_concurrency = prefetch_concurrency
+        self.max_entries = max_entries
+        self._executor: Optional[Executor] = None
+        # Índices en memoria acotados a `max_entries`, se descartan los menos usados
+        self._url_index: Dict[str, str] = OrderedDict()
+        self._manifests: Dict[str, dict] = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        # URL -> (momento hasta el que no se reintenta, error)
+        self._failures: Dict[str, tuple] = OrderedDict()
+        self._tasks = set()
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self.workers > 0 and self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def digest_dir(self, digest: str) -> Path:
+        return self.cache_dir / digest[:2] / digest
+
+    def _url_key(self, url: str) -> Path:
+        return self.cache_dir / "urls" / hashlib.sha256(url.encode()).hexdigest()
+
+    def _remember(self, entries: OrderedDict, key: str, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def _recall(self, entries: OrderedDict, key: str):
+        value = entries.get(key)
+        if value is not None:
+            entries.move_to_end(key)
+        return value
+
+    def _load_manifest(self, digest: str) -> Optional[dict]:
+        manifest = self._recall(self._manifests, digest)
+        if manifest is not None:
+            return manifest
+        try:
+            manifest = json.loads((self.digest_dir(digest) / "manifest.json").read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        manifest["digest"] = digest
+        self._remember(self._manifests, digest, manifest)
+        return manifest
+
+    def _cached_digest(self, url: str) -> Optional[str]:
+        digest = self._recall(self._url_index, url)
+        if digest is None:
+            try:
+                digest = self._url_key(url).read_text().strip()
+            except FileNotFoundError:
+                return None
+            self._remember(self._url_index, url, digest)
+        return digest
+
+    def cached_variants(self, url: str) -> Optional[dict]:
+        """Manifiesto de la imagen si ya está procesada, sin descargar nada"""
+        digest = self._cached_digest(url)
+        if digest is None:
+            return None
+        return self._load_manifest(digest)
+
+    def recent_failure(self, url: str) -> Optional[str]:
+        """Error de la última descarga o procesado de la URL, si falló hace menos de `failure_ttl`"""
+        failure = self._failures.get(url)
+        if failure is None:
+            return None
+        if time.monotonic() >= failure[0]:
+            del self._failures[url]
+            return None
+        return failure[1]
+
+    def prefetch(self, url: str):
+        """Procesa la imagen en segundo plano si no está en curso ni falló hace poco.
+
+        Con `prefetch_concurrency` descargas ya en curso la URL se descarta: la
+        página sigue usando la URL original y la siguiente que la use lo reintenta.
+        """
+        if url in self._in_flight or self.recent_failure(url) is not None:
+            return
+        if len(self._tasks) >= self.prefetch_concurrency:
+            IMAGE_REQUESTS.labels(result="skipped").inc()
+            return
+        task = asyncio.ensure_future(self._prefetch(url))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _prefetch(self, url: str):
+        try:
+            await self.get_variants(url)
+        except Exception as e:
+            logger.warning("Hero image %s could not be processed: %s", url, e)
+
+    async def get_variants(self, url: str) -> dict:
+        """Manifiesto con las versiones de la imagen, procesándola si hace falta"""
+        manifest = self.cached_variants(url)
+        if manifest is not None:
+            IMAGE_REQUESTS.labels(result="hit").inc()
+            return manifest
+        error = self.recent_failure(url)
+        if error is not None:
+            raise ImageError(error)
+
+        # Peticiones simultáneas de la misma URL comparten el procesado
+        loop = asyncio.get_running_loop()
+        pending = self._in_flight.get(url)
+        if pending is not None and pending.get_loop() is loop:
+            return await asyncio.shield(pending)
+
+        future = loop.create_future()
+        self._in_flight[url] = future
+        try:
+            manifest = await self._process(url)
+            future.set_result(manifest)
+            return manifest
+        except Exception as e:
+            future.set_exception(e)
+            # Evita el aviso de excepción no recuperada si nadie más esperaba
+            future.exception()
+            IMAGE_REQUESTS.labels(result="error").inc()
+            self._remember(self._failures, url, (time.monotonic() + self.failure_ttl, str(e) or type(e).__name__))
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            if self._in_flight.get(url) is future:
+                del self._in_flight[url]
+
+    async def _process(self, url: str) -> dict:
+        source = await self.fetcher(url)
+        digest = hashlib.sha256(source).hexdigest()
+
+        manifest = self._load_manifest(digest)
+        if manifest is None:
+            IMAGE_REQUESTS.labels(result="miss").inc()
+            start = time.perf_counter()
+            args = (source, str(self.digest_dir(digest)), self.widths, self.quality)
+            executor = self._get_executor()
+            if executor is None:
+                manifest = await asyncio.to_thread(make_derivatives, *args)
+            else:
+                manifest = await asyncio.get_running_loop().run_in_executor(executor, make_derivatives, *args)
+            _processing_timer.observe(time.perf_counter() - start)
+            manifest["digest"] = digest
+            self._remember(self._manifests, digest, manifest)
+        else:
+            IMAGE_REQUESTS.labels(result="hit").inc()
+
+        key = self._url_key(url)
+        key.parent.mkdir(parents=True, exist_ok=True)
+        _write_atomic(key, digest.encode())
+        self._remember(self._url_index, url, digest)
+        return manifest
+
+    def path_for(self, digest: str, filename: str) -> Optional[Path]:
+        """Fichero de una versión, validando el nombre para no salir del caché"""
+        if not _DIGEST.match(digest) or not _FILENAME.match(filename):
+            return None
+        path = self.digest_dir(digest) / filename
+        return path if path.is_file() else None
+
+def srcset(manifest: dict, sizes: str = "100vw") -> dict:
+    """Atributos `srcset` por formato para el elemento <picture> del template"""
+    base = f"{IMAGE_URL_PREFIX}/{manifest['digest']}"
+    largest = manifest["variants"][-1]
+    hero = {
+        "src": f"{base}/{largest['width']}.jpg",
+        "width": largest["width"],
+        "height": largest["height"],
+        "sizes": sizes,
+    }
+    for extension, mime in FORMATS:
+        hero[f"srcset_{extension}"] = ", ".join(
+            f"{base}/{variant['width']}.{extension} {variant['width']}w" for variant in manifest["variants"]
+        )
+        hero[f"type_{extension}"] = mime
+    return hero
+
+pipeline = HeroImagePipeline(
+    settings.IMAGE_CACHE_DIR,
+    widths=settings.IMAGE_WIDTHS,
+    quality=settings.IMAGE_QUALITY,
+    workers=settings.IMAGE_WORKERS,
+    failure_ttl=settings.IMAGE_FAILURE_TTL,
+    prefetch_concurrency=settings.IMAGE_PREFETCH_CONCURRENCY,
+    max_entries=settings.IMAGE_INDEX_MAX_ENTRIES
+)
+
+async def attach_hero_image(context: dict) -> dict:
+    """Añade al contexto de renderizado el `srcset` de la imagen hero, si la hay.
+
+    No espera a la red: si la imagen aún no está procesada, se procesa en
+    segundo plano y esta página se genera con la URL original (las siguientes
+    ya usan el `srcset`). Lo mismo si la imagen no se puede descargar.
+    """
+    url = context.get("heroImage")
+    if not url:
+        return context
+    manifest = pipeline.cached_variants(str(url))
+    if manifest is None:
+        pipeline.prefetch(str(url))
+    else:
+        IMAGE_REQUESTS.labels(result="hit").inc()
+        context["hero"] = srcset(manifest)
+    return context
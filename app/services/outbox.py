@@ -0,0 +1,263 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    webhook_id TEXT NOT NULL,
+    webhook TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    body BLOB NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deliveries_due ON deliveries (next_attempt_at);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    webhook_id TEXT NOT NULL,
+    webhook TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    body BLOB NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    failed_at REAL NOT NULL
+);
+"""
+
+class OutboxRecord(NamedTuple):
+    """Entrega pendiente de un evento a un webhook"""
+    id: int
+    webhook_id: str
+    webhook: str  # configuración del webhook (JSON) en el momento de la generación
+    event_id: str
+    body: bytes
+    attempts: int
+
+class WebhookOutbox:
+    """Registro durable (SQLite) de las entregas de webhooks pendientes.
+
+    Las escrituras se agrupan: todas las operaciones que llegan mientras otra
+    transacción está en curso se confirman juntas en la siguiente, de modo que
+    el coste por evento es una fracción de un commit.
+    """
+
+    def __init__(self, path: str, max_batch: int = 500):
+        self.path = path
+        self.max_batch = max_batch
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[Callable, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    @property
+    def queued_writes(self) -> int:
+        """Operaciones esperando la siguiente transacción"""
+        return len(self._pending)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # Escrituras agrupadas
+
+    async def _write(self, operation: Callable[[sqlite3.Connection], object]):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((operation, future))
+        task = self._flush_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._flush_task = loop.create_task(self._flush())
+        return await future
+
+    async def _flush(self):
+        while self._pending:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            try:
+                results = await asyncio.to_thread(self._apply, [operation for operation, _ in batch])
+            except Exception as e:
+                # No se pudo abrir la base de datos o confirmar la transacción:
+                # falla todo el bloque, pero las escrituras siguientes se siguen procesando
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), (result, error) in zip(batch, results):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def _apply(self, operations: Sequence[Callable]) -> List[Tuple[object, Optional[Exception]]]:
+        results = []
+        with self._lock:
+            conn = self._connect()
+            try:
+                for operation in operations:
+                    try:
+                        results.append((operation(conn), None))
+                    except Exception as e:
+                        results.append((None, e))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return results
+
+    async def enqueue(self, entries: Sequence[Tuple[str, str, str, bytes]], lease: float) -> List[OutboxRecord]:
+        """Registra entregas (webhook_id, webhook, event_id, body) antes del primer intento.
+
+        `lease` es el tiempo durante el cual el planificador no las reintentará,
+        para dar margen al primer envío.
+        """
+        now = time.time()
+
+        def insert(conn):
+            records = []
+            for webhook_id, webhook, event_id, body in entries:
+                cursor = conn.execute(
+                    "INSERT INTO deliveries (webhook_id, webhook, event_id, body, next_attempt_at, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (webhook_id, webhook, event_id, body, now + lease, now)
+                )
+                records.append(OutboxRecord(cursor.lastrowid, webhook_id, webhook, event_id, body, 0))
+            return records
+
+        return await self._write(insert)
+
+    async def complete(self, ids: Sequence[int]):
+        """Elimina entregas confirmadas por el receptor"""
+        def delete(conn):
+            conn.executemany("DELETE FROM deliveries WHERE id = ?", [(i,) for i in ids])
+        await self._write(delete)
+
+    async def reschedule(self, record: OutboxRecord, next_attempt_at: float, error: str):
+        """Programa un nuevo intento para una entrega fallida"""
+        def update(conn):
+            conn.execute(
+                "UPDATE deliveries SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (record.attempts + 1, next_attempt_at, error, record.id)
+            )
+        await self._write(update)
+
+    async def postpone(self, ids: Sequence[int], next_attempt_at: float):
+        """Aplaza entregas sin consumir un intento (por ejemplo, con el circuito abierto)"""
+        def update(conn):
+            conn.executemany(
+                "UPDATE deliveries SET next_attempt_at = ? WHERE id = ?",
+                [(next_attempt_at, i) for i in ids]
+            )
+        await self._write(update)
+
+    async def dead_letter(self, record: OutboxRecord, error: str):
+        """Mueve una entrega que agotó sus reintentos a la cola de mensajes muertos"""
+        def move(conn):
+            conn.execute(
+                "INSERT INTO dead_letters (webhook_id, webhook, event_id, body, attempts, last_error, created_at, failed_at) "
+                "SELECT webhook_id, webhook, event_id, body, ?, ?, created_at, ? FROM deliveries WHERE id = ?",
+                (record.attempts + 1, error, time.time(), record.id)
+            )
+            conn.execute("DELETE FROM deliveries WHERE id = ?", (record.id,))
+        await self._write(move)
+
+    async def discard_webhook(self, webhook_id: str):
+        """Descarta las entregas pendientes de un webhook eliminado"""
+        def delete(conn):
+            conn.execute("DELETE FROM deliveries WHERE webhook_id = ?", (webhook_id,))
+        await self._write(delete)
+
+    async def claim_due(self, limit: int, lease: float) -> List[OutboxRecord]:
+        """Reserva las entregas cuyo próximo intento ya venció"""
+        now = time.time()
+
+        def claim(conn):
+            rows = conn.execute(
+                "SELECT id, webhook_id, webhook, event_id, body, attempts FROM deliveries "
+                "WHERE next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE deliveries SET next_attempt_at = ? WHERE id = ?",
+                [(now + lease, row[0]) for row in rows]
+            )
+            return [OutboxRecord(*row) for row in rows]
+
+        return await self._write(claim)
+
+    # Cola de mensajes muertos
+
+    async def list_dead_letters(self, limit: int = 100) -> List[dict]:
+        def select():
+            with self._lock:
+                rows = self._connect().execute(
+                    "SELECT id, webhook_id, event_id, body, attempts, last_error, created_at, failed_at "
+                    "FROM dead_letters ORDER BY id LIMIT ?",
+                    (limit,)
+                ).fetchall()
+            return [
+                {
+                    "id": row[0],
+                    "webhook_id": row[1],
+                    "event_id": row[2],
+                    "payload": bytes(row[3]).decode(),
+                    "attempts": row[4],
+                    "last_error": row[5],
+                    "created_at": row[6],
+                    "failed_at": row[7],
+                }
+                for row in rows
+            ]
+        return await asyncio.to_thread(select)
+
+    async def replay_dead_letters(self, ids: Optional[Sequence[int]] = None) -> int:
+        """Devuelve mensajes muertos al outbox para un nuevo ciclo de reintentos"""
+        now = time.time()
+
+        def replay(conn):
+            if ids is None:
+                selected = [row[0] for row in conn.execute("SELECT id FROM dead_letters ORDER BY id")]
+            else:
+                selected = list(ids)
+            replayed = 0
+            for dead_id in selected:
+                cursor = conn.execute(
+                    "INSERT INTO deliveries (webhook_id, webhook, event_id, body, next_attempt_at, created_at) "
+                    "SELECT webhook_id, webhook, event_id, body, ?, created_at FROM dead_letters WHERE id = ?",
+                    (now, dead_id)
+                )
+                if cursor.rowcount:
+                    conn.execute("DELETE FROM dead_letters WHERE id = ?", (dead_id,))
+                    replayed += 1
+            return replayed
+
+        return await self._write(replay)
+
+    async def pending_count(self) -> int:
+        def count():
+            with self._lock:
+                return self._connect().execute("SELECT COUNT(*) FROM deliveries").fetchone()[0]
+        return await asyncio.to_thread(count)
+
+# Instancia global del outbox
+outbox = WebhookOutbox(settings.WEBHOOK_OUTBOX_PATH, max_batch=settings.OUTBOX_MAX_BATCH)
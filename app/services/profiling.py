@@ -0,0 +1,160 @@
+"""Perfiles de peticiones individuales bajo demanda.
+
+Un perfil es la salida de cProfile de una petición completa (dependencias,
+validación, renderizado y envío de webhooks). Se guarda en memoria con un
+límite de tamaño y se descarga en formato pstats (para `python -m pstats` o
+snakeviz), como pilas colapsadas (para flamegraph.pl o speedscope) o como texto.
+
+cProfile registra todo lo que se ejecuta en el hilo del event loop mientras
+está activo, así que las corrutinas de otras peticiones concurrentes también
+pueden aparecer en el perfil.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import secrets
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+FuncKey = Tuple[str, int, str]
+
+class ProfileArtifact:
+    def __init__(self, route: str, method: str, user: Optional[str], duration: float, stats: dict):
+        self.id = secrets.token_urlsafe(12)
+        self.route = route
+        self.method = method
+        self.user = user
+        self.duration = duration
+        self.stats = stats
+        self.created_at = datetime.now()
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "route": self.route,
+            "method": self.method,
+            "user": self.user,
+            "duration_ms": round(self.duration * 1000, 3),
+            "created_at": self.created_at.isoformat(),
+            "functions": len(self.stats),
+        }
+
+    def to_pstats(self) -> bytes:
+        """Mismo formato que `cProfile.Profile.dump_stats`"""
+        return marshal.dumps(self.stats)
+
+    def to_text(self, limit: int = 50) -> str:
+        stream = io.StringIO()
+        stats = pstats.Stats(_StatsSource(self.stats), stream=stream)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+    def to_collapsed(self) -> str:
+        """Pilas colapsadas (`a;b;c microsegundos`) reconstruidas del grafo de llamadas.
+
+        cProfile solo guarda aristas llamador-llamado, así que el tiempo de cada
+        función se reparte entre sus llamadores en proporción al tiempo
+        acumulado de cada arista.
+        """
+        callees: Dict[FuncKey, List[FuncKey]] = {}
+        for func, (_, _, _, _, callers) in self.stats.items():
+            for caller in callers:
+                callees.setdefault(caller, []).append(func)
+
+        roots = [func for func, (_, _, _, _, callers) in self.stats.items() if not callers]
+        lines: Dict[str, float] = {}
+
+        def walk(func: FuncKey, path: Tuple[str, ...], scale: float):
+            _, _, tottime, cumtime, _ = self.stats[func]
+            path = path + (_frame_name(func),)
+            stack = ";".join(path)
+            lines[stack] = lines.get(stack, 0.0) + tottime * scale
+            if len(path) >= 64:
+                return
+            for callee in callees.get(func, []):
+                if _frame_name(callee) in path:
+                    continue
+                edge_cumtime = self.stats[callee][4][func][3]
+                callee_cumtime = self.stats[callee][3]
+                if callee_cumtime <= 0 or edge_cumtime <= 0:
+                    continue
+                walk(callee, path, scale * edge_cumtime / callee_cumtime)
+
+        for root in roots:
+            walk(root, (), 1.0)
+
+        return "\n".join(
+            f"{stack} {round(seconds * 1e6)}" for stack, seconds in lines.items() if round(seconds * 1e6) > 0
+        ) + "\n"
+
+class _StatsSource:
+    """Adaptador para construir `pstats.Stats` a partir de un diccionario de estadísticas"""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+def _frame_name(func: FuncKey) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name
+    return f"{name} ({filename.rsplit('/', 1)[-1]}:{line})"
+
+class ProfileStore:
+    """Perfiles recientes, limitados a `max_size` (se descartan los más antiguos)"""
+
+    def __init__(self, max_size: int = 50):
+        self.max_size = max_size
+        self.profiles: "OrderedDict[str, ProfileArtifact]" = OrderedDict()
+
+    def add(self, artifact: ProfileArtifact):
+        self.profiles[artifact.id] = artifact
+        while len(self.profiles) > self.max_size:
+            self.profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[ProfileArtifact]:
+        return self.profiles.get(profile_id)
+
+    def list(self, user: str) -> List[dict]:
+        """Resúmenes de los perfiles de `user`, del más reciente al más antiguo"""
+        return [artifact.summary() for artifact in reversed(self.profiles.values()) if artifact.user == user]
+
+profile_store = ProfileStore(settings.PROFILE_MAX_STORED)
+
+class RequestProfiler:
+    """Perfil de una única petición; solo puede haber uno activo por proceso"""
+
+    _active = False
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.start = 0.0
+
+    @classmethod
+    def try_start(cls) -> Optional["RequestProfiler"]:
+        # cProfile usa el hook de perfilado del hilo: no se pueden anidar perfiles
+        if cls._active:
+            return None
+        profiler = cls()
+        profiler.start = time.perf_counter()
+        # enable() falla si ya hay otro perfilador (o una herramienta de
+        # sys.monitoring) activo: solo entonces se marca como ocupado
+        profiler.profile.enable()
+        cls._active = True
+        return profiler
+
+    def finish(self, route: str, method: str, user: Optional[str]) -> ProfileArtifact:
+        self.profile.disable()
+        duration = time.perf_counter() - self.start
+        RequestProfiler._active = False
+        self.profile.create_stats()
+        artifact = ProfileArtifact(route, method, user, duration, self.profile.stats)
+        profile_store.add(artifact)
+        return artifact
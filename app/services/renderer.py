@@ -1,74 +1,298 @@
-from jinja2 import Environment, FileSystemLoader
-import rcssmin
+import asyncio
 import hashlib
 import json
+import logging
+import secrets
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Any, Dict, NamedTuple, Optional, Tuple
 from pathlib import Path
 from collections import OrderedDict
 
 from app.core.config import settings
+from app.core.metrics import counter, gauge, stage_timer
+from app.services.css_pruner import PageFeatures, extract_features, prune_css_for
 
-# Caché en memoria con límite de tamaño
+logger = logging.getLogger(__name__)
+
+# Caché en memoria con límite de tamaño. Con lock: la exportación a ZIP
+# renderiza en hilos
 class MemoryCache:
     def __init__(self, max_size=1000):
         self.max_size = max_size
         self.cache = OrderedDict()
         self.expiry = {}
+        self.lock = threading.Lock()
 
     def get(self, key: str) -> Optional[str]:
+        # Sin lock en los fallos: como mucho, una entrada recién escrita cuenta como fallo
         if key not in self.cache:
             return None
-        
-        if key in self.expiry and datetime.now() > self.expiry[key]:
-            del self.cache[key]
-            del self.expiry[key]
-            return None
-            
-        self.cache.move_to_end(key)
-        return self.cache[key]
+        with self.lock:
+            if key not in self.cache:
+                return None
+
+            if key in self.expiry and datetime.now() > self.expiry[key]:
+                del self.cache[key]
+                del self.expiry[key]
+                return None
+
+            self.cache.move_to_end(key)
+            return self.cache[key]
 
     def set(self, key: str, value: str, ttl: int = None):
-        if len(self.cache) >= self.max_size:
-            self.cache.popitem(last=False)
-            
-        self.cache[key] = value
-        self.cache.move_to_end(key)
-        
-        if ttl:
-            self.expiry[key] = datetime.now() + timedelta(seconds=ttl)
+        with self.lock:
+            if key not in self.cache and len(self.cache) >= self.max_size:
+                evicted, _ = self.cache.popitem(last=False)
+                self.expiry.pop(evicted, None)
+
+            self.cache[key] = value
+            self.cache.move_to_end(key)
+
+            if ttl:
+                self.expiry[key] = datetime.now() + timedelta(seconds=ttl)
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Elimina las entradas cuya clave empieza por `prefix`"""
+        with self.lock:
+            keys = [key for key in self.cache if key.startswith(prefix)]
+            for key in keys:
+                del self.cache[key]
+                self.expiry.pop(key, None)
+            return len(keys)
 
 # Instancia global del caché
 cache = MemoryCache()
 
-# Configuración de Jinja2
+# Métricas del renderizado
+CACHE_REQUESTS = counter(
+    "frontpage_render_cache_requests_total", "Consultas al caché de renderizado", ("result",)
+)
+_cache_hits = CACHE_REQUESTS.labels(result="hit")
+_cache_misses = CACHE_REQUESTS.labels(result="miss")
+gauge("frontpage_render_cache_entries", "Entradas en el caché de renderizado", function=lambda: len(cache.cache))
+gauge(
+    "frontpage_render_cache_hit_ratio",
+    "Proporción de aciertos del caché de renderizado",
+    function=lambda: _cache_hits.value / ((_cache_hits.value + _cache_misses.value) or 1)
+)
+_cache_lookup_timer = stage_timer("cache_lookup")
+_render_timer = stage_timer("render")
+_minify_timer = stage_timer("css_minify")
+_prune_timer = stage_timer("css_prune")
+CSS_PRUNED_BYTES = counter("frontpage_css_pruned_bytes_total", "Bytes de CSS eliminados por la poda de reglas sin uso")
+
+# Poda de CSS por (CSS, etiquetas/clases/ids de la página): páginas del mismo
+# template con distinto texto comparten el resultado
+_prune_cache = MemoryCache(max_size=256)
+
+# Marcador donde va el CSS al renderizar antes de podarlo
+CSS_SENTINEL = f"/*css-{secrets.token_hex(8)}*/"
+
+# Configuración de Jinja2 (se crea en el primer renderizado para no cargar jinja2 al arrancar)
 templates_dir = Path(__file__).parent.parent / "templates"
-env = Environment(loader=FileSystemLoader(str(templates_dir)))
+_env = None
+
+def get_env():
+    global _env
+    if _env is None:
+        from jinja2 import Environment, FileSystemLoader
+        # Los templates solo cambian al recargarlos (reload_templates), nunca a mitad de una petición
+        _env = Environment(loader=FileSystemLoader(str(templates_dir)), auto_reload=False)
+    return _env
+
+class TemplateSet(NamedTuple):
+    """Templates de página y de estilos compilados, con la versión (hash) de su contenido"""
+    page: Any
+    styles: Any
+    page_source: str
+    styles_source: str
+    version: str
+
+# Templates compilados por nombre; se sustituyen enteros al recargar
+_templates: Dict[str, TemplateSet] = {}
+
+# Última versión de cada template que no compiló, con su error: no se vuelve a
+# compilar hasta que cambie
+_failed_versions: Dict[str, Tuple[str, str]] = {}
+
+class TemplateSources(NamedTuple):
+    """Código de la página y de los estilos de un template, leído del disco sin compilar"""
+    page: Tuple[str, Optional[str]]
+    styles: Tuple[str, Optional[str]]
+
+    @property
+    def version(self) -> str:
+        return hashlib.sha256(f"{self.page[0]}\0{self.styles[0]}".encode()).hexdigest()[:12]
+
+def _read_sources(template_name: str) -> TemplateSources:
+    env = get_env()
+    page_source, page_path, _ = env.loader.get_source(env, f"{template_name}.html")
+    styles_source, styles_path, _ = env.loader.get_source(env, f"{template_name}_style.html")
+    return TemplateSources((page_source, page_path), (styles_source, styles_path))
+
+def _compile(env, filename: str, source: str, path: Optional[str]):
+    code = env.compile(source, filename, path)
+    return env.template_class.from_code(env, code, env.make_globals(None))
+
+def _build_template_set(template_name: str, sources: TemplateSources) -> TemplateSet:
+    env = get_env()
+    page = _compile(env, f"{template_name}.html", *sources.page)
+    styles = _compile(env, f"{template_name}_style.html", *sources.styles)
+    return TemplateSet(page, styles, sources.page[0], sources.styles[0], sources.version)
+
+def _load_template_set(template_name: str) -> TemplateSet:
+    return _build_template_set(template_name, _read_sources(template_name))
+
+def get_template_set(template_name: str) -> TemplateSet:
+    template_set = _templates.get(template_name)
+    if template_set is None:
+        template_set = _templates[template_name] = _load_template_set(template_name)
+    return template_set
+
+def template_version(template_name: str) -> str:
+    return get_template_set(template_name).version
+
+def read_template_sources() -> Dict[str, Any]:
+    """Lee del disco el código de los templates cargados, sin compilarlo.
+
+    Solo hace E/S, así que se puede llamar desde un hilo. Para cada template
+    devuelve sus `TemplateSources` o la excepción si no se pudo leer.
+    """
+    sources: Dict[str, Any] = {}
+    for template_name in list(_templates):
+        try:
+            sources[template_name] = _read_sources(template_name)
+        except Exception as e:
+            sources[template_name] = e
+    return sources
+
+def reload_templates(sources: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, str]]:
+    """Sustituye los templates cargados cuyo código cambió en disco.
+
+    Se compara el hash del código y solo se compilan los templates que
+    cambiaron. Cada uno se compila completo (página y estilos) antes de
+    sustituirlo, así que una petición nunca ve una mezcla de versiones. Si un
+    template no compila se mantiene la versión anterior. Se eliminan del caché
+    solo los renderizados de la versión anterior de los templates cambiados.
+
+    `sources` es el resultado de `read_template_sources`; si no se pasa, se lee aquí.
+    """
+    if sources is None:
+        sources = read_template_sources()
+    reloaded, failed = {}, {}
+    for template_name, source in sources.items():
+        current = _templates.get(template_name)
+        if current is None:
+            continue
+        if isinstance(source, Exception):
+            logger.warning("Template %s could not be reloaded: %s", template_name, source)
+            failed[template_name] = str(source)
+            continue
+        version = source.version
+        if version == current.version:
+            _failed_versions.pop(template_name, None)
+            continue
+        previous_failure = _failed_versions.get(template_name)
+        if previous_failure is not None and previous_failure[0] == version:
+            failed[template_name] = previous_failure[1]
+            continue
+        try:
+            fresh = _build_template_set(template_name, source)
+        except Exception as e:
+            logger.warning("Template %s could not be reloaded: %s", template_name, e)
+            _failed_versions[template_name] = (version, str(e))
+            failed[template_name] = str(e)
+            continue
+        _failed_versions.pop(template_name, None)
+        _templates[template_name] = fresh
+        cache.delete_prefix(f"template:{template_name}:{current.version}:")
+        reloaded[template_name] = fresh.version
+    return {"reloaded": reloaded, "failed": failed}
+
+class TemplateWatcher:
+    """Recarga periódicamente los templates modificados en disco"""
+
+    def __init__(self, interval: float = 2.0):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            # La lectura de los ficheros va en un hilo; la compilación (solo de
+            # los cambiados) y la sustitución, en el loop
+            sources = await asyncio.to_thread(read_template_sources)
+            result = reload_templates(sources)
+            if result["reloaded"]:
+                logger.info("Templates reloaded: %s", result["reloaded"])
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+template_watcher = TemplateWatcher()
 
 class PreviewData:
-    def __init__(self, html: str, css: str):
+    def __init__(self, html: str, css: str, template: Optional[str] = None, version: Optional[str] = None):
         self.html = html
         self.css = css
+        # Template y versión con que se renderizó; al recargarlo la previsualización caduca
+        self.template = template
+        self.version = version
         self.created_at = datetime.now()
-        self.expires_at = self.created_at + timedelta(hours=settings.PREVIEW_EXPIRY_HOURS)
+        self.refresh()
+
+    def refresh(self):
+        """Renueva la caducidad de la previsualización"""
+        self.expires_at = datetime.now() + timedelta(hours=settings.PREVIEW_EXPIRY_HOURS)
+
+    def is_stale(self) -> bool:
+        """True si su template se ha recargado desde que se renderizó"""
+        current = _templates.get(self.template)
+        return current is not None and current.version != self.version
 
     def is_expired(self) -> bool:
-        return datetime.now() > self.expires_at
+        return self.is_stale() or datetime.now() > self.expires_at
 
 def get_cache_key(template_name: str, context: dict) -> str:
     context_hash = hashlib.md5(json.dumps(context, sort_keys=True).encode()).hexdigest()
-    return f"template:{template_name}:{context_hash}"
+    return f"template:{template_name}:{template_version(template_name)}:{context_hash}"
 
 def get_template(template_name: str):
-    return env.get_template(f"{template_name}.html")
+    return get_template_set(template_name).page
+
+def is_cached(template_name: str, context: dict) -> bool:
+    """True si el renderizado ya está en caché (sin renderizar ni contar la consulta)"""
+    try:
+        key = get_cache_key(template_name, context)
+    except Exception:
+        # Template inexistente: el error se informa al renderizar
+        return False
+    return cache.get(key) is not None
 
 def get_cached_render(template_name: str, context: dict) -> Optional[Dict[str, str]]:
-    cache_key = get_cache_key(template_name, context)
-    cached = cache.get(cache_key)
-    
+    with _cache_lookup_timer.time():
+        cache_key = get_cache_key(template_name, context)
+        cached = cache.get(cache_key)
+        if cached:
+            rendered = json.loads(cached)
+
     if cached:
-        return json.loads(cached)
-    
+        _cache_hits.inc()
+        return rendered
+
+    _cache_misses.inc()
     rendered = render_template(template_name, context)
     if rendered:
         cache.set(
@@ -78,16 +302,71 @@ def get_cached_render(template_name: str, context: dict) -> Optional[Dict[str, s
         )
     return rendered
 
-def render_template(template_name: str, context: dict) -> Dict[str, str]:
-    template = get_template(template_name)
-    css = get_template_css(template_name, context)
+def render_template(template_name: str, context: dict, prune_css: Optional[bool] = None) -> Dict[str, str]:
+    """Renderiza HTML y CSS; con la poda activada se eliminan las reglas CSS sin uso.
+
+    Para podar, el HTML se renderiza con un marcador en lugar del CSS, se
+    analiza qué etiquetas, clases e ids usa y el CSS podado y minificado
+    sustituye al marcador. El resultado incluye `css_stats` con los bytes
+    ahorrados.
+    """
+    start = time.perf_counter()
+    template_set = get_template_set(template_name)
+    template = template_set.page
+    css = template_set.styles.render(**context)
+    prune = settings.CSS_PRUNING if prune_css is None else prune_css
+    stats = None
+    excluded = 0.0
+
+    if prune:
+        context["css"] = CSS_SENTINEL
+        html = template.render(**context)
+        if CSS_SENTINEL in html:
+            prune_start = time.perf_counter()
+            css, stats = prune_unused_css(css, html)
+            excluded += time.perf_counter() - prune_start
+
+    minify_start = time.perf_counter()
     context["css"] = minify_css(css)
-    html = template.render(**context)
-    return {"html": html, "css": css}
+    excluded += time.perf_counter() - minify_start
+    if stats is not None:
+        html = html.replace(CSS_SENTINEL, context["css"])
+    else:
+        html = template.render(**context)
+    # La poda y la minificación se miden en sus propias etapas
+    _render_timer.observe(time.perf_counter() - start - excluded)
+
+    rendered = {"html": html, "css": css, "template_version": template_set.version}
+    if stats is not None:
+        rendered["css_stats"] = stats
+    return rendered
+
+def prune_unused_css(css: str, html: str) -> Tuple[str, dict]:
+    """CSS sin las reglas que no se aplican al HTML, cacheado por CSS y selectores de la página"""
+    return prune_css_with_features(css, extract_features(html))
+
+def prune_css_with_features(css: str, features: PageFeatures) -> Tuple[str, dict]:
+    with _prune_timer.time():
+        key = hashlib.md5(
+            "\0".join([css, *sorted(features.tags), "#", *sorted(features.classes), "#", *sorted(features.ids)]).encode()
+        ).hexdigest()
+        cached = _prune_cache.get(key)
+        if cached:
+            pruned, stats = json.loads(cached)
+        else:
+            pruned, prune_stats = prune_css_for(css, features)
+            stats = prune_stats.to_dict()
+            _prune_cache.set(key, json.dumps([pruned, stats]))
+    CSS_PRUNED_BYTES.inc(stats["saved_bytes"])
+    return pruned, stats
 
 def minify_css(css: str) -> str:
-    return rcssmin.cssmin(css)
+    import rcssmin
+    with _minify_timer.time():
+        return rcssmin.cssmin(css)
+
+def get_css_template(template_name: str):
+    return get_template_set(template_name).styles
 
 def get_template_css(template_name: str, context: dict) -> str:
-    css_template = env.get_template(f"{template_name}_style.html")
-    return css_template.render(**context)
+    return get_css_template(template_name).render(**context)
@@ -1,42 +1,456 @@
-import httpx
 import asyncio
-from typing import Dict
-from datetime import datetime
+import hashlib
+import hmac
+import logging
+import random
+import time
+from collections.abc import MutableMapping
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
 from app.models.schemas import WebhookConfig, GenerationEvent
+from app.services.outbox import outbox, OutboxRecord
+from app.services.circuit_breaker import get_health
+from app.core.config import settings
+from app.core.metrics import counter, gauge, histogram, stage_timer
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+# Métricas de entrega
+WEBHOOK_DELIVERIES = counter(
+    "frontpage_webhook_deliveries_total", "Intentos de entrega de webhooks por resultado", ("result",)
+)
+_delivered = WEBHOOK_DELIVERIES.labels(result="success")
+_failed = WEBHOOK_DELIVERIES.labels(result="failure")
+_postponed = WEBHOOK_DELIVERIES.labels(result="postponed")
+WEBHOOK_RETRIES = counter("frontpage_webhook_retries_total", "Entregas reintentadas desde el outbox")
+WEBHOOK_DEAD_LETTERS = counter("frontpage_webhook_dead_letters_total", "Entregas movidas a mensajes muertos")
+WEBHOOK_DELIVERY_SECONDS = histogram("frontpage_webhook_delivery_seconds", "Duración de cada envío HTTP de webhook")
+WEBHOOK_INFLIGHT = gauge("frontpage_webhook_inflight", "Envíos de webhooks en curso")
+_fanout_timer = stage_timer("webhook_fanout")
+
+class WebhookRegistry(MutableMapping):
+    """Webhooks registrados, con un índice por tipo de template y estado.
+
+    Cada webhook activo se indexa bajo (template, estado), usando None como
+    comodín cuando no filtra por ese campo. Un evento solo consulta las cuatro
+    combinaciones posibles, así que el coste depende de los suscriptores que
+    coinciden y no del total registrado.
+    """
+
+    def __init__(self, initial: Optional[Dict[str, WebhookConfig]] = None):
+        self._webhooks: Dict[str, WebhookConfig] = {}
+        self._index: Dict[Tuple[Optional[str], Optional[str]], Dict[str, WebhookConfig]] = {}
+        if initial:
+            self.update(initial)
+
+    @staticmethod
+    def _keys(webhook: WebhookConfig) -> List[Tuple[Optional[str], Optional[str]]]:
+        templates = [t.value for t in webhook.templates] if webhook.templates else [None]
+        statuses = list(webhook.statuses) if webhook.statuses else [None]
+        return [(template, status) for template in templates for status in statuses]
+
+    def _unindex(self, webhook_id: str, webhook: WebhookConfig):
+        for key in self._keys(webhook):
+            bucket = self._index.get(key)
+            if bucket is not None:
+                bucket.pop(webhook_id, None)
+                if not bucket:
+                    del self._index[key]
+
+    def __getitem__(self, webhook_id: str) -> WebhookConfig:
+        return self._webhooks[webhook_id]
+
+    def __setitem__(self, webhook_id: str, webhook: WebhookConfig):
+        previous = self._webhooks.get(webhook_id)
+        if previous is not None:
+            self._unindex(webhook_id, previous)
+        self._webhooks[webhook_id] = webhook
+        if webhook.active:
+            for key in self._keys(webhook):
+                self._index.setdefault(key, {})[webhook_id] = webhook
+
+    def __delitem__(self, webhook_id: str):
+        webhook = self._webhooks.pop(webhook_id)
+        self._unindex(webhook_id, webhook)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._webhooks)
+
+    def __len__(self) -> int:
+        return len(self._webhooks)
+
+    def match(self, template_type: str, status: str) -> List[Tuple[str, WebhookConfig]]:
+        """Webhooks activos suscritos a un tipo de template y estado"""
+        matches: Dict[str, WebhookConfig] = {}
+        for key in ((template_type, status), (template_type, None), (None, status), (None, None)):
+            bucket = self._index.get(key)
+            if bucket:
+                matches.update(bucket)
+        return list(matches.items())
+
+def is_sampled(webhook_id: str, event_id: str, sample_rate: float) -> bool:
+    """Muestreo determinista: la decisión es la misma en reintentos y reinicios"""
+    if sample_rate >= 1:
+        return True
+    digest = hashlib.blake2b(f"{webhook_id}:{event_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64 < sample_rate
 
 # Almacenamiento de webhooks (en memoria para este ejemplo)
-webhooks: Dict[str, WebhookConfig] = {}
+webhooks = WebhookRegistry()
+
+# Transporte HTTP alternativo (por ejemplo, httpx.MockTransport en benchmarks)
+http_transport: Optional["httpx.AsyncBaseTransport"] = None
+
+# Cliente HTTP compartido por todas las entregas del event loop actual
+_client: Optional["httpx.AsyncClient"] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Configuración serializada de cada webhook, reutilizada mientras no cambie
+_config_snapshots: Dict[str, Tuple[WebhookConfig, str]] = {}
+
+SIGNATURE_HEADER = "X-Webhook-Signature"
+
+def sign_payload(secret: str, body: bytes) -> str:
+    """Firma HMAC-SHA256 del cuerpo exacto que se envía"""
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+def verify_signature(secret: str, body: bytes, signature: str) -> bool:
+    """Comprueba la cabecera de firma recibida por un receptor"""
+    return hmac.compare_digest(sign_payload(secret, body), signature or "")
+
+def max_backoff(attempts: int) -> float:
+    """Cota superior de `compute_backoff(attempts)`"""
+    return min(settings.WEBHOOK_BACKOFF_MAX, settings.WEBHOOK_BACKOFF_BASE * 2 ** (attempts - 1))
+
+def compute_backoff(attempts: int) -> float:
+    """Espera exponencial con jitter antes del intento siguiente a `attempts`"""
+    delay = max_backoff(attempts)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def _delivery_lease(webhook: Optional[WebhookConfig] = None) -> float:
+    """Tiempo durante el cual una entrega en curso no se reintenta desde el outbox"""
+    lease = settings.WEBHOOK_TIMEOUT * 2
+    if webhook is not None and webhook.batch_max_events:
+        lease += webhook.batch_linger_ms / 1000
+    return lease
+
+def _resolve_webhook(record: OutboxRecord) -> WebhookConfig:
+    """Configuración vigente del webhook, o la registrada al generar el evento"""
+    current = webhooks.get(record.webhook_id)
+    if current is not None:
+        return current
+    return WebhookConfig.model_validate_json(record.webhook)
+
+def _config_snapshot(webhook_id: str, webhook: WebhookConfig) -> str:
+    cached = _config_snapshots.get(webhook_id)
+    if cached is not None and cached[0] is webhook:
+        return cached[1]
+    snapshot = webhook.model_dump_json()
+    _config_snapshots[webhook_id] = (webhook, snapshot)
+    return snapshot
+
+def _get_client() -> "httpx.AsyncClient":
+    """Cliente compartido para reutilizar conexiones entre entregas"""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        # httpx se importa con la primera entrega: la mayoría de arranques no la necesitan
+        import httpx
+        _client = httpx.AsyncClient(transport=http_transport)
+        _client_loop = loop
+    return _client
+
+async def close_client():
+    global _client, _client_loop
+    if _client is not None and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+async def _post(webhook: WebhookConfig, body: bytes, timeout: float):
+    """Realiza un único intento de entrega"""
+    headers = {"Content-Type": "application/json"}
+    if webhook.secret:
+        headers[SIGNATURE_HEADER] = sign_payload(webhook.secret, body)
+
+    response = await _get_client().post(
+        str(webhook.url),
+        content=body,
+        headers=headers,
+        timeout=timeout
+    )
+    response.raise_for_status()
+
+async def deliver(webhook: WebhookConfig, records: List[OutboxRecord]) -> bool:
+    """Entrega uno o varios registros del outbox y actualiza su estado"""
+    if webhook.batch_max_events:
+        body = b"[" + b",".join(record.body for record in records) + b"]"
+    else:
+        body = records[0].body
+
+    health = get_health(records[0].webhook_id)
+    if not health.allow_request():
+        # Circuito abierto: no se consume un intento, se espera a la siguiente prueba
+        _postponed.inc()
+        await outbox.postpone([record.id for record in records], time.time() + health.retry_after())
+        return False
+
+    start = time.perf_counter()
+    WEBHOOK_INFLIGHT.inc()
+    try:
+        await _post(webhook, body, timeout=health.timeout)
+    except Exception as e:
+        elapsed = time.perf_counter() - start
+        WEBHOOK_DELIVERY_SECONDS.observe(elapsed)
+        _failed.inc()
+        error = str(e) or type(e).__name__
+        health.record_failure(error, elapsed)
+        await _handle_failure(webhook, records, error)
+        return False
+    except BaseException:
+        # Cancelado (petición o apagado): no dice nada del endpoint, pero la
+        # prueba del circuito semiabierto debe quedar libre. El registro sigue
+        # en el outbox y se reintenta al vencer su lease.
+        health.release_probe()
+        raise
+    finally:
+        WEBHOOK_INFLIGHT.dec()
 
-async def send_webhook(webhook: WebhookConfig, payload: GenerationEvent):
-    """Envía una notificación webhook con reintentos"""
-    async with httpx.AsyncClient() as client:
-        headers = {}
-        if webhook.secret:
-            headers["X-Webhook-Secret"] = webhook.secret
+    elapsed = time.perf_counter() - start
+    WEBHOOK_DELIVERY_SECONDS.observe(elapsed)
+    _delivered.inc()
+    health.record_success(elapsed)
+    await outbox.complete([record.id for record in records])
+    return True
 
-        max_retries = 3
-        for attempt in range(max_retries):
+async def _handle_failure(webhook: WebhookConfig, records: List[OutboxRecord], error: str):
+    """Reprograma un envío fallido o lo mueve a la cola de mensajes muertos"""
+    attempts = max(record.attempts for record in records) + 1
+    if attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+        logger.warning(
+            "Webhook %s failed after %d attempts, moving %d event(s) to dead letters: %s",
+            webhook.url, attempts, len(records), error
+        )
+        WEBHOOK_DEAD_LETTERS.inc(len(records))
+        await asyncio.gather(*(outbox.dead_letter(record, error) for record in records))
+        return
+
+    # Un mismo lote se reintenta junto para conservar su orden
+    retry_at = time.time() + compute_backoff(attempts)
+    logger.info("Webhook %s failed (attempt %d), retrying in %.1fs: %s",
+                webhook.url, attempts, retry_at - time.time(), error)
+    await asyncio.gather(*(outbox.reschedule(record, retry_at, error) for record in records))
+
+class WebhookBatcher:
+    """Acumula eventos por webhook y los envía en lotes por tamaño o tiempo"""
+
+    def __init__(self):
+        self.buffers: Dict[str, List[OutboxRecord]] = {}
+        self.sizes: Dict[str, int] = {}
+        self.configs: Dict[str, WebhookConfig] = {}
+        self.timers: Dict[str, asyncio.TimerHandle] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self._tasks = set()
+
+    async def add(self, webhook_id: str, webhook: WebhookConfig, record: OutboxRecord):
+        """Añade un evento al buffer del webhook y lo envía si se alcanza un límite"""
+        self.buffers.setdefault(webhook_id, []).append(record)
+        self.sizes[webhook_id] = self.sizes.get(webhook_id, 0) + len(record.body)
+        self.configs[webhook_id] = webhook
+
+        if (len(self.buffers[webhook_id]) >= webhook.batch_max_events
+                or self.sizes[webhook_id] >= webhook.batch_max_bytes):
+            # El envío sigue en segundo plano: la petición que llena el lote no espera al POST
+            self._flush_later(webhook_id)
+            return True
+
+        if webhook_id not in self.timers:
+            loop = asyncio.get_running_loop()
+            self.timers[webhook_id] = loop.call_later(
+                webhook.batch_linger_ms / 1000, self._flush_later, webhook_id
+            )
+        return True
+
+    def _flush_later(self, webhook_id: str):
+        # El lote se extrae ya: los eventos que lleguen después van al siguiente
+        self._spawn(self._send(webhook_id, *self._take(webhook_id)))
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _take(self, webhook_id: str) -> Tuple[Optional[WebhookConfig], Optional[List[OutboxRecord]]]:
+        timer = self.timers.pop(webhook_id, None)
+        if timer:
+            timer.cancel()
+        self.sizes.pop(webhook_id, None)
+        return self.configs.pop(webhook_id, None), self.buffers.pop(webhook_id, None)
+
+    async def flush(self, webhook_id: str) -> bool:
+        """Envía el lote pendiente de un webhook respetando el orden de llegada"""
+        return await self._send(webhook_id, *self._take(webhook_id))
+
+    async def _send(self, webhook_id: str, webhook: Optional[WebhookConfig], records: Optional[List[OutboxRecord]]) -> bool:
+        if not records:
+            return True
+        # El lote se extrae antes de esperar el lock, así los envíos de un
+        # mismo webhook salen en el mismo orden en que se cerraron los lotes
+        lock = self.locks.setdefault(webhook_id, asyncio.Lock())
+        async with lock:
+            return await deliver(webhook, records)
+
+    async def flush_all(self):
+        """Envía todos los lotes pendientes (por ejemplo, al apagar la aplicación)"""
+        pending = list(self.buffers)
+        if pending:
+            await asyncio.gather(*(self.flush(webhook_id) for webhook_id in pending))
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+batcher = WebhookBatcher()
+
+gauge(
+    "frontpage_webhook_batch_buffered_events",
+    "Eventos acumulados en lotes pendientes de envío",
+    function=lambda: sum(len(records) for records in batcher.buffers.values())
+)
+gauge(
+    "frontpage_webhook_outbox_write_queue",
+    "Operaciones esperando la siguiente transacción del outbox",
+    function=lambda: outbox.queued_writes
+)
+
+class RetryScheduler:
+    """Reintenta periódicamente las entregas vencidas del outbox"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> int:
+        """Procesa un bloque de entregas vencidas y devuelve cuántas se intentaron"""
+        records = await outbox.claim_due(settings.WEBHOOK_RETRY_BATCH, lease=_delivery_lease())
+        WEBHOOK_RETRIES.inc(len(records))
+        groups: Dict[str, List[OutboxRecord]] = {}
+        for record in records:
+            groups.setdefault(record.webhook_id, []).append(record)
+
+        tasks = []
+        for webhook_id, group in groups.items():
+            webhook = _resolve_webhook(group[0])
+            if not webhook.active:
+                tasks.append(_handle_failure(webhook, group, "webhook inactive"))
+            elif webhook.batch_max_events:
+                tasks.append(self._retry_batches(webhook_id, webhook, group))
+            else:
+                tasks.extend(deliver(webhook, [record]) for record in group)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        return len(records)
+
+    async def _retry_batches(self, webhook_id: str, webhook: WebhookConfig, records: List[OutboxRecord]):
+        """Reenvía los lotes de un webhook uno tras otro, bajo el mismo lock que los envíos en vivo"""
+        batches = _split_batches(webhook, records)
+        async with batcher.locks.setdefault(webhook_id, asyncio.Lock()):
+            for index, batch in enumerate(batches):
+                if await deliver(webhook, batch):
+                    continue
+                # Los lotes siguientes no adelantan al que falló: vencen después
+                # que su reintento y se reclaman juntos, por orden de id
+                rest = [record.id for later in batches[index + 1:] for record in later]
+                if rest:
+                    attempts = max(record.attempts for record in batch) + 1
+                    await outbox.postpone(rest, time.time() + max_backoff(attempts))
+                return
+
+    async def _run(self):
+        while True:
             try:
-                response = await client.post(
-                    str(webhook.url),
-                    json=payload.model_dump(),
-                    headers=headers,
-                    timeout=10.0
-                )
-                response.raise_for_status()
-                return True
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    print(f"Failed to send webhook to {webhook.url}: {str(e)}")
-                    return False
-                await asyncio.sleep(2 ** attempt)
+                processed = await self.run_once()
+            except Exception:
+                logger.exception("Webhook retry scheduler iteration failed")
+                processed = 0
+            # Si el bloque estaba lleno puede haber más entregas vencidas
+            if processed < settings.WEBHOOK_RETRY_BATCH:
+                await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+def _split_batches(webhook: WebhookConfig, records: List[OutboxRecord]) -> List[List[OutboxRecord]]:
+    """Divide los registros en lotes con los mismos límites que `WebhookBatcher`"""
+    batches: List[List[OutboxRecord]] = []
+    current: List[OutboxRecord] = []
+    size = 0
+    for record in records:
+        current.append(record)
+        size += len(record.body)
+        if len(current) >= webhook.batch_max_events or size >= webhook.batch_max_bytes:
+            batches.append(current)
+            current, size = [], 0
+    if current:
+        batches.append(current)
+    return batches
+
+retry_scheduler = RetryScheduler(settings.WEBHOOK_RETRY_INTERVAL)
 
 async def notify_generation_event(event: GenerationEvent):
-    """Notifica a todos los webhooks activos sobre un evento de generación"""
-    tasks = []
-    for webhook in webhooks.values():
-        if webhook.active:
-            tasks.append(send_webhook(webhook, event))
-    
-    if tasks:
-        await asyncio.gather(*tasks)
+    """Registra el evento en el outbox e inicia en segundo plano su entrega a los webhooks suscritos"""
+    with _fanout_timer.time():
+        await _notify(event)
+
+async def _notify(event: GenerationEvent):
+    targets = [
+        (webhook_id, webhook)
+        for webhook_id, webhook in webhooks.match(event.template_type, event.status)
+        if is_sampled(webhook_id, event.event_id, webhook.sample_rate)
+    ]
+    if not targets:
+        return
+
+    # El evento se serializa una sola vez; todas las entregas y reintentos
+    # reutilizan los mismos bytes
+    body = event.model_dump_json().encode()
+    records = await outbox.enqueue(
+        [(webhook_id, _config_snapshot(webhook_id, webhook), event.event_id, body) for webhook_id, webhook in targets],
+        lease=max(_delivery_lease(webhook) for _, webhook in targets)
+    )
+
+    # El evento ya es durable: las entregas siguen en segundo plano y la
+    # petición no espera a ningún endpoint
+    for (webhook_id, webhook), record in zip(targets, records):
+        if webhook.batch_max_events:
+            await batcher.add(webhook_id, webhook, record)
+        else:
+            _spawn_delivery(deliver(webhook, [record]))
+
+# Entregas iniciadas por `notify_generation_event` que siguen en curso
+_delivery_tasks = set()
+
+def _spawn_delivery(coro):
+    task = asyncio.ensure_future(coro)
+    _delivery_tasks.add(task)
+    task.add_done_callback(_delivery_tasks.discard)
+
+async def drain_deliveries():
+    """Espera a las entregas en segundo plano (por ejemplo, al apagar la aplicación)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        pending = [task for task in _delivery_tasks if task.get_loop() is loop]
+        if not pending:
+            return
+        await asyncio.gather(*pending, return_exceptions=True)
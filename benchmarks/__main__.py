@@ -0,0 +1,85 @@
+"""Ejecuta la suite de microbenchmarks.
+
+Uso:
+    python -m benchmarks run                      # ejecuta y muestra resultados
+    python -m benchmarks run --save               # guarda benchmarks/baselines/default.json
+    python -m benchmarks compare                  # compara con la línea base; sale con 1 si hay regresiones
+    python -m benchmarks compare --threshold 0.1 --filter renderer
+    python -m benchmarks list
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from benchmarks.suite import CASES, DEFAULT_BASELINE, compare, load_results, run_suite, save_results
+
+def _select(filters):
+    names = sorted(CASES)
+    if filters:
+        names = [name for name in names if any(f in name for f in filters)]
+    return names
+
+def _print_result(name, result):
+    if result is None:
+        print(f"{name:<42} skipped (template not available)")
+    else:
+        print(f"{name:<42} {result['median_us']:>12.2f} µs  (min {result['min_us']:.2f}, {result['loops']} loops)")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Microbenchmarks del pipeline de renderizado")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="ejecuta la suite")
+    run_parser.add_argument("--save", nargs="?", const=str(DEFAULT_BASELINE), default=None,
+                            help="guarda los resultados como JSON (por defecto la línea base)")
+
+    compare_parser = subparsers.add_parser("compare", help="ejecuta y compara con una línea base")
+    compare_parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    compare_parser.add_argument("--current", default=None, help="resultados ya guardados en lugar de ejecutar")
+    compare_parser.add_argument("--threshold", type=float, default=0.25,
+                                help="regresión máxima tolerada (0.25 = 25%% más lento)")
+    compare_parser.add_argument("--save", default=None, help="guarda también los resultados actuales")
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument("--filter", nargs="*", default=None, help="ejecuta solo los casos que contienen estos textos")
+        sub.add_argument("--samples", type=int, default=5)
+        sub.add_argument("--min-time", type=float, default=0.05, help="segundos mínimos por muestra")
+
+    subparsers.add_parser("list", help="lista los casos disponibles")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for name in sorted(CASES):
+            print(name)
+        return 0
+
+    if args.command == "compare" and args.current:
+        current = load_results(Path(args.current))
+    else:
+        current = run_suite(_select(args.filter), samples=args.samples, min_time=args.min_time, report=_print_result)
+
+    if args.save:
+        save_results(current, Path(args.save))
+        print(f"\nResultados guardados en {args.save}")
+
+    if args.command == "run":
+        return 0
+
+    baseline = load_results(Path(args.baseline))
+    rows = compare(baseline, current, threshold=args.threshold)
+    print(f"\n{'case':<42} {'baseline µs':>12} {'current µs':>12} {'change':>8}")
+    for row in rows:
+        change = f"{row['change'] * 100:+.1f}%" if row["change"] is not None else "new"
+        flag = "  REGRESSION" if row["regression"] else ""
+        baseline_us = f"{row['baseline_us']:.2f}" if row["baseline_us"] is not None else "-"
+        print(f"{row['name']:<42} {baseline_us:>12} {row['current_us']:>12.2f} {change:>8}{flag}")
+
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold * 100:.0f}%")
+        return 1
+    print("\nNo regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
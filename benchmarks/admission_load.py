@@ -0,0 +1,174 @@
+"""Prueba de carga del control de admisión de `/api/generate-frontpage`.
+
+Primero mide la saturación: cuántos renderizados en frío por segundo atiende
+la aplicación con `--concurrency` clientes en bucle cerrado. Después envía
+peticiones a ritmo fijo (bucle abierto) a `--factor` veces ese ritmo durante
+`--duration` segundos, con el control de admisión activado y desactivado, e
+informa de la latencia p50/p99 de las respuestas correctas y de los 503.
+
+Las peticiones se envían llamando directamente a la aplicación ASGI en el mismo
+proceso (sin cliente HTTP, cuyo coste enmascararía el del servidor) y sin límite
+de peticiones por IP.
+
+Uso:
+    python -m benchmarks.admission_load
+    python -m benchmarks.admission_load --factor 2 --duration 5 --users 10 --json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from typing import List
+
+from app.core import json_rate_limiter
+from app.core.admission import admission
+from app.core.auth import create_access_token
+from app.core.config import settings
+from main import app
+
+_counter = itertools.count()
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def _page() -> dict:
+    # Título único: cada petición es un renderizado en frío
+    return {"template": "minimal", "title": f"Carga {next(_counter)}", "subtitle": "Admisión", "primaryColor": "#007bff"}
+
+async def _post(headers: List[tuple]) -> int:
+    """POST a /api/generate-frontpage directamente sobre ASGI; devuelve el código de estado"""
+    body = json.dumps(_page()).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/api/generate-frontpage",
+        "raw_path": b"/api/generate-frontpage",
+        "root_path": "",
+        "query_string": b"",
+        "headers": headers + [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("app.local", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    status = 500
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+async def measure_saturation(headers: List[list], concurrency: int, duration: float) -> float:
+    """Peticiones por segundo con `concurrency` clientes enviando sin pausa"""
+    done = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(n: int):
+        nonlocal done
+        while time.perf_counter() < deadline:
+            if await _post(headers[n % len(headers)]) == 200:
+                done += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    return done / (time.perf_counter() - start)
+
+async def open_loop(headers: List[list], rate: float, duration: float) -> dict:
+    """Envía peticiones a ritmo fijo, sin esperar respuesta, y mide las latencias"""
+    latencies: List[float] = []
+    statuses = {}
+
+    async def request(n: int, arrival: float):
+        status = await _post(headers[n % len(headers)])
+        statuses[status] = statuses.get(status, 0) + 1
+        if status == 200:
+            # Desde la llegada prevista: incluye lo que la petición espera en el event loop
+            latencies.append(time.perf_counter() - arrival)
+
+    tasks = []
+    start = time.perf_counter()
+    for n in range(int(rate * duration)):
+        # Programar según el instante previsto para que los retrasos no reduzcan el ritmo
+        arrival = start + n / rate
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(request(n, arrival)))
+    await asyncio.gather(*tasks)
+    return {
+        "elapsed_s": round(time.perf_counter() - start, 2),
+        "sent": len(tasks),
+        "ok": statuses.get(200, 0),
+        "rejected_503": statuses.get(503, 0),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 1),
+    }
+
+async def run_load(
+    factor: float = 2.0,
+    duration: float = 5.0,
+    concurrency: int = 8,
+    calibrate: float = 2.0,
+    users: int = 5
+) -> dict:
+    """Ejecuta la prueba y devuelve el informe como diccionario"""
+    saved = settings.ADMISSION_ENABLED, json_rate_limiter.check_rate_limit
+    json_rate_limiter.check_rate_limit = lambda ip, limit=None: None
+    headers = [
+        [(b"authorization", f"Bearer {create_access_token({'sub': f'user-{n}'})}".encode())]
+        for n in range(users)
+    ]
+    try:
+        settings.ADMISSION_ENABLED = True
+        saturation = await measure_saturation(headers, concurrency, calibrate)
+        rate = saturation * factor
+        report = {"saturation_rps": round(saturation, 1), "offered_rps": round(rate, 1)}
+        report["admission"] = await open_loop(headers, rate, duration)
+        settings.ADMISSION_ENABLED = False
+        report["no_admission"] = await open_loop(headers, rate, duration)
+        report["latency_target_ms"] = admission.latency_target * 1000
+        return report
+    finally:
+        settings.ADMISSION_ENABLED, json_rate_limiter.check_rate_limit = saved
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--factor", type=float, default=2.0, help="carga respecto a la saturación")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=8, help="clientes para medir la saturación")
+    parser.add_argument("--calibrate", type=float, default=2.0, help="segundos para medir la saturación")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="imprime el informe como JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load(
+        factor=args.factor,
+        duration=args.duration,
+        concurrency=args.concurrency,
+        calibrate=args.calibrate,
+        users=args.users
+    ))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key:>18}: {value}")
+
+if __name__ == "__main__":
+    main()
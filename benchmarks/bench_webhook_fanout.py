@@ -0,0 +1,144 @@
+"""Coste del fan-out de webhooks según el número de suscriptores.
+
+Mide por separado la serialización/firma del payload (una vez por evento
+frente a una vez por suscriptor), el coste completo de
+`notify_generation_event` contra un transporte HTTP simulado y la búsqueda de
+suscriptores en el índice frente a un recorrido lineal.
+
+Uso:
+    python -m benchmarks.bench_webhook_fanout --subscribers 1 10 50 200 --events 200
+    python -m benchmarks.bench_webhook_fanout --lookup 100 1000 10000
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+from app.models.schemas import FrontPageRequest, GenerationEvent, TemplateType, WebhookConfig
+from app.services import webhooks as webhook_service
+from app.services.outbox import outbox
+
+def make_event(n: int) -> GenerationEvent:
+    request = FrontPageRequest(
+        title="Benchmark " * 9,
+        subtitle="Fan-out de webhooks " * 9,
+        primaryColor="#007bff",
+        customCss=".hero { color: #333; }" * 40,
+        metaDescription="Página generada para medir el coste del fan-out"
+    )
+    return GenerationEvent(
+        event_id=f"bench-{n}",
+        template_type=request.template.value,
+        timestamp=datetime.now().isoformat(),
+        status="success",
+        details=request.model_dump(mode="json")
+    )
+
+def _sign(secret: str, body: bytes) -> str:
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+def bench_encoding(subscribers: int, repeat: int) -> dict:
+    """µs por evento: serializar por suscriptor frente a serializar una vez"""
+    event = make_event(0)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for _ in range(subscribers):
+            _sign("secret", json.dumps(event.model_dump()).encode())
+    per_subscriber = (time.perf_counter() - start) / repeat * 1e6
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body = event.model_dump_json().encode()
+        for _ in range(subscribers):
+            _sign("secret", body)
+    once = (time.perf_counter() - start) / repeat * 1e6
+
+    return {"per_subscriber_us": per_subscriber, "encode_once_us": once}
+
+async def bench_fanout(subscribers: int, events: int) -> dict:
+    """Coste completo de notify_generation_event (outbox + entregas simuladas)"""
+    webhook_service.http_transport = httpx.MockTransport(lambda request: httpx.Response(200))
+    webhook_service.webhooks.clear()
+    for i in range(subscribers):
+        webhook_service.webhooks[f"wh-{i}"] = WebhookConfig(
+            url=f"http://receiver.local/webhook/{i}", secret=f"secret-{i}"
+        )
+
+    payloads = [make_event(n) for n in range(events)]
+    start = time.perf_counter()
+    for event in payloads:
+        await webhook_service.notify_generation_event(event)
+    # Las entregas siguen en segundo plano: se incluyen en el coste
+    await webhook_service.drain_deliveries()
+    elapsed = time.perf_counter() - start
+    await webhook_service.close_client()
+
+    return {
+        "per_event_ms": elapsed / events * 1e3,
+        "per_delivery_us": elapsed / (events * subscribers) * 1e6,
+    }
+
+def bench_lookup(registered: int, repeat: int) -> dict:
+    """µs por evento para encontrar suscriptores cuando cada uno filtra un template"""
+    templates = list(TemplateType)
+    registry = webhook_service.WebhookRegistry({
+        f"wh-{i}": WebhookConfig(url=f"http://receiver.local/{i}", templates=[templates[i % len(templates)]])
+        for i in range(registered)
+    })
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        linear = [
+            (webhook_id, webhook) for webhook_id, webhook in registry.items()
+            if webhook.active and TemplateType.minimal in webhook.templates
+        ]
+    linear_us = (time.perf_counter() - start) / repeat * 1e6
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        indexed = registry.match("minimal", "success")
+    indexed_us = (time.perf_counter() - start) / repeat * 1e6
+
+    assert len(linear) == len(indexed)
+    return {"matches": len(indexed), "linear_us": linear_us, "indexed_us": indexed_us}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--lookup", type=int, nargs="*", default=None,
+                        help="mide solo la búsqueda de suscriptores para estos totales registrados")
+    args = parser.parse_args()
+
+    if args.lookup is not None:
+        print(f"{'registered':>10} {'matches':>8} {'linear µs':>10} {'indexed µs':>11}")
+        for registered in args.lookup or [100, 1000, 10000]:
+            result = bench_lookup(registered, args.repeat)
+            print(f"{registered:>10} {result['matches']:>8} {result['linear_us']:>10.1f} {result['indexed_us']:>11.1f}")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox.close()
+        outbox.path = str(Path(tmp) / "outbox.db")
+
+        print(f"{'subs':>6} {'encode/sub µs':>14} {'encode once µs':>15} {'fan-out ms/evt':>15} {'µs/delivery':>12}")
+        for subscribers in args.subscribers:
+            encoding = bench_encoding(subscribers, args.repeat)
+            fanout = asyncio.run(bench_fanout(subscribers, args.events))
+            print(
+                f"{subscribers:>6} {encoding['per_subscriber_us']:>14.1f} {encoding['encode_once_us']:>15.1f} "
+                f"{fanout['per_event_ms']:>15.2f} {fanout['per_delivery_us']:>12.1f}"
+            )
+        outbox.close()
+
+if __name__ == "__main__":
+    main()
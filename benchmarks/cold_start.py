@@ -0,0 +1,123 @@
+"""Informe de arranque en frío.
+
+Lanza un intérprete nuevo con `-X importtime`, importa `main`, arranca el
+lifespan y sirve una primera petición. Devuelve el tiempo de cada import
+(propio y acumulado, en ms) y los tiempos hasta la aplicación importada y la
+primera respuesta.
+
+Uso:
+    python -m benchmarks.cold_start              # 25 imports más costosos
+    python -m benchmarks.cold_start --top 50 --own
+    python -m benchmarks.cold_start --budget     # sale con 1 si se supera el presupuesto
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, NamedTuple
+
+ROOT = Path(__file__).parent.parent
+
+# Presupuestos de arranque en frío (ms); dependen de la máquina
+OWN_IMPORT_BUDGET_MS = float(os.environ.get("COLD_START_OWN_BUDGET_MS", 150))
+FIRST_RESPONSE_BUDGET_MS = float(os.environ.get("COLD_START_BUDGET_MS", 3000))
+
+# Dependencias que solo deben cargarse en el primer uso
+LAZY_MODULES = ("jose", "passlib", "bcrypt", "httpx", "jinja2", "rcssmin", "uvicorn", "aioredis", "fastapi_limiter", "PIL")
+
+_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+loaded_lazy = [name for name in %r if name in sys.modules]
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    status = client.get("/metrics").status_code
+first_response = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_response_ms": (first_response - start) * 1000,
+    "status": status,
+    "loaded_lazy": loaded_lazy,
+}))
+"""
+
+class ImportTiming(NamedTuple):
+    module: str
+    self_ms: float
+    cumulative_ms: float
+    depth: int
+
+def parse_importtime(output: str) -> List[ImportTiming]:
+    """Convierte la salida de `-X importtime` en una lista de tiempos"""
+    timings = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        timings.append(ImportTiming(name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000, depth))
+    return timings
+
+def measure_cold_start() -> dict:
+    """Mide un arranque en frío en un proceso nuevo"""
+    script = _SCRIPT % (LAZY_MODULES,)
+    # El lifespan abre el outbox y la caché de imágenes: fuera del repositorio
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "WEBHOOK_OUTBOX_PATH": os.path.join(tmp, "webhook_outbox.db"),
+            "IMAGE_CACHE_DIR": os.path.join(tmp, "image_cache"),
+        }
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", script],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    imports = parse_importtime(result.stderr)
+    # Solo interesa lo importado por `main`, no lo que carga el TestClient después
+    main_index = next(i for i, timing in enumerate(imports) if timing.module == "main" and timing.depth == 0)
+    report["imports"] = imports[:main_index + 1]
+    report["own_ms"] = sum(t.self_ms for t in report["imports"] if _is_own(t.module))
+    return report
+
+def _is_own(module: str) -> bool:
+    return module == "main" or module == "app" or module.startswith("app.")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.cold_start", description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--own", action="store_true", help="solo módulos de la aplicación")
+    parser.add_argument("--budget", action="store_true",
+                        help="falla si se supera COLD_START_OWN_BUDGET_MS o COLD_START_BUDGET_MS")
+    args = parser.parse_args(argv)
+
+    report = measure_cold_start()
+    imports = [t for t in report["imports"] if _is_own(t.module)] if args.own else report["imports"]
+    print(f"{'module':<48} {'self ms':>9} {'cumulative ms':>14}")
+    for timing in sorted(imports, key=lambda t: t.self_ms, reverse=True)[:args.top]:
+        print(f"{timing.module:<48} {timing.self_ms:>9.1f} {timing.cumulative_ms:>14.1f}")
+    print(f"\nimport main:        {report['import_ms']:.1f} ms (own modules {report['own_ms']:.1f} ms)")
+    print(f"first response:     {report['first_response_ms']:.1f} ms")
+    if report["loaded_lazy"]:
+        print(f"loaded at startup:  {', '.join(report['loaded_lazy'])}")
+
+    if args.budget:
+        failures = []
+        if report["loaded_lazy"]:
+            failures.append("lazy dependencies loaded at startup")
+        if report["own_ms"] >= OWN_IMPORT_BUDGET_MS:
+            failures.append(f"own imports {report['own_ms']:.1f} ms >= {OWN_IMPORT_BUDGET_MS:.0f} ms")
+        if report["first_response_ms"] >= FIRST_RESPONSE_BUDGET_MS:
+            failures.append(f"first response {report['first_response_ms']:.1f} ms >= {FIRST_RESPONSE_BUDGET_MS:.0f} ms")
+        if failures:
+            print(f"\nbudget exceeded: {'; '.join(failures)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+"""Microbenchmarks del pipeline de renderizado.
+
+Cada caso se registra con `@benchmark(nombre)` y es una función de preparación
+que devuelve la operación a medir (sin argumentos). El runner calibra el número
+de iteraciones, toma varias muestras y guarda la mediana y el mínimo por
+operación. Los resultados se guardan como JSON y pueden compararse con una línea
+base para detectar regresiones.
+"""
+import json
+import platform
+import statistics
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BASELINES_DIR = Path(__file__).parent / "baselines"
+DEFAULT_BASELINE = BASELINES_DIR / "default.json"
+
+# Casos registrados: nombre -> función de preparación
+CASES: Dict[str, Callable[[ExitStack], Callable[[], object]]] = {}
+
+def benchmark(name: str):
+    """Registra un caso de benchmark"""
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+def _context(**overrides) -> dict:
+    context = {
+        "template": "minimal",
+        "title": "Benchmark Title",
+        "subtitle": "Midiendo el pipeline de renderizado",
+        "primaryColor": "#007bff",
+        "secondaryColor": "#ffffff",
+        "fontFamily": "Roboto, sans-serif",
+        "heroImage": None,
+        "imagePosition": None,
+        "customCss": ".hero { color: #333; }" * 20,
+        "metaDescription": "Página de prueba",
+    }
+    context.update(overrides)
+    return context
+
+def _isolated_cache(stack: ExitStack):
+    """Vacía el caché de renderizado y lo restaura al terminar el caso"""
+    from app.services.renderer import cache
+
+    saved = (cache.cache.copy(), cache.expiry.copy())
+    cache.cache.clear()
+    cache.expiry.clear()
+
+    def restore():
+        cache.cache.clear()
+        cache.expiry.clear()
+        cache.cache.update(saved[0])
+        cache.expiry.update(saved[1])
+    stack.callback(restore)
+    return cache
+
+# Renderizado
+
+@benchmark("renderer.get_cache_key")
+def bench_get_cache_key(stack):
+    from app.services.renderer import get_cache_key
+    context = _context()
+    return lambda: get_cache_key("minimal", context)
+
+@benchmark("renderer.get_cached_render.hit")
+def bench_cached_render_hit(stack):
+    from app.services.renderer import get_cached_render
+    _isolated_cache(stack)
+    context = _context()
+    get_cached_render("minimal", dict(context))
+    return lambda: get_cached_render("minimal", dict(context))
+
+@benchmark("renderer.get_cached_render.miss")
+def bench_cached_render_miss(stack):
+    from app.services.renderer import get_cached_render
+    _isolated_cache(stack)
+    counter = iter(range(10 ** 9))
+    return lambda: get_cached_render("minimal", _context(title=f"Miss {next(counter)}"))
+
+def _available_templates() -> List[str]:
+    from app.models.schemas import TemplateType
+    from app.services.renderer import templates_dir
+    return [t.value for t in TemplateType if (templates_dir / f"{t.value}.html").exists()]
+
+def _register_render_cases():
+    from app.models.schemas import TemplateType
+    for template_type in TemplateType:
+        def setup(stack, name=template_type.value):
+            from app.services.renderer import render_template
+            if name not in _available_templates():
+                return None
+            context = _context(template=name)
+            return lambda: render_template(name, dict(context))
+        benchmark(f"renderer.render_template.{template_type.value}")(setup)
+
+_register_render_cases()
+
+@benchmark("renderer.minify_css")
+def bench_minify_css(stack):
+    from app.services.renderer import get_template_css, minify_css
+    css = get_template_css("minimal", _context())
+    return lambda: minify_css(css)
+
+@benchmark("renderer.prune_css")
+def bench_prune_css(stack):
+    from app.services.css_pruner import prune_css
+    from app.services.renderer import get_template_css, render_template
+    context = _context(customCss=".sidebar { width: 200px; } .hero { color: #333; }" * 10)
+    html = render_template("minimal", dict(context), prune_css=False)["html"]
+    css = get_template_css("minimal", context)
+    return lambda: prune_css(css, html)
+
+# Caché en memoria
+
+@benchmark("cache.get.hit")
+def bench_cache_get_hit(stack):
+    from app.services.renderer import MemoryCache
+    cache = MemoryCache(max_size=1000)
+    for i in range(1000):
+        cache.set(f"key-{i}", "value", ttl=3600)
+    return lambda: cache.get("key-500")
+
+@benchmark("cache.get.miss")
+def bench_cache_get_miss(stack):
+    from app.services.renderer import MemoryCache
+    cache = MemoryCache(max_size=1000)
+    return lambda: cache.get("missing")
+
+@benchmark("cache.set.evict")
+def bench_cache_set_evict(stack):
+    from app.services.renderer import MemoryCache
+    cache = MemoryCache(max_size=1000)
+    counter = iter(range(10 ** 9))
+    for _ in range(1000):
+        cache.set(f"key-{next(counter)}", "value", ttl=3600)
+    return lambda: cache.set(f"key-{next(counter)}", "value", ttl=3600)
+
+# Límite de peticiones y autenticación
+
+@benchmark("rate_limiter.check_rate_limit")
+def bench_check_rate_limit(stack):
+    from app.core import json_rate_limiter
+
+    tmp = stack.enter_context(tempfile.TemporaryDirectory())
+    saved = json_rate_limiter.RATE_LIMIT_FILE
+    json_rate_limiter.RATE_LIMIT_FILE = str(Path(tmp) / "rate_limit.json")
+    stack.callback(setattr, json_rate_limiter, "RATE_LIMIT_FILE", saved)
+
+    # Fichero con el tamaño típico de una hora de tráfico
+    now = time.time()
+    json_rate_limiter.save_rate_limit_data({
+        f"10.0.{i // 256}.{i % 256}": {"count": 1, "last_request": now} for i in range(1000)
+    })
+    counter = iter(range(10 ** 9))
+    return lambda: json_rate_limiter.check_rate_limit(f"10.1.0.{next(counter) % 50}")
+
+@benchmark("auth.decode_access_token")
+def bench_decode_access_token(stack):
+    from app.core.auth import create_access_token, decode_access_token
+    token = create_access_token({"sub": "benchmark"})
+    return lambda: decode_access_token(token)
+
+# Previsualizaciones
+
+def _fill_previews(stack, size: int, expired_ratio: float):
+    from app.api import endpoints
+    from app.services.renderer import PreviewData
+
+    saved = dict(endpoints.preview_storage)
+    stack.callback(lambda: (endpoints.preview_storage.clear(), endpoints.preview_storage.update(saved)))
+    endpoints.preview_storage.clear()
+
+    past = datetime.now() - timedelta(days=2)
+    expired = int(size * expired_ratio)
+    for i in range(size):
+        preview = PreviewData(html="<h1>Preview</h1>", css="h1{color:red}")
+        if i < expired:
+            preview.expires_at = past
+        endpoints.preview_storage[f"token-{i}"] = preview
+    return endpoints
+
+@benchmark("previews.store")
+def bench_preview_store(stack):
+    from app.services.renderer import PreviewData
+    endpoints = _fill_previews(stack, 10000, 0)
+    counter = iter(range(10 ** 9))
+    return lambda: endpoints.preview_storage.__setitem__(
+        f"new-{next(counter)}", PreviewData(html="<h1>Preview</h1>", css="h1{color:red}")
+    )
+
+@benchmark("previews.cleanup.10k")
+def bench_preview_cleanup(stack):
+    endpoints = _fill_previews(stack, 10000, 0)
+    return endpoints.cleanup_expired_previews
+
+# Instrumentación
+
+@benchmark("metrics.histogram.observe")
+def bench_histogram_observe(stack):
+    from app.core.metrics import Histogram
+    child = Histogram("bench_seconds", "bench", ("stage",)).labels(stage="render")
+    return lambda: child.observe(0.0012)
+
+@benchmark("metrics.stage_timer")
+def bench_stage_timer(stack):
+    from app.core.metrics import Histogram
+    child = Histogram("bench_seconds", "bench", ("stage",)).labels(stage="render")
+
+    def timed():
+        with child.time():
+            pass
+    return timed
+
+# Runner
+
+def _autorange(operation: Callable[[], object], min_time: float) -> int:
+    """Número de iteraciones para que una muestra dure al menos `min_time`"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            operation()
+        if time.perf_counter() - start >= min_time:
+            return loops
+        loops *= 2
+
+def run_case(name: str, samples: int = 5, min_time: float = 0.05) -> Optional[dict]:
+    """Ejecuta un caso y devuelve sus estadísticas en µs por operación"""
+    with ExitStack() as stack:
+        operation = CASES[name](stack)
+        if operation is None:
+            return None
+        loops = _autorange(operation, min_time)
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            for _ in range(loops):
+                operation()
+            timings.append((time.perf_counter() - start) / loops * 1e6)
+    return {
+        "median_us": round(statistics.median(timings), 3),
+        "min_us": round(min(timings), 3),
+        "loops": loops,
+        "samples": samples,
+    }
+
+def run_suite(names: Optional[List[str]] = None, samples: int = 5, min_time: float = 0.05,
+              report: Optional[Callable[[str, Optional[dict]], None]] = None) -> dict:
+    """Ejecuta los casos indicados (o todos) y devuelve el documento de resultados"""
+    results = {}
+    skipped = []
+    for name in names if names is not None else sorted(CASES):
+        result = run_case(name, samples=samples, min_time=min_time)
+        if result is None:
+            skipped.append(name)
+        else:
+            results[name] = result
+        if report:
+            report(name, result)
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+
+def compare(baseline: dict, current: dict, threshold: float = 0.25) -> List[dict]:
+    """Compara las medianas con la línea base; `regression` indica si supera el umbral"""
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            rows.append({"name": name, "baseline_us": None, "current_us": result["median_us"],
+                         "change": None, "regression": False})
+            continue
+        change = result["median_us"] / base["median_us"] - 1 if base["median_us"] else 0.0
+        rows.append({
+            "name": name,
+            "baseline_us": base["median_us"],
+            "current_us": result["median_us"],
+            "change": change,
+            "regression": change > threshold,
+        })
+    return rows
+
+def load_results(path: Path) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_results(results: dict, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
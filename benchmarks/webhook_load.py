@@ -0,0 +1,232 @@
+"""Prueba de carga reproducible de la entrega de webhooks.
+
+Registra N webhooks, genera M eventos con `notify_generation_event` y espera a
+que el outbox quede vacío. Por defecto el receptor es `webhook_receiver.app`
+ejecutado en el mismo proceso (transporte ASGI); con `--url` se usa un
+receptor real, por ejemplo `python webhook_receiver.py --quiet`.
+
+Uso:
+    python -m benchmarks.webhook_load --webhooks 20 --events 500 --latency-ms 5 --error-rate 0.05
+    python -m benchmarks.webhook_load --url http://127.0.0.1:8001/webhook --webhooks 10 --events 200
+"""
+import argparse
+import asyncio
+import json
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+import webhook_receiver
+from app.core.config import settings
+from app.models.schemas import GenerationEvent, WebhookConfig
+from app.services import circuit_breaker
+from app.services import webhooks as webhook_service
+from app.services.outbox import outbox
+
+class LoadTransport(httpx.AsyncBaseTransport):
+    """Transporte que mide entregas, fallos y el retraso de cada evento"""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, enforce_timeouts: bool):
+        self.inner = inner
+        self.enforce_timeouts = enforce_timeouts
+        self.sent_at: Dict[str, float] = {}
+        self.lags: List[float] = []
+        self.attempts = 0
+        self.failures = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.attempts += 1
+        body = request.content
+        try:
+            if self.enforce_timeouts:
+                # El transporte ASGI no aplica timeouts; se emulan aquí
+                timeout = request.extensions.get("timeout", {}).get("read")
+                response = await asyncio.wait_for(self.inner.handle_async_request(request), timeout)
+            else:
+                response = await self.inner.handle_async_request(request)
+            await response.aread()
+        except Exception:
+            self.failures += 1
+            raise
+
+        if response.status_code < 300:
+            now = time.perf_counter()
+            payload = json.loads(body)
+            for event in payload if isinstance(payload, list) else [payload]:
+                self.lags.append(now - self.sent_at[event["event_id"]])
+        else:
+            self.failures += 1
+        return response
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def _make_event(n: int) -> GenerationEvent:
+    return GenerationEvent(
+        event_id=f"load-{n}",
+        template_type="minimal",
+        timestamp=datetime.now().isoformat(),
+        status="success",
+        details={"title": "Load test", "subtitle": "Webhook delivery", "primaryColor": "#007bff"}
+    )
+
+async def run_load(
+    webhooks: int = 10,
+    events: int = 100,
+    concurrency: int = 10,
+    latency_ms: float = 0,
+    error_rate: float = 0,
+    drip_ms: float = 0,
+    batch_max_events: Optional[int] = None,
+    url: Optional[str] = None,
+    drain_timeout: float = 60.0,
+    trace_memory: bool = False
+) -> dict:
+    """Ejecuta una prueba de carga y devuelve el informe como diccionario"""
+    saved_settings = {
+        name: getattr(settings, name)
+        for name in ("WEBHOOK_BACKOFF_BASE", "WEBHOOK_BACKOFF_MAX", "WEBHOOK_RETRY_INTERVAL", "WEBHOOK_MAX_ATTEMPTS")
+    }
+    saved_state = (
+        webhook_service.webhooks, webhook_service.http_transport,
+        webhook_service.batcher, circuit_breaker.endpoint_health, outbox.path
+    )
+    saved_behavior = dict(webhook_receiver.behavior)
+
+    tmp = tempfile.TemporaryDirectory()
+    try:
+        # Reintentos rápidos para que la prueba termine en segundos
+        settings.WEBHOOK_BACKOFF_BASE = 0.05
+        settings.WEBHOOK_BACKOFF_MAX = 1.0
+        settings.WEBHOOK_RETRY_INTERVAL = 0.05
+        settings.WEBHOOK_MAX_ATTEMPTS = 10
+        outbox.close()
+        outbox.path = str(Path(tmp.name) / "outbox.db")
+        circuit_breaker.endpoint_health = {}
+        webhook_service.batcher = webhook_service.WebhookBatcher()
+
+        if url:
+            transport = LoadTransport(httpx.AsyncHTTPTransport(), enforce_timeouts=False)
+            targets = [url] * webhooks
+        else:
+            webhook_receiver.configure(latency_ms=latency_ms, error_rate=error_rate, drip_ms=drip_ms, verbose=False)
+            webhook_receiver.reset()
+            inner = httpx.ASGITransport(app=webhook_receiver.app)
+            transport = LoadTransport(inner, enforce_timeouts=True)
+            targets = [f"http://receiver.local/webhook?subscriber={i}" for i in range(webhooks)]
+
+        webhook_service.http_transport = transport
+        webhook_service.webhooks = webhook_service.WebhookRegistry({
+            f"load-{i}": WebhookConfig(url=target, secret=f"secret-{i}", batch_max_events=batch_max_events, batch_linger_ms=50)
+            for i, target in enumerate(targets)
+        })
+
+        scheduler = webhook_service.RetryScheduler(settings.WEBHOOK_RETRY_INTERVAL)
+        scheduler.start()
+        if trace_memory:
+            # tracemalloc ralentiza bastante la ejecución; solo bajo demanda
+            tracemalloc.start()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def generate(n: int):
+            async with semaphore:
+                event = _make_event(n)
+                transport.sent_at[event.event_id] = time.perf_counter()
+                await webhook_service.notify_generation_event(event)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(generate(n) for n in range(events)))
+        generation_time = time.perf_counter() - start
+
+        # Esperar a que los reintentos vacíen el outbox
+        deadline = time.perf_counter() + drain_timeout
+        while time.perf_counter() < deadline:
+            await webhook_service.batcher.flush_all()
+            await webhook_service.drain_deliveries()
+            if await outbox.pending_count() == 0:
+                break
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - start
+
+        await scheduler.stop()
+        peak_memory = None
+        if trace_memory:
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        pending = await outbox.pending_count()
+        dead_letters = len(await outbox.list_dead_letters(limit=events * webhooks))
+        await webhook_service.close_client()
+
+        delivered = len(transport.lags)
+        return {
+            "webhooks": webhooks,
+            "events": events,
+            "expected_deliveries": events * webhooks,
+            "delivered": delivered,
+            "pending": pending,
+            "dead_letters": dead_letters,
+            "attempts": transport.attempts,
+            "retries": transport.failures,
+            "generation_s": round(generation_time, 3),
+            "elapsed_s": round(elapsed, 3),
+            "deliveries_per_s": round(delivered / elapsed, 1) if elapsed else 0.0,
+            "lag_p50_ms": round(_percentile(transport.lags, 50) * 1000, 2),
+            "lag_p99_ms": round(_percentile(transport.lags, 99) * 1000, 2),
+            "lag_mean_ms": round(statistics.fmean(transport.lags) * 1000, 2) if transport.lags else 0.0,
+            "peak_traced_memory_kb": round(peak_memory / 1024, 1) if peak_memory is not None else None,
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "receiver_buffered": len(webhook_receiver.received_events),
+        }
+    finally:
+        for name, value in saved_settings.items():
+            setattr(settings, name, value)
+        outbox.close()
+        (webhook_service.webhooks, webhook_service.http_transport,
+         webhook_service.batcher, circuit_breaker.endpoint_health, outbox.path) = saved_state
+        webhook_receiver.behavior.update(saved_behavior)
+        tmp.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--webhooks", type=int, default=10)
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--drip-ms", type=float, default=0)
+    parser.add_argument("--batch", type=int, default=None, help="batch_max_events de cada webhook")
+    parser.add_argument("--url", default=None, help="receptor externo en lugar del ASGI en proceso")
+    parser.add_argument("--trace-memory", action="store_true", help="mide la memoria con tracemalloc (más lento)")
+    parser.add_argument("--json", action="store_true", help="imprime el informe como JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load(
+        webhooks=args.webhooks,
+        events=args.events,
+        concurrency=args.concurrency,
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        drip_ms=args.drip_ms,
+        batch_max_events=args.batch,
+        url=args.url,
+        trace_memory=args.trace_memory
+    ))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key:>22}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,51 @@
 from fastapi import FastAPI
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-import uvicorn
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from app.core.config import settings
 from app.api.endpoints import router as api_router
+from app.services.webhooks import batcher, drain_deliveries, retry_scheduler, close_client
+from app.services.outbox import outbox
+from app.services.images import pipeline as image_pipeline
+from app.services.renderer import template_watcher
+from app.core.metrics import registry, gauge, loop_lag_monitor, CONTENT_TYPE
+
+static_dir = Path(__file__).parent / "static"
+
+OUTBOX_PENDING = gauge("frontpage_webhook_outbox_pending", "Entregas de webhooks pendientes en el outbox")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranque y apagado de la aplicación"""
+    static_dir.mkdir(exist_ok=True)
+    # Reanudar las entregas de webhooks pendientes de ejecuciones anteriores
+    retry_scheduler.start()
+    if settings.METRICS_ENABLED:
+        loop_lag_monitor.interval = settings.LOOP_LAG_INTERVAL
+        loop_lag_monitor.start()
+    if settings.TEMPLATE_RELOAD_INTERVAL > 0:
+        template_watcher.interval = settings.TEMPLATE_RELOAD_INTERVAL
+        template_watcher.start()
+    yield
+    await template_watcher.stop()
+    await loop_lag_monitor.stop()
+    await retry_scheduler.stop()
+    # Enviar los lotes y terminar las entregas de webhooks pendientes antes de apagar
+    await batcher.flush_all()
+    await drain_deliveries()
+    await close_client()
+    outbox.close()
+    image_pipeline.close()
 
 # Crear la aplicación FastAPI
 app = FastAPI(
     title=settings.APP_NAME,
     description=settings.APP_DESCRIPTION,
-    version=settings.APP_VERSION
+    version=settings.APP_VERSION,
+    lifespan=lifespan
 )
 
 # Configurar CORS
@@ -26,12 +60,20 @@ app.add_middleware(
 # Montar las rutas de la API
 app.include_router(api_router, prefix="/api")
 
-# Montar archivos estáticos
-static_dir = Path(__file__).parent / "static"
-static_dir.mkdir(exist_ok=True)
-app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    if not settings.METRICS_ENABLED:
+        return Response(status_code=404)
+    OUTBOX_PENDING.set(await outbox.pending_count())
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+# Montar archivos estáticos (el directorio se crea al arrancar, en el lifespan)
+app.mount("/static", StaticFiles(directory=str(static_dir), check_dir=False), name="static")
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(
         "main:app",
         host=settings.HOST,
@@ -22,6 +22,7 @@ setup(
         "passlib[bcrypt]",
         "email-validator>=2.1.0",
         "bcrypt>=4.0.1",
+        "websockets>=12.0",
     ],
     extras_require={
         "dev": [
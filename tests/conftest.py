@@ -1,12 +1,41 @@
+from collections import OrderedDict
+
 import pytest
 from fastapi.testclient import TestClient
 from main import app
 
+@pytest.fixture(autouse=True)
+def isolated_storage(tmp_path, monkeypatch):
+    """Aísla el estado compartido (límite de peticiones, outbox, salud de webhooks, imágenes y claves de idempotencia) entre tests"""
+    from app.core import json_rate_limiter
+    from app.services.outbox import outbox
+    from app.services import circuit_breaker
+    from app.services.images import pipeline
+    from app.core.idempotency import idempotency_keys
+
+    monkeypatch.setattr(circuit_breaker, "endpoint_health", {})
+    monkeypatch.setattr(pipeline, "cache_dir", tmp_path / "image_cache")
+    monkeypatch.setattr(pipeline, "_url_index", OrderedDict())
+    monkeypatch.setattr(pipeline, "_manifests", OrderedDict())
+    monkeypatch.setattr(pipeline, "_failures", OrderedDict())
+    monkeypatch.setattr(idempotency_keys, "entries", OrderedDict())
+    monkeypatch.setattr(json_rate_limiter, "RATE_LIMIT_FILE", str(tmp_path / "rate_limit.json"))
+    outbox.close()
+    monkeypatch.setattr(outbox, "path", str(tmp_path / "webhook_outbox.db"))
+    yield
+    outbox.close()
+
 @pytest.fixture
 def client():
     """Fixture para crear un cliente de prueba de FastAPI"""
     return TestClient(app)
 
+@pytest.fixture
+def auth_headers():
+    """Cabeceras con un token JWT válido"""
+    from app.core.auth import create_access_token
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'test-user'})}"}
+
 @pytest.fixture
 def valid_template_request():
     """Fixture para una solicitud válida de template"""
@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.admission import AdmissionController, Priority
+
+def test_priority_and_per_user_turns():
+    """Test que se atiende primero la prioridad alta y después por turnos entre usuarios"""
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=10, latency_target=10)
+        first = await controller.acquire("a")
+        order = []
+
+        async def request(user, priority=Priority.NORMAL):
+            async with controller.slot(user, priority):
+                order.append(user)
+
+        tasks = [asyncio.create_task(request(user)) for user in ("a", "a", "a", "b")]
+        tasks.append(asyncio.create_task(request("preview", Priority.HIGH)))
+        await asyncio.sleep(0)
+        assert controller.queued == 5
+        first.release()
+        await asyncio.gather(*tasks)
+        assert order == ["preview", "a", "b", "a", "a"]
+        assert controller.active == 0 and controller.queued == 0
+
+    asyncio.run(scenario())
+
+def test_rejects_with_retry_after():
+    """Test que se responde 503 con Retry-After si la espera estimada supera el objetivo"""
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=10, latency_target=0.5, service_time=0.2)
+        ticket = await controller.acquire("a")
+        waiters = [asyncio.create_task(controller.acquire("a")) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as error:
+            await controller.acquire("a")
+        assert error.value.status_code == 503
+        assert error.value.headers["Retry-After"] == "1"
+
+        # Otro usuario todavía entra: su turno va antes que la segunda petición en cola del primero
+        other = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+        assert controller.queued == 3
+
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        assert controller.queued == 1
+        ticket.release()
+        (await other).release()
+        assert controller.active == 0
+
+    asyncio.run(scenario())
+
+def test_queue_wait_times_out():
+    """Test que una petición en cola recibe 503 al superar queue_timeout y no ocupa plaza"""
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=10, latency_target=10, queue_timeout=0.01)
+        ticket = await controller.acquire("a")
+        with pytest.raises(HTTPException) as error:
+            await controller.acquire("b")
+        assert error.value.status_code == 503
+        assert "Retry-After" in error.value.headers
+        assert controller.queued == 0 and controller.active == 1
+        ticket.release()
+        assert controller.active == 0
+
+    asyncio.run(scenario())
+
+def test_generate_returns_503_when_saturated(client, auth_headers, valid_template_request, monkeypatch):
+    """Test que la generación responde 503 con Retry-After cuando no hay plaza"""
+    from app.core.admission import admission
+
+    monkeypatch.setattr(admission, "active", admission.max_concurrent)
+    monkeypatch.setattr(admission, "latency_target", 0)
+    monkeypatch.setattr(admission, "service_time", 2.5)
+    response = client.post("/api/generate-frontpage", json=valid_template_request, headers=auth_headers)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+
+def test_streaming_response_holds_slot(auth_headers):
+    """Test que en una respuesta en streaming la plaza se libera al terminar de enviar la respuesta"""
+    from starlette.requests import Request
+    from starlette.responses import StreamingResponse
+    from app.core.admission import admission, admission_handler
+
+    async def chunks():
+        yield b"zip"
+
+    async def stalled():
+        await asyncio.Event().wait()
+        yield b"never"
+
+    async def scenario(body, receive):
+        async def handler(request):
+            return StreamingResponse(body())
+
+        headers = [(b"authorization", auth_headers["Authorization"].encode())]
+        scope = {"type": "http", "method": "POST", "path": "/", "headers": headers}
+        response = await admission_handler(handler, Priority.NORMAL)(Request(scope))
+        assert admission.active == 1
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await response(scope, receive, send)
+        assert admission.active == 0
+        return [message.get("body") for message in sent if message["type"] == "http.response.body"]
+
+    async def wait_forever():
+        await asyncio.Event().wait()
+
+    async def disconnect():
+        return {"type": "http.disconnect"}
+
+    assert b"zip" in asyncio.run(scenario(chunks, wait_forever))
+    # El cliente se desconecta antes de que empiece el cuerpo
+    asyncio.run(scenario(stalled, disconnect))
+
+def test_requests_without_token_skip_admission(client, valid_template_request, monkeypatch):
+    """Test que sin token válido no se espera plaza: se responde 401"""
+    from app.core.admission import admission
+
+    monkeypatch.setattr(admission, "active", admission.max_concurrent)
+    monkeypatch.setattr(admission, "latency_target", 0)
+    response = client.post("/api/generate-frontpage", json=valid_template_request)
+    assert response.status_code == 401
+
+def test_verified_tokens_are_cached():
+    """Test que un token ya verificado no se vuelve a verificar y que se descarta al caducar"""
+    from datetime import timedelta
+    from app.core import auth
+
+    token = auth.create_access_token({"sub": "cache"})
+    assert auth.decode_access_token(token)["sub"] == "cache"
+    assert token in auth._verified_tokens
+    auth.decode_access_token(token)["sub"] = "mutado"
+    assert auth.decode_access_token(token)["sub"] == "cache"
+
+    expired = auth.create_access_token({"sub": "old"}, expires_delta=timedelta(seconds=-1))
+    assert auth.decode_access_token(expired) is None
+    assert auth.decode_access_token(token + "x") is None
@@ -95,3 +95,14 @@ def test_api_info(client):
     assert "version" in data
     assert "templates" in data
     assert "features" in data
+
+def test_app_lifespan():
+    """Test que la aplicación arranca y se apaga con su lifespan (el fixture `client` no lo ejecuta)"""
+    from fastapi.testclient import TestClient
+    from main import app
+    from app.services.webhooks import retry_scheduler
+
+    with TestClient(app) as client:
+        assert retry_scheduler._task is not None and not retry_scheduler._task.done()
+        assert client.get("/metrics").status_code == 200
+    assert retry_scheduler._task is None
@@ -0,0 +1,46 @@
+import pytest
+from benchmarks.suite import CASES, compare, run_suite
+from app.services.renderer import cache
+
+def test_benchmark_cases_registered():
+    """Test the suite covers the render pipeline hot paths"""
+    expected = [
+        "renderer.get_cache_key",
+        "renderer.get_cached_render.hit",
+        "renderer.get_cached_render.miss",
+        "renderer.render_template.minimal",
+        "renderer.minify_css",
+        "cache.get.hit",
+        "rate_limiter.check_rate_limit",
+        "auth.decode_access_token",
+        "previews.cleanup.10k",
+        "metrics.histogram.observe",
+        "metrics.stage_timer",
+    ]
+    assert all(name in CASES for name in expected)
+
+def test_benchmark_run_smoke():
+    """Test a quick run produces results and restores shared state"""
+    cache.set("keep", "value")
+    results = run_suite(
+        ["renderer.get_cached_render.hit", "renderer.render_template.blog", "previews.store"],
+        samples=1,
+        min_time=0.001
+    )
+    assert results["results"]["renderer.get_cached_render.hit"]["median_us"] > 0
+    assert results["skipped"] == ["renderer.render_template.blog"]
+    assert cache.get("keep") == "value"
+
+def test_benchmark_compare_flags_regressions():
+    """Test comparison fails only beyond the threshold"""
+    baseline = {"results": {"a": {"median_us": 10.0}, "b": {"median_us": 10.0}}}
+    current = {"results": {
+        "a": {"median_us": 12.0},
+        "b": {"median_us": 14.0},
+        "c": {"median_us": 1.0}
+    }}
+    rows = {row["name"]: row for row in compare(baseline, current, threshold=0.25)}
+    assert not rows["a"]["regression"]
+    assert rows["b"]["regression"]
+    assert rows["b"]["change"] == pytest.approx(0.4)
+    assert rows["c"]["change"] is None and not rows["c"]["regression"]
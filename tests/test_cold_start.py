@@ -0,0 +1,19 @@
+from benchmarks.cold_start import measure_cold_start, parse_importtime
+
+def test_parse_importtime():
+    """Test que se interpreta la salida de -X importtime"""
+    output = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |     app.core.config\n"
+        "import time:      1500 |       1620 | main\n"
+    )
+    timings = parse_importtime(output)
+    assert [(t.module, t.depth) for t in timings] == [("app.core.config", 2), ("main", 0)]
+    assert timings[1].self_ms == 1.5
+    assert timings[1].cumulative_ms == 1.62
+
+def test_cold_start_loads_no_lazy_dependencies():
+    """Test que el arranque en frío no carga dependencias pesadas"""
+    report = measure_cold_start()
+    assert report["status"] == 200
+    assert report["loaded_lazy"] == []
@@ -0,0 +1,88 @@
+from app.services import renderer
+from app.services.css_pruner import PageFeatures, extract_features, prune_css, selector_may_match
+from app.services.renderer import render_template
+
+HTML = '<html><body class="page dark"><header id="top"><h1 class="title">Hola</h1><a href="#">x</a></header></body></html>'
+
+def test_extract_features():
+    """Test de etiquetas, clases e ids extraídos del HTML"""
+    features = extract_features(HTML)
+    assert {"html", "body", "header", "h1", "a"} <= features.tags
+    assert features.classes == {"page", "dark", "title"}
+    assert features.ids == {"top"}
+
+def test_selector_may_match():
+    """Test que solo se descartan selectores que no pueden coincidir"""
+    features = extract_features(HTML)
+    assert selector_may_match("h1.title", features)
+    assert selector_may_match("body.dark > header#top h1:hover::after", features)
+    assert selector_may_match("a[href^='http']:not(.missing)", features)
+    assert selector_may_match(":root", features)
+    assert selector_may_match("*", features)
+    assert selector_may_match(".md\\:flex", features)
+    assert not selector_may_match(".missing", features)
+    assert not selector_may_match("header .title span", features)
+    assert not selector_may_match("#bottom", features)
+    assert not selector_may_match("H2", PageFeatures(frozenset({"h1"}), frozenset(), frozenset()))
+
+def test_prune_css():
+    """Test de la poda de reglas, @media y reglas @ que se conservan"""
+    css = """
+    /* comentario con .missing { } */
+    :root { --color: red; }
+    h1, .missing, :is(.a, .b) p { color: var(--color); }
+    .missing { content: "} .title {"; }
+    @media (max-width: 600px) { .missing { a: 1 } .title { b: 2 } }
+    @media print { .gone { a: 1 } }
+    @font-face { font-family: X; src: url(x.woff2); }
+    """
+    pruned, stats = prune_css(css, HTML)
+    assert ":root" in pruned
+    assert "h1 {" in pruned and ".missing" not in pruned
+    assert "@media (max-width: 600px)" in pruned and "@media print" not in pruned
+    assert "@font-face" in pruned
+    assert stats.removed_rules == 3
+    assert stats.saved_bytes == len(css.encode()) - len(pruned.encode()) > 0
+
+    unchanged, stats = prune_css("h1 { color: red; }", HTML)
+    assert unchanged == "h1 { color: red; }"
+    assert stats.saved_bytes == 0
+
+def test_prune_invalid_css_is_kept():
+    """Test que el CSS con llaves desequilibradas no se modifica"""
+    css = ".missing { color: red; "
+    assert prune_css(css, HTML)[0] == css
+
+def test_render_template_prunes_custom_css():
+    """Test que render_template elimina el CSS sin uso y reporta los bytes"""
+    context = {
+        "title": "Poda",
+        "subtitle": "CSS",
+        "primaryColor": "#007bff",
+        "customCss": ".sidebar { width: 200px; } h1 { letter-spacing: 1px; }",
+    }
+    rendered = render_template("minimal", dict(context), prune_css=True)
+    assert ".sidebar" not in rendered["css"] and ".sidebar" not in rendered["html"]
+    assert "letter-spacing:1px" in rendered["html"]
+    assert rendered["css_stats"]["saved_bytes"] > 0
+    assert renderer.CSS_SENTINEL not in rendered["html"]
+
+    # Otra página del mismo template reutiliza el resultado de la poda
+    cached = len(renderer._prune_cache.cache)
+    render_template("minimal", {**context, "title": "Otra"}, prune_css=True)
+    assert len(renderer._prune_cache.cache) == cached
+
+    # Desactivada por defecto
+    unpruned = render_template("minimal", dict(context))
+    assert ".sidebar" in unpruned["html"]
+    assert "css_stats" not in unpruned
+
+def test_generate_reports_css_stats(client, auth_headers, valid_template_request, monkeypatch):
+    """Test que con la poda activada la respuesta de generación incluye los bytes ahorrados"""
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "CSS_PRUNING", True)
+    request = {**valid_template_request, "customCss": ".unused { color: red; }"}
+    response = client.post("/api/generate-frontpage", json=request, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["css_stats"]["removed_rules"] >= 1
@@ -0,0 +1,158 @@
+import re
+
+from app.services import renderer
+from app.services.editor import EditorSession, editor_sessions, get_layout
+
+CONTEXT = {
+    "template": "minimal",
+    "title": "Editor",
+    "subtitle": "Sesión",
+    "primaryColor": "#007bff",
+    "secondaryColor": "#ffffff",
+    "fontFamily": "Roboto, sans-serif",
+    "heroImage": None,
+    "customCss": None,
+}
+
+def _normalize(html: str) -> str:
+    return re.sub(r"<style>.*?</style>", "", html, flags=re.S)
+
+def test_block_dependencies():
+    """Test que las dependencias de cada bloque salen del template"""
+    layout = get_layout("minimal")
+    assert "title" in layout.page_blocks["title"]
+    assert "primaryColor" in layout.css_blocks["variables"]
+    assert "title" not in layout.css_blocks["variables"]
+    assert "heroImage" in layout.page_blocks["hero"]
+
+def test_session_matches_full_render():
+    """Test que la página de la sesión coincide con el renderizado completo"""
+    session = EditorSession("s", "user", dict(CONTEXT))
+    full = renderer.render_template("minimal", dict(CONTEXT))
+    assert _normalize(session.page_html()) == _normalize(full["html"])
+
+    session.apply({**CONTEXT, "title": "Nuevo título"})
+    full = renderer.render_template("minimal", {**CONTEXT, "title": "Nuevo título"})
+    assert _normalize(session.page_html()) == _normalize(full["html"])
+
+def test_apply_returns_only_affected_fragments():
+    """Test que cada cambio devuelve solo los fragmentos que dependen del campo"""
+    session = EditorSession("s", "user", dict(CONTEXT))
+
+    changed, html, css = session.apply({**CONTEXT, "primaryColor": "#ff0000"})
+    assert changed == ["primaryColor"]
+    assert html == {} and list(css) == ["variables"]
+    assert "#ff0000" in css["variables"]
+
+    changed, html, css = session.apply({**session.context, "title": "Otro"})
+    assert changed == ["title"]
+    assert "Otro" in html["title"] and "style" not in html
+    assert css == {}
+    assert session.version == 2
+
+    assert session.apply(dict(session.context)) == ([], {}, {})
+    assert session.version == 2
+
+def test_editor_endpoints(client, auth_headers, valid_template_request):
+    """Test de creación, parche, consulta y borrado de una sesión"""
+    response = client.post("/api/editor/sessions", json=valid_template_request, headers=auth_headers)
+    assert response.status_code == 200
+    created = response.json()
+    session_id = created["session_id"]
+    assert "Test Title" in created["html"]
+    assert set(created["fragments"]["css"]) == {"variables", "base", "custom"}
+
+    response = client.patch(f"/api/editor/sessions/{session_id}", json={"subtitle": "Cambiado"}, headers=auth_headers)
+    assert response.status_code == 200
+    patch = response.json()
+    assert patch["version"] == 1 and patch["changed"] == ["subtitle"]
+    assert patch["fragments"]["css"] == {}
+    assert all("Cambiado" in fragment for fragment in patch["fragments"]["html"].values())
+
+    response = client.patch(f"/api/editor/sessions/{session_id}", json={"primaryColor": "rojo"}, headers=auth_headers)
+    assert response.status_code == 422
+
+    response = client.get(f"/api/editor/sessions/{session_id}", headers=auth_headers)
+    assert "Cambiado" in response.json()["html"]
+
+    assert client.delete(f"/api/editor/sessions/{session_id}", headers=auth_headers).status_code == 200
+    assert client.get(f"/api/editor/sessions/{session_id}", headers=auth_headers).status_code == 404
+
+def test_editor_session_owner(client, auth_headers, valid_template_request):
+    """Test que una sesión solo es accesible para su usuario"""
+    from app.core.auth import create_access_token
+
+    session_id = client.post("/api/editor/sessions", json=valid_template_request, headers=auth_headers).json()["session_id"]
+    other = {"Authorization": f"Bearer {create_access_token({'sub': 'otro'})}"}
+    assert client.patch(f"/api/editor/sessions/{session_id}", json={"title": "x"}, headers=other).status_code == 404
+    assert editor_sessions.get(session_id, "test-user") is not None
+
+def test_editor_patches_have_their_own_rate_limit(client, auth_headers, valid_template_request, monkeypatch):
+    """Test que los PATCH del editor no consumen el límite del resto de la API"""
+    from app.core import json_rate_limiter
+
+    monkeypatch.setattr(json_rate_limiter, "RATE_LIMIT", 3)
+    session_id = client.post("/api/editor/sessions", json=valid_template_request, headers=auth_headers).json()["session_id"]
+    for n in range(5):
+        response = client.patch(f"/api/editor/sessions/{session_id}", json={"title": f"T{n}"}, headers=auth_headers)
+        assert response.status_code == 200
+    assert client.get("/api/templates", headers=auth_headers).status_code == 200
+
+def test_sessions_are_capped_per_user():
+    """Test que un usuario con demasiadas sesiones descarta las suyas y no las de otros"""
+    from app.services.editor import EditorSessionStore
+
+    store = EditorSessionStore(ttl=60, max_sessions=100, max_per_user=2)
+    other = store.create("otro", dict(CONTEXT))
+    first = store.create("a", dict(CONTEXT))
+    second = store.create("a", dict(CONTEXT))
+    store.get(first.id, "a")
+    third = store.create("a", dict(CONTEXT))
+    assert store.get(second.id, "a") is None
+    assert store.get(first.id, "a") is not None and store.get(third.id, "a") is not None
+    assert store.get(other.id, "otro") is not None
+
+def test_live_editor_coalesces_edits(client, auth_headers, valid_template_request, monkeypatch):
+    """Test que el WebSocket agrupa las ediciones y mantiene una sola previsualización"""
+    from app.api.endpoints import preview_storage
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "EDITOR_DEBOUNCE_MS", 200)
+    monkeypatch.setattr(settings, "EDITOR_MAX_DELAY_MS", 1000)
+    created = client.post("/api/editor/sessions", json=valid_template_request, headers=auth_headers).json()
+    previews = len(preview_storage)
+
+    with client.websocket_connect(f"/api/editor/sessions/{created['session_id']}/live", headers=auth_headers) as ws:
+        ready = ws.receive_json()
+        assert ready["type"] == "ready" and ready["preview_url"] == created["preview_url"]
+
+        ws.send_json("sin cambios")
+        assert ws.receive_json()["type"] == "error"
+
+        for title in ("H", "Ho", "Hola"):
+            ws.send_json({"changes": {"title": title}})
+        ws.send_json({"changes": {"primaryColor": "#ff0000"}})
+        update = ws.receive_json()
+        assert update["type"] == "update" and update["version"] == 1
+        assert update["changed"] == ["primaryColor", "title"]
+        assert update["preview_url"] == created["preview_url"]
+
+        ws.send_json({"changes": {"primaryColor": "rojo"}})
+        assert ws.receive_json()["type"] == "error"
+
+    assert len(preview_storage) == previews
+    preview = client.get(f"/api{created['preview_url']}", headers=auth_headers)
+    assert "Hola" in preview.text and "#ff0000" in preview.text
+
+def test_live_editor_requires_auth(client, auth_headers, valid_template_request):
+    """Test que el WebSocket rechaza conexiones sin token o de otro usuario"""
+    from starlette.websockets import WebSocketDisconnect
+    import pytest
+
+    session_id = client.post("/api/editor/sessions", json=valid_template_request, headers=auth_headers).json()["session_id"]
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(f"/api/editor/sessions/{session_id}/live") as ws:
+            ws.receive_json()
+    token = auth_headers["Authorization"].split()[1]
+    with client.websocket_connect(f"/api/editor/sessions/{session_id}/live?token={token}") as ws:
+        assert ws.receive_json()["type"] == "ready"
@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+import io
+import zipfile
+
+from app.services import export
+from app.services.export import SiteFiles, ZipStream
+
+def _collect(chunks):
+    async def run():
+        return [chunk async for chunk in chunks]
+    return asyncio.run(run())
+
+def test_export_single_page(client, auth_headers, valid_template_request):
+    """Test que la exportación devuelve un ZIP con index.html y CSS con hash"""
+    response = client.post("/api/export", json=valid_template_request, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert archive.testzip() is None
+    names = archive.namelist()
+    css_name = next(name for name in names if name.endswith(".css"))
+    assert names == ["index.html", css_name]
+
+    html = archive.read("index.html").decode()
+    css = archive.read(css_name)
+    assert f'href="{css_name}"' in html
+    assert "<style" not in html
+    assert "Test Title" in html
+    assert hashlib.sha256(css).hexdigest()[:12] in css_name
+
+def test_export_unknown_template(client, auth_headers, valid_template_request):
+    """Test que un template no disponible falla antes de empezar el ZIP"""
+    response = client.post("/api/export", json={**valid_template_request, "template": "blog"}, headers=auth_headers)
+    assert response.status_code == 400
+
+def test_export_bulk_shares_css(client, auth_headers, valid_template_request):
+    """Test que la exportación masiva guarda una vez el CSS compartido"""
+    pages = [{**valid_template_request, "title": f"Page {i}"} for i in range(3)]
+    pages.append({**valid_template_request, "title": "Red", "primaryColor": "#ff0000"})
+    response = client.post("/api/export/bulk", json={"pages": pages}, headers=auth_headers)
+    assert response.status_code == 200
+
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    names = archive.namelist()
+    assert [name for name in names if name.endswith("index.html")] == [
+        "001-page-0/index.html", "002-page-1/index.html", "003-page-2/index.html", "004-red/index.html"
+    ]
+    assert len([name for name in names if name.endswith(".css")]) == 2
+    html = archive.read("004-red/index.html").decode()
+    assert 'href="../assets/style.' in html
+
+    response = client.post("/api/export/bulk", json={"pages": []}, headers=auth_headers)
+    assert response.status_code == 422
+
+def test_static_assets_are_stored(tmp_path, monkeypatch):
+    """Test que los recursos ya comprimidos se guardan sin recomprimir"""
+    monkeypatch.setattr(export, "STATIC_DIR", tmp_path)
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG" + bytes(range(256)) * 100)
+    html = '<html><head><style>h1{color:red}</style></head><body><img src="/static/logo.png"><img src="/static/missing.png"></body></html>'
+    site = SiteFiles.from_rendered({"html": html, "css": "h1 { color: red; }"})
+    assert 'src="assets/logo.png"' in site.html
+    assert 'src="/static/missing.png"' in site.html
+
+    archive = ZipStream()
+    data = b"".join(list(archive.add_site(site)) + list(archive.close()))
+    infos = {info.filename: info for info in zipfile.ZipFile(io.BytesIO(data)).infolist()}
+    assert infos["assets/logo.png"].compress_type == zipfile.ZIP_STORED
+    assert infos["index.html"].compress_type == zipfile.ZIP_DEFLATED
+    assert site.css == "h1{color:red}"
+
+def test_bulk_stream_is_incremental(valid_template_request):
+    """Test que el ZIP se envía por páginas sin acumular el archivo en memoria"""
+    pages = [("minimal", {**valid_template_request, "title": f"Incremental {i}"}) for i in range(50)]
+    chunks = _collect(export.stream_sites(iter(pages)))
+    assert len(chunks) > 50
+    assert max(len(chunk) for chunk in chunks) < 16 * 1024
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert len(archive.namelist()) == 51
+
+def test_bulk_export_renders_off_the_event_loop(valid_template_request, monkeypatch):
+    """Test que el renderizado y la compresión de cada página se hacen fuera del hilo del event loop"""
+    import threading
+
+    threads = []
+    render_page = export.render_page
+    monkeypatch.setattr(
+        export, "render_page",
+        lambda *args: threads.append(threading.current_thread()) or render_page(*args)
+    )
+    pages = [("minimal", {**valid_template_request, "title": f"Hilo {i}"}) for i in range(3)]
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(_collect(export.stream_sites(iter(pages))))))
+    assert len(archive.namelist()) == 4
+    assert len(threads) == 3 and threading.main_thread() not in threads
@@ -0,0 +1,136 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.core.idempotency import IdempotencyStore, StoredResponse
+
+def _count_calls(monkeypatch, name, delay=0.0):
+    """Sustituye una corrutina de endpoints por otra que cuenta las llamadas"""
+    from app.api import endpoints
+
+    original = getattr(endpoints, name)
+    calls = []
+
+    async def counted(*args, **kwargs):
+        calls.append(args)
+        await asyncio.sleep(delay)
+        return await original(*args, **kwargs)
+
+    monkeypatch.setattr(endpoints, name, counted)
+    return calls
+
+def test_repeated_key_returns_original_response(client, auth_headers, valid_template_request, monkeypatch):
+    """Test que un reintento con la misma clave devuelve la respuesta original sin renderizar ni notificar"""
+    from app.api.endpoints import preview_storage
+
+    notified = _count_calls(monkeypatch, "notify_generation_event")
+    headers = {**auth_headers, "Idempotency-Key": "reintento-1"}
+    first = client.post("/api/generate-frontpage", json=valid_template_request, headers=headers)
+    previews = len(preview_storage)
+    second = client.post("/api/generate-frontpage", json=valid_template_request, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert len(notified) == 1
+    assert len(preview_storage) == previews
+
+    # Sin clave, cada petición se ejecuta
+    third = client.post("/api/generate-frontpage", json=valid_template_request, headers=auth_headers)
+    assert third.json()["preview_url"] != first.json()["preview_url"]
+
+def test_key_reuse_and_scope(client, auth_headers, valid_template_request):
+    """Test que reutilizar una clave con otra petición da 422 y que las claves son por usuario"""
+    from app.core.auth import create_access_token
+
+    headers = {**auth_headers, "Idempotency-Key": "clave"}
+    first = client.post("/api/generate-preview", json=valid_template_request, headers=headers)
+    assert first.status_code == 200
+
+    changed = client.post("/api/generate-preview", json={**valid_template_request, "title": "Otro"}, headers=headers)
+    assert changed.status_code == 422
+    other_endpoint = client.post("/api/generate-frontpage", json=valid_template_request, headers=headers)
+    assert other_endpoint.status_code == 422
+
+    other_user = {"Authorization": f"Bearer {create_access_token({'sub': 'otro'})}", "Idempotency-Key": "clave"}
+    response = client.post("/api/generate-preview", json=valid_template_request, headers=other_user)
+    assert response.status_code == 200
+    assert response.json()["preview_url"] != first.json()["preview_url"]
+
+    too_long = {**auth_headers, "Idempotency-Key": "x" * 256}
+    assert client.post("/api/generate-preview", json=valid_template_request, headers=too_long).status_code == 400
+
+def test_concurrent_duplicates_wait_for_first(auth_headers, valid_template_request, monkeypatch):
+    """Test que los duplicados simultáneos esperan a la primera petición en lugar de ejecutarse"""
+    from main import app
+
+    rendered = _count_calls(monkeypatch, "attach_hero_image", delay=0.05)
+    headers = {**auth_headers, "Idempotency-Key": "simultanea"}
+
+    async def scenario():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.post("/api/generate-frontpage", json=valid_template_request, headers=headers)
+                for _ in range(3)
+            ))
+
+    responses = asyncio.run(scenario())
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert len({response.json()["preview_url"] for response in responses}) == 1
+    assert len(rendered) == 1
+    assert sum("idempotent-replayed" in response.headers for response in responses) == 2
+
+def test_failed_request_releases_key():
+    """Test que si la petición original falla, el duplicado que esperaba se ejecuta"""
+    async def scenario():
+        store = IdempotencyStore(ttl=60, max_keys=10)
+        key = ("user", "k")
+        entry, first = store.begin(key, "a")
+        assert first
+        duplicate, first = store.begin(key, "a")
+        assert duplicate is entry and not first
+
+        waiter = asyncio.create_task(store.wait(entry, timeout=1))
+        await asyncio.sleep(0)
+        store.complete(key, entry, None)
+        await waiter
+        assert entry.response is None and len(store) == 0
+
+        retry, first = store.begin(key, "a")
+        assert first
+        store.complete(key, retry, StoredResponse(200, b"{}", []))
+        assert store.begin(key, "a") == (retry, False)
+
+        with pytest.raises(HTTPException) as error:
+            store.begin(key, "b")
+        assert error.value.status_code == 422
+
+        pending, _ = store.begin(("user", "lenta"), "a")
+        with pytest.raises(HTTPException) as error:
+            await store.wait(pending, timeout=0.01)
+        assert error.value.status_code == 409 and pending.waiters == []
+
+    asyncio.run(scenario())
+
+def test_store_is_bounded():
+    """Test que las claves caducan y que se guardan como máximo `max_keys`"""
+    store = IdempotencyStore(ttl=60, max_keys=2)
+    first, _ = store.begin(("user", "a"), "x")
+    store.begin(("user", "b"), "x")
+    # Las dos siguen en curso: no se descarta ninguna
+    with pytest.raises(HTTPException) as error:
+        store.begin(("user", "c"), "x")
+    assert error.value.status_code == 503
+    assert [key for _, key in store.entries] == ["a", "b"]
+
+    store.complete(("user", "a"), first, StoredResponse(200, b"{}", []))
+    store.begin(("user", "c"), "x")
+    assert [key for _, key in store.entries] == ["b", "c"]
+
+    expired = IdempotencyStore(ttl=0, max_keys=10)
+    expired.begin(("user", "a"), "x")
+    expired.begin(("user", "b"), "x")
+    assert len(expired) == 1
@@ -0,0 +1,278 @@
+import asyncio
+import io
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from app.services import images
+from app.services.images import HeroImagePipeline, srcset, target_widths
+
+class LocalFileServer:
+    """Fetcher que sirve imágenes desde un directorio y cuenta las descargas"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.fetches = []
+
+    async def __call__(self, url: str) -> bytes:
+        self.fetches.append(url)
+        await asyncio.sleep(0.01)
+        return (self.directory / url.rsplit("/", 1)[-1]).read_bytes()
+
+def _image(path, size=(2000, 1000), mode="RGB", fmt="PNG"):
+    Image.new(mode, size, (200, 50, 50) if mode == "RGB" else (200, 50, 50, 128)).save(path, fmt)
+    return path
+
+@pytest.fixture
+def server(tmp_path):
+    originals = tmp_path / "originals"
+    originals.mkdir()
+    _image(originals / "hero.png")
+    _image(originals / "small.png", size=(300, 200), mode="RGBA")
+    (originals / "broken.png").write_bytes(b"not an image")
+    return LocalFileServer(originals)
+
+def test_target_widths():
+    """Test que no se generan versiones más grandes que el original"""
+    assert target_widths(2000, (480, 960, 1600)) == [480, 960, 1600]
+    assert target_widths(1000, (480, 960, 1600)) == [480, 960, 1000]
+    assert target_widths(300, (480, 960, 1600)) == [300]
+
+def test_derivatives_and_cache(tmp_path, server, monkeypatch):
+    """Test que cada imagen se descarga y se procesa una sola vez"""
+    processed = []
+    original = images.make_derivatives
+    monkeypatch.setattr(images, "make_derivatives", lambda *args: processed.append(1) or original(*args))
+
+    pipeline = HeroImagePipeline(str(tmp_path / "cache"), workers=0, fetcher=server)
+    manifest = asyncio.run(pipeline.get_variants("http://images.test/hero.png"))
+    assert [v["width"] for v in manifest["variants"]] == [480, 960, 1600]
+    assert manifest["variants"][0]["height"] == 240
+    for variant in manifest["variants"]:
+        for extension in ("webp", "jpg"):
+            path = pipeline.path_for(manifest["digest"], f"{variant['width']}.{extension}")
+            assert Image.open(path).size == (variant["width"], variant["height"])
+
+    asyncio.run(pipeline.get_variants("http://images.test/hero.png"))
+    # Otra instancia con el mismo directorio reutiliza el índice en disco
+    restarted = HeroImagePipeline(str(tmp_path / "cache"), workers=0, fetcher=server)
+    assert asyncio.run(restarted.get_variants("http://images.test/hero.png"))["digest"] == manifest["digest"]
+    assert server.fetches == ["http://images.test/hero.png"]
+
+    # La misma imagen en otra URL se descarga pero no se vuelve a procesar
+    asyncio.run(restarted.get_variants("http://mirror.test/hero.png"))
+    assert len(server.fetches) == 2
+    assert len(processed) == 1
+
+def test_concurrent_requests_share_processing(tmp_path, server):
+    """Test que peticiones simultáneas de la misma imagen esperan a la primera"""
+    pipeline = HeroImagePipeline(str(tmp_path / "cache"), workers=0, fetcher=server)
+
+    async def run():
+        return await asyncio.gather(*[pipeline.get_variants("http://images.test/small.png") for _ in range(5)])
+
+    manifests = asyncio.run(run())
+    assert len({m["digest"] for m in manifests}) == 1
+    assert [v["width"] for v in manifests[0]["variants"]] == [300]
+    assert server.fetches == ["http://images.test/small.png"]
+
+def test_process_pool(tmp_path, server):
+    """Test que las versiones se generan en el pool de procesos"""
+    pipeline = HeroImagePipeline(str(tmp_path / "cache"), widths=(100,), workers=1, fetcher=server)
+    try:
+        manifest = asyncio.run(pipeline.get_variants("http://images.test/small.png"))
+    finally:
+        pipeline.close()
+    assert pipeline.path_for(manifest["digest"], "100.webp") is not None
+
+    with pytest.raises(images.ImageError):
+        pipeline = HeroImagePipeline(str(tmp_path / "cache"), workers=1, fetcher=server)
+        try:
+            asyncio.run(pipeline.get_variants("http://images.test/broken.png"))
+        finally:
+            pipeline.close()
+
+def test_srcset_markup():
+    """Test de los atributos srcset por formato"""
+    manifest = {"digest": "a" * 64, "variants": [{"width": 480, "height": 240}, {"width": 960, "height": 480}]}
+    hero = srcset(manifest)
+    assert hero["src"] == f"/api/images/{'a' * 64}/960.jpg"
+    assert hero["srcset_webp"] == f"/api/images/{'a' * 64}/480.webp 480w, /api/images/{'a' * 64}/960.webp 960w"
+
+def test_generate_with_hero_image(client, auth_headers, valid_template_request, server, monkeypatch):
+    """Test que la página incluye srcset y las versiones se sirven sin autenticación"""
+    monkeypatch.setattr(images.pipeline, "fetcher", server)
+    monkeypatch.setattr(images.pipeline, "workers", 0)
+    request = {**valid_template_request, "heroImage": "http://images.test/hero.png"}
+    # Procesada de antemano, como tras el procesado en segundo plano de una petición anterior
+    asyncio.run(images.pipeline.get_variants("http://images.test/hero.png"))
+
+    response = client.post("/api/generate-frontpage", json=request, headers=auth_headers)
+    assert response.status_code == 200
+    html = response.json()["html"]
+    assert 'type="image/webp"' in html
+    assert "480w" in html and "1600w" in html
+
+    digest = images.pipeline._url_index["http://images.test/hero.png"]
+    image = client.get(f"/api/images/{digest}/480.webp")
+    assert image.status_code == 200
+    assert image.headers["content-type"] == "image/webp"
+    assert "immutable" in image.headers["cache-control"]
+    assert client.get(f"/api/images/{digest}/../../secret").status_code == 404
+    assert client.get(f"/api/images/{digest}/123.png").status_code == 404
+
+    export = client.post("/api/export", json=request, headers=auth_headers)
+    archive = zipfile.ZipFile(io.BytesIO(export.content))
+    stored = [info for info in archive.infolist() if info.filename.startswith("assets/images/")]
+    assert len(stored) == 6
+    assert all(info.compress_type == zipfile.ZIP_STORED for info in stored)
+    assert "/api/images/" not in archive.read("index.html").decode()
+
+    assert server.fetches == ["http://images.test/hero.png"]
+
+def test_broken_hero_image_falls_back(client, auth_headers, valid_template_request, server, monkeypatch):
+    """Test que una imagen inválida no impide generar la página"""
+    monkeypatch.setattr(images.pipeline, "fetcher", server)
+    monkeypatch.setattr(images.pipeline, "workers", 0)
+    request = {**valid_template_request, "heroImage": "http://images.test/broken.png"}
+
+    response = client.post("/api/generate-frontpage", json=request, headers=auth_headers)
+    assert response.status_code == 200
+    assert 'src="http://images.test/broken.png"' in response.json()["html"]
+
+def test_attach_hero_image_does_not_wait(tmp_path, server, monkeypatch):
+    """Test que sin versiones en caché la página usa la URL original y la imagen se procesa en segundo plano"""
+    pipeline = HeroImagePipeline(str(tmp_path / "cache"), workers=0, fetcher=server)
+    monkeypatch.setattr(images, "pipeline", pipeline)
+
+    async def run():
+        first = await images.attach_hero_image({"heroImage": "http://images.test/small.png"})
+        assert "hero" not in first
+        await asyncio.gather(*pipeline._tasks)
+        second = await images.attach_hero_image({"heroImage": "http://images.test/small.png"})
+        assert "300w" in second["hero"]["srcset_webp"]
+
+    asyncio.run(run())
+    assert server.fetches == ["http://images.test/small.png"]
+
+def test_failures_are_cached(tmp_path, server):
+    """Test que una URL que falla no se vuelve a descargar hasta que caduca el fallo"""
+    pipeline = HeroImagePipeline(str(tmp_path / "cache"), workers=0, fetcher=server, failure_ttl=60)
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(images.ImageError):
+                await pipeline.get_variants("http://images.test/broken.png")
+        pipeline.prefetch("http://images.test/broken.png")
+        assert not pipeline._tasks
+
+    asyncio.run(run())
+    assert server.fetches == ["http://images.test/broken.png"]
+
+def test_prefetch_concurrency_is_bounded(tmp_path, server):
+    """Test que las descargas en segundo plano no superan `prefetch_concurrency`"""
+    pipeline = HeroImagePipeline(str(tmp_path / "cache"), workers=0, fetcher=server, prefetch_concurrency=1)
+
+    async def run():
+        pipeline.prefetch("http://images.test/small.png")
+        pipeline.prefetch("http://images.test/hero.png")
+        assert len(pipeline._tasks) == 1
+        await asyncio.gather(*pipeline._tasks)
+        pipeline.prefetch("http://images.test/hero.png")
+        await asyncio.gather(*pipeline._tasks)
+
+    asyncio.run(run())
+    assert server.fetches == ["http://images.test/small.png", "http://images.test/hero.png"]
+
+def test_memory_indexes_are_bounded(tmp_path, server):
+    """Test que los índices en memoria descartan las entradas menos usadas"""
+    pipeline = HeroImagePipeline(str(tmp_path / "cache"), workers=0, fetcher=server, max_entries=1)
+
+    async def run():
+        await pipeline.get_variants("http://images.test/small.png")
+        await pipeline.get_variants("http://images.test/hero.png")
+        for url in ("http://images.test/broken.png", "http://images.test/missing.png"):
+            with pytest.raises((images.ImageError, FileNotFoundError)):
+                await pipeline.get_variants(url)
+
+    asyncio.run(run())
+    assert list(pipeline._url_index) == ["http://images.test/hero.png"]
+    assert len(pipeline._manifests) == 1
+    assert list(pipeline._failures) == ["http://images.test/missing.png"]
+    # Lo descartado de memoria sigue en el caché en disco
+    assert pipeline.cached_variants("http://images.test/small.png")["width"] == 300
+
+@pytest.mark.parametrize("url", [
+    "file:///etc/passwd",
+    "http://127.0.0.1/hero.png",
+    "http://10.0.0.5/hero.png",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]/hero.png",
+    "http://[::ffff:192.168.1.1]/hero.png",
+])
+def test_private_urls_are_rejected(url):
+    """Test que no se descargan imágenes de direcciones privadas o locales"""
+    with pytest.raises(images.ImageError):
+        asyncio.run(images.check_public_url(url))
+
+def test_public_urls_are_allowed():
+    """Test que una dirección pública pasa la comprobación"""
+    asyncio.run(images.check_public_url("https://93.184.216.34/hero.png"))
+
+@pytest.fixture
+def http_origin(tmp_path):
+    """Servidor HTTP local que sirve /hero.png, redirige /old y anota la cabecera Host"""
+    body = _image(tmp_path / "origin.png", size=(300, 200)).read_bytes()
+    hosts = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hosts.append(self.headers["Host"])
+            if self.path == "/old":
+                self.send_response(302)
+                self.send_header("Location", "/hero.png")
+            elif self.path == "/internal":
+                self.send_response(302)
+                self.send_header("Location", "http://metadata.internal/latest")
+            else:
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.path == "/hero.png":
+                self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address[1], body, hosts
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_fetch_connects_to_checked_address(http_origin, monkeypatch):
+    """Test que la descarga va a la dirección comprobada (sin volver a resolver) y conserva la cabecera Host"""
+    port, body, hosts = http_origin
+
+    async def check(url):
+        # images.test no resuelve: si httpx resolviera el host de nuevo, la descarga fallaría
+        if url.startswith(f"http://images.test:{port}/"):
+            return ["127.0.0.1"]
+        raise images.ImageError(f"Address not allowed for {url}")
+
+    monkeypatch.setattr(images, "check_public_url", check)
+    assert asyncio.run(images.fetch_url(f"http://images.test:{port}/old")) == body
+    assert hosts == [f"images.test:{port}"] * 2
+    with pytest.raises(images.ImageError):
+        asyncio.run(images.fetch_url(f"http://images.test:{port}/internal"))
+
+def test_pinned_request_keeps_host_and_sni():
+    """Test que la petición fijada a una IP mantiene el host original en Host y SNI"""
+    url, headers, extensions = images._pinned_request("https://cdn.example.com/a.png?v=1", "2606:4700::1")
+    assert url == "https://[2606:4700::1]/a.png?v=1"
+    assert headers == {"Host": "cdn.example.com"}
+    assert extensions == {"sni_hostname": "cdn.example.com"}
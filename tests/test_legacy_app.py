@@ -0,0 +1,60 @@
+import importlib.util
+import os
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).parent.parent
+
+@pytest.fixture
+def legacy(monkeypatch):
+    """Carga el app.py heredado (el paquete `app/` oculta el módulo del mismo nombre)"""
+    monkeypatch.chdir(ROOT)
+    spec = importlib.util.spec_from_file_location("legacy_app", ROOT / "app.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_generate_frontpage_substitutes_all_placeholders(legacy):
+    """Test que se sustituyen los marcadores, con o sin espacios"""
+    client = TestClient(legacy.app)
+    for template in legacy.VALID_TEMPLATES:
+        response = client.post("/api/generate-frontpage", json={
+            "template": template, "title": "Hola", "subtitle": "Mundo", "primaryColor": "#123456"
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert "Hola" in data["html"] and "{{title}}" not in data["html"] and "{{ title }}" not in data["html"]
+        assert "#123456" in data["css"]
+
+def test_templates_loaded_once(legacy):
+    """Test que los templates se leen de disco una sola vez"""
+    client = TestClient(legacy.app)
+    request = {"template": "minimal", "title": "A", "subtitle": "B", "primaryColor": "#000000"}
+    for _ in range(5):
+        client.post("/api/generate-frontpage", json=request)
+    assert legacy.template_registry.loads == 2
+
+    response = client.get("/minimal.html")
+    assert response.content == (ROOT / "templates" / "minimal.html").read_bytes()
+    assert legacy.template_registry.loads == 2
+
+    cached = client.get("/minimal.html", headers={"If-None-Match": response.headers["ETag"]})
+    assert cached.status_code == 304
+
+def test_registry_reloads_changed_file(legacy, tmp_path):
+    """Test que un cambio en el fichero se detecta por mtime y tamaño"""
+    path = tmp_path / "page.html"
+    path.write_text("<h1>{{title}}</h1>", encoding="utf-8")
+    registry = legacy.TemplateRegistry(str(tmp_path), check_interval=0)
+
+    assert registry.get("page.html").render({"title": "Uno"}) == "<h1>Uno</h1>"
+    assert registry.get("page.html").render({}) == "<h1>{{title}}</h1>"
+    assert registry.loads == 1
+
+    path.write_text("<h2>{{ title }} {{ other }}</h2>", encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert registry.get("page.html").render({"title": "Dos"}) == "<h2>Dos {{ other }}</h2>"
+    assert registry.loads == 2
@@ -0,0 +1,41 @@
+from app.core.metrics import Counter, Gauge, Histogram, Registry
+
+def test_metrics_text_format():
+    """Test Prometheus text exposition for each metric type"""
+    registry = Registry()
+    requests = registry.register(Counter("test_requests_total", "Requests", ("result",)))
+    registry.register(Gauge("test_size", "Size", function=lambda: 3))
+    latency = registry.register(Histogram("test_seconds", "Latency", ("stage",), buckets=(0.1, 1.0)))
+
+    requests.labels(result="hit").inc()
+    requests.labels(result="hit").inc(2)
+    latency.labels(stage="render").observe(0.05)
+    latency.labels(stage="render").observe(0.5)
+    latency.labels(stage="render").observe(5)
+
+    text = registry.render()
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{result="hit"} 3' in text
+    assert "test_size 3" in text
+    assert 'test_seconds_bucket{stage="render",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{stage="render",le="1"} 2' in text
+    assert 'test_seconds_bucket{stage="render",le="+Inf"} 3' in text
+    assert 'test_seconds_count{stage="render"} 3' in text
+    assert 'test_seconds_sum{stage="render"} 5.55' in text
+
+def test_metrics_endpoint(client, auth_headers, valid_template_request):
+    """Test /metrics exposes per-stage histograms after a generation"""
+    response = client.post("/api/generate-frontpage", json=valid_template_request, headers=auth_headers)
+    assert response.status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    for stage in ("validation", "rate_limit", "auth", "cache_lookup", "webhook_fanout"):
+        assert f'frontpage_stage_duration_seconds_count{{stage="{stage}"}}' in text
+    assert 'frontpage_http_request_duration_seconds_count{route="/api/generate-frontpage",method="POST",status="200"}' in text
+    assert "frontpage_render_cache_hit_ratio" in text
+    assert "frontpage_preview_store_size" in text
+    assert "frontpage_webhook_outbox_pending 0" in text
+    assert "frontpage_event_loop_lag_seconds_count" in text
@@ -0,0 +1,100 @@
+import marshal
+from app.services.profiling import RequestProfiler, ProfileStore, profile_store
+
+def _busy(n):
+    return sum(i * i for i in range(n))
+
+def test_profile_header_produces_downloadable_artifact(client, auth_headers, valid_template_request):
+    """Test que X-Profile con un token válido genera un perfil descargable"""
+    headers = {**auth_headers, "X-Profile": "1"}
+    # Título propio para no acertar en el caché de renderizado
+    payload = {**valid_template_request, "title": "Profiled page"}
+    response = client.post("/api/generate-frontpage", json=payload, headers=headers)
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile-Id"]
+
+    listing = client.get("/api/profiles", headers=auth_headers).json()
+    assert listing[0]["id"] == profile_id
+    assert listing[0]["route"] == "/api/generate-frontpage"
+    assert listing[0]["user"] == "test-user"
+
+    # Los perfiles solo son visibles para su usuario
+    from app.core.auth import create_access_token
+    other = {"Authorization": f"Bearer {create_access_token({'sub': 'otro'})}"}
+    assert all(summary["id"] != profile_id for summary in client.get("/api/profiles", headers=other).json())
+    assert client.get(f"/api/profiles/{profile_id}", headers=other).status_code == 404
+
+    raw = client.get(f"/api/profiles/{profile_id}", headers=auth_headers)
+    assert raw.status_code == 200
+    stats = marshal.loads(raw.content)
+    # Dependencias y renderizado aparecen en el perfil
+    names = {name for _, _, name in stats}
+    assert "get_current_user" in names
+    assert "render_template" in names
+
+    collapsed = client.get(f"/api/profiles/{profile_id}?format=collapsed", headers=auth_headers).text
+    assert any("render_template" in line for line in collapsed.splitlines())
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed.strip().splitlines())
+
+def test_profile_header_requires_valid_token(client, auth_headers, valid_template_request):
+    """Test que sin token válido la cabecera X-Profile se ignora"""
+    response = client.get("/api/templates", headers={"X-Profile": "1", "Authorization": "Bearer invalid"})
+    assert response.status_code == 401
+    assert "X-Profile-Id" not in response.headers
+
+    response = client.post("/api/generate-frontpage", json=valid_template_request, headers=auth_headers)
+    assert "X-Profile-Id" not in response.headers
+
+def test_profile_owner_without_sub(client):
+    """Test que un token sin `sub` ve sus propios perfiles"""
+    from app.core.auth import create_access_token
+    headers = {"Authorization": f"Bearer {create_access_token({})}"}
+    response = client.get("/api/templates", headers={**headers, "X-Profile": "1"})
+    profile_id = response.headers["X-Profile-Id"]
+    assert [summary["id"] for summary in client.get("/api/profiles", headers=headers).json()] == [profile_id]
+    assert client.get(f"/api/profiles/{profile_id}", headers=headers).status_code == 200
+
+def test_only_one_profile_at_a_time():
+    """Test que no se pueden anidar perfiles"""
+    profiler = RequestProfiler.try_start()
+    try:
+        assert RequestProfiler.try_start() is None
+        _busy(1000)
+    finally:
+        artifact = profiler.finish("/test", "GET", None)
+    assert profile_store.get(artifact.id) is artifact
+    assert "_busy" in artifact.to_text()
+    profiler = RequestProfiler.try_start()
+    assert profiler is not None
+    profiler.finish("/test", "GET", None)
+
+def test_failed_enable_does_not_block_profiling(monkeypatch):
+    """Test que si no se puede activar el perfilador, los siguientes perfiles siguen funcionando"""
+    import cProfile
+    from app.services import profiling
+
+    class BusyProfile(cProfile.Profile):
+        def enable(self, *args, **kwargs):
+            raise ValueError("Cannot install a profile function")
+
+    monkeypatch.setattr(profiling.cProfile, "Profile", BusyProfile)
+    try:
+        RequestProfiler.try_start()
+    except ValueError:
+        pass
+    monkeypatch.undo()
+    profiler = RequestProfiler.try_start()
+    assert profiler is not None
+    profiler.finish("/test", "GET", None)
+
+def test_profile_store_is_bounded():
+    """Test que el almacén descarta los perfiles más antiguos"""
+    store = ProfileStore(max_size=2)
+    ids = []
+    for _ in range(3):
+        profiler = RequestProfiler.try_start()
+        artifact = profiler.finish("/test", "GET", "test-user")
+        store.add(artifact)
+        ids.append(artifact.id)
+    assert store.get(ids[0]) is None
+    assert [summary["id"] for summary in store.list("test-user")] == [ids[2], ids[1]]
@@ -0,0 +1,93 @@
+import shutil
+
+import pytest
+
+from app.services import editor, renderer
+
+CONTEXT = {"title": "Recarga", "subtitle": "Templates", "primaryColor": "#007bff"}
+
+@pytest.fixture
+def templates(tmp_path, monkeypatch):
+    """Copia de los templates en un directorio temporal que los tests pueden editar"""
+    directory = tmp_path / "templates"
+    shutil.copytree(renderer.templates_dir, directory)
+    monkeypatch.setattr(renderer, "templates_dir", directory)
+    monkeypatch.setattr(renderer, "_env", None)
+    monkeypatch.setattr(renderer, "_templates", {})
+    monkeypatch.setattr(renderer, "_failed_versions", {})
+    monkeypatch.setattr(editor, "_layouts", {})
+    return directory
+
+def _edit(path, old, new):
+    path.write_text(path.read_text().replace(old, new))
+
+def test_cache_key_includes_template_version(templates):
+    """Test que la clave de caché cambia cuando cambia el contenido del template"""
+    key = renderer.get_cache_key("minimal", CONTEXT)
+    assert renderer.template_version("minimal") in key
+
+    _edit(templates / "minimal_style.html", "body {", "body { margin: 0;")
+    assert renderer.get_cache_key("minimal", CONTEXT) == key
+    assert renderer.reload_templates()["reloaded"] == {"minimal": renderer.template_version("minimal")}
+    assert renderer.get_cache_key("minimal", CONTEXT) != key
+
+def test_reload_compiles_only_changed_templates(templates, monkeypatch):
+    """Test que la recarga compara el código y solo compila los templates cambiados"""
+    renderer.template_version("minimal")
+    built = []
+    build = renderer._build_template_set
+    monkeypatch.setattr(renderer, "_build_template_set", lambda name, sources: built.append(name) or build(name, sources))
+    assert renderer.reload_templates() == {"reloaded": {}, "failed": {}}
+    assert built == []
+
+    # Un template que no compila no se vuelve a compilar hasta que cambie
+    _edit(templates / "minimal.html", "{% endblock %}", "")
+    assert "minimal" in renderer.reload_templates()["failed"]
+    assert "minimal" in renderer.reload_templates()["failed"]
+    assert built == ["minimal"]
+
+def test_reload_invalidates_only_changed_template(templates):
+    """Test que la recarga elimina solo los renderizados de la versión anterior"""
+    renderer.cache.set("template:other:abc:123", "{}")
+    rendered = renderer.get_cached_render("minimal", dict(CONTEXT))
+    old_version = rendered["template_version"]
+    assert renderer.reload_templates() == {"reloaded": {}, "failed": {}}
+    assert any(key.startswith(f"template:minimal:{old_version}:") for key in renderer.cache.cache)
+
+    _edit(templates / "minimal.html", "<main>", '<main class="reloaded">')
+    renderer.reload_templates()
+    assert not any(key.startswith(f"template:minimal:{old_version}:") for key in renderer.cache.cache)
+    assert "template:other:abc:123" in renderer.cache.cache
+    assert 'class="reloaded"' in renderer.get_cached_render("minimal", dict(CONTEXT))["html"]
+
+def test_reload_keeps_previous_version_on_error(templates):
+    """Test que un template con errores no sustituye a la versión anterior"""
+    version = renderer.template_version("minimal")
+    _edit(templates / "minimal.html", "{% endblock %}", "")
+    result = renderer.reload_templates()
+    assert "minimal" in result["failed"]
+    assert renderer.template_version("minimal") == version
+    assert "Recarga" in renderer.render_template("minimal", dict(CONTEXT))["html"]
+
+def test_reload_expires_previews_and_resyncs_sessions(templates):
+    """Test que las previsualizaciones del template anterior caducan y las sesiones se vuelven a renderizar"""
+    rendered = renderer.render_template("minimal", dict(CONTEXT))
+    preview = renderer.PreviewData(rendered["html"], rendered["css"], "minimal", rendered["template_version"])
+    session = editor.EditorSession("s", "user", {**CONTEXT, "template": "minimal", "customCss": None, "heroImage": None})
+    assert not preview.is_expired()
+
+    _edit(templates / "minimal_style.html", "body {", "body { margin: 0;")
+    renderer.reload_templates()
+    assert preview.is_expired()
+    assert session.is_stale()
+    changed, html, css = session.apply({**session.context, "title": "Nuevo"})
+    assert changed == ["title"] and set(css) == {"variables", "base", "custom"}
+    assert "margin:0" in session.css and not session.is_stale()
+
+def test_reload_endpoint(client, auth_headers, templates):
+    """Test del endpoint de recarga de templates"""
+    renderer.template_version("minimal")
+    _edit(templates / "minimal.html", "<main>", '<main class="reloaded">')
+    response = client.post("/api/templates/reload", headers=auth_headers)
+    assert response.status_code == 200
+    assert list(response.json()["reloaded"]) == ["minimal"]
@@ -1,4 +1,6 @@
 import pytest
+import asyncio
+import json
 from app.services.webhooks import notify_generation_event
 from app.models.schemas import GenerationEvent
 from datetime import datetime
@@ -71,3 +73,520 @@ def test_webhook_notification(client, valid_webhook_config, valid_template_reque
     # Nota: Para probar las notificaciones reales, necesitarías un servidor de prueba
     # que reciba las notificaciones. Aquí solo verificamos que no haya errores
     # en el proceso de generación cuando hay webhooks configurados.
+
+def _make_event(n):
+    return GenerationEvent(
+        event_id=f"evt-{n}",
+        template_type="minimal",
+        timestamp=datetime.now().isoformat(),
+        status="success",
+        details={}
+    )
+
+async def _notify_and_wait(event):
+    """Notifica el evento y espera a las entregas en segundo plano"""
+    from app.services import webhooks as webhook_service
+
+    await webhook_service.notify_generation_event(event)
+    await webhook_service.drain_deliveries()
+
+def test_webhook_batching_by_count(monkeypatch):
+    """Test batched delivery flushes when the event count is reached"""
+    from app.services import webhooks as webhook_service
+    from app.models.schemas import WebhookConfig
+
+    sent = []
+
+    async def fake_post(webhook, body, timeout):
+        sent.append(json.loads(body))
+
+    monkeypatch.setattr(webhook_service, "_post", fake_post)
+    monkeypatch.setattr(webhook_service, "webhooks", webhook_service.WebhookRegistry({
+        "batched": WebhookConfig(url="http://localhost:8001/webhook", batch_max_events=3, batch_linger_ms=60000)
+    }))
+    monkeypatch.setattr(webhook_service, "batcher", webhook_service.WebhookBatcher())
+
+    async def run():
+        for n in range(7):
+            await webhook_service.notify_generation_event(_make_event(n))
+        await webhook_service.batcher.flush_all()
+
+    asyncio.run(run())
+
+    # Dos lotes completos y un lote parcial enviado al vaciar el buffer
+    assert [len(batch) for batch in sent] == [3, 3, 1]
+    assert [e["event_id"] for batch in sent for e in batch] == [f"evt-{n}" for n in range(7)]
+
+def test_full_batch_does_not_block_request(monkeypatch):
+    """Test the request that fills a batch does not wait for the batch POST"""
+    from app.services import webhooks as webhook_service
+    from app.models.schemas import WebhookConfig
+
+    sent = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def slow_post(webhook, body, timeout):
+            await release.wait()
+            sent.append(json.loads(body))
+
+        monkeypatch.setattr(webhook_service, "_post", slow_post)
+        for n in range(2):
+            await asyncio.wait_for(webhook_service.notify_generation_event(_make_event(n)), timeout=1)
+        assert sent == []
+        release.set()
+        await webhook_service.batcher.flush_all()
+
+    monkeypatch.setattr(webhook_service, "webhooks", webhook_service.WebhookRegistry({
+        "batched": WebhookConfig(url="http://localhost:8001/webhook", batch_max_events=2, batch_linger_ms=60000)
+    }))
+    monkeypatch.setattr(webhook_service, "batcher", webhook_service.WebhookBatcher())
+    asyncio.run(run())
+
+    assert [[e["event_id"] for e in batch] for batch in sent] == [["evt-0", "evt-1"]]
+
+def test_webhook_batching_by_linger(monkeypatch):
+    """Test batched delivery flushes when the linger time expires"""
+    from app.services import webhooks as webhook_service
+    from app.models.schemas import WebhookConfig
+
+    sent = []
+
+    async def fake_post(webhook, body, timeout):
+        sent.append(json.loads(body))
+
+    monkeypatch.setattr(webhook_service, "_post", fake_post)
+    monkeypatch.setattr(webhook_service, "webhooks", webhook_service.WebhookRegistry({
+        "batched": WebhookConfig(url="http://localhost:8001/webhook", batch_max_events=100, batch_linger_ms=20)
+    }))
+    monkeypatch.setattr(webhook_service, "batcher", webhook_service.WebhookBatcher())
+
+    async def run():
+        await webhook_service.notify_generation_event(_make_event(1))
+        await webhook_service.notify_generation_event(_make_event(2))
+        assert sent == []
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+
+    assert len(sent) == 1
+    assert [e["event_id"] for e in sent[0]] == ["evt-1", "evt-2"]
+
+def test_webhook_receiver_accepts_batches():
+    """Test that the local receiver accepts single events and batches"""
+    import webhook_receiver
+    from fastapi.testclient import TestClient
+
+    webhook_receiver.received_events.clear()
+    receiver = TestClient(webhook_receiver.app)
+
+    response = receiver.post("/webhook", json=_make_event(1).model_dump())
+    assert response.json()["received"] == 1
+
+    response = receiver.post("/webhook", json=[_make_event(2).model_dump(), _make_event(3).model_dump()])
+    assert response.json()["received"] == 2
+
+    events = receiver.get("/events").json()
+    assert [e["event_id"] for e in events] == ["evt-1", "evt-2", "evt-3"]
+
+def test_webhook_retries_and_dead_letters(monkeypatch):
+    """Test failed deliveries are retried from the outbox and dead-lettered"""
+    from app.services import webhooks as webhook_service
+    from app.services.outbox import outbox
+    from app.models.schemas import WebhookConfig
+    from app.core.config import settings
+
+    attempts = []
+
+    async def failing_post(webhook, body, timeout):
+        attempts.append(json.loads(body)["event_id"])
+        raise RuntimeError("receiver down")
+
+    monkeypatch.setattr(webhook_service, "_post", failing_post)
+    monkeypatch.setattr(webhook_service, "compute_backoff", lambda attempts: 0)
+    monkeypatch.setattr(settings, "WEBHOOK_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(webhook_service, "webhooks", webhook_service.WebhookRegistry({
+        "down": WebhookConfig(url="http://localhost:8001/webhook")
+    }))
+
+    async def run():
+        await _notify_and_wait(_make_event(1))
+        assert await outbox.pending_count() == 1
+
+        await webhook_service.retry_scheduler.run_once()
+        await webhook_service.retry_scheduler.run_once()
+        assert await outbox.pending_count() == 0
+
+        dead = await outbox.list_dead_letters()
+        assert len(dead) == 1
+        assert dead[0]["event_id"] == "evt-1"
+        assert dead[0]["attempts"] == 3
+
+        # Reenviar el mensaje muerto cuando el receptor se recupera
+        async def ok_post(webhook, body, timeout):
+            attempts.append("replayed")
+
+        monkeypatch.setattr(webhook_service, "_post", ok_post)
+        assert await outbox.replay_dead_letters() == 1
+        await webhook_service.retry_scheduler.run_once()
+        assert await outbox.pending_count() == 0
+        assert await outbox.list_dead_letters() == []
+
+    asyncio.run(run())
+    assert attempts == ["evt-1", "evt-1", "evt-1", "replayed"]
+
+def test_batch_retries_keep_order(monkeypatch):
+    """Test retried batches of a webhook are sent one after another, in order"""
+    from app.services import webhooks as webhook_service
+    from app.models.schemas import WebhookConfig
+
+    async def failing_post(webhook, body, timeout):
+        raise RuntimeError("receiver down")
+
+    monkeypatch.setattr(webhook_service, "_post", failing_post)
+    monkeypatch.setattr(webhook_service, "compute_backoff", lambda attempts: 0)
+    monkeypatch.setattr(webhook_service, "batcher", webhook_service.WebhookBatcher())
+    monkeypatch.setattr(webhook_service, "webhooks", webhook_service.WebhookRegistry({
+        "batched": WebhookConfig(url="http://localhost:8001/webhook", batch_max_events=10, batch_linger_ms=60000)
+    }))
+    sent = []
+
+    async def slow_first_post(webhook, body, timeout):
+        batch = [e["event_id"] for e in json.loads(body)]
+        # El primer lote tarda más: si los lotes fueran en paralelo, el orden se perdería
+        await asyncio.sleep(0.01 if not sent else 0)
+        sent.append(batch)
+
+    async def run():
+        for n in range(5):
+            await webhook_service.notify_generation_event(_make_event(n))
+        await webhook_service.batcher.flush_all()
+
+        webhook_service.webhooks["batched"] = WebhookConfig(
+            url="http://localhost:8001/webhook", batch_max_events=2, batch_linger_ms=60000
+        )
+        monkeypatch.setattr(webhook_service, "_post", slow_first_post)
+        await webhook_service.retry_scheduler.run_once()
+
+    asyncio.run(run())
+    assert sent == [["evt-0", "evt-1"], ["evt-2", "evt-3"], ["evt-4"]]
+
+def test_split_batches_respects_byte_limit():
+    """Test retried batches are split by both the event and the byte limit"""
+    from app.services.webhooks import _split_batches
+    from app.services.outbox import OutboxRecord
+    from app.models.schemas import WebhookConfig
+
+    records = [OutboxRecord(n, "batched", "{}", f"evt-{n}", b"x" * 40, 1) for n in range(5)]
+    webhook = WebhookConfig(url="http://localhost:8001/webhook", batch_max_events=3, batch_max_bytes=100)
+    assert [[r.id for r in batch] for batch in _split_batches(webhook, records)] == [[0, 1, 2], [3, 4]]
+    webhook = WebhookConfig(url="http://localhost:8001/webhook", batch_max_events=10, batch_max_bytes=80)
+    assert [[r.id for r in batch] for batch in _split_batches(webhook, records)] == [[0, 1], [2, 3], [4]]
+
+def test_outbox_write_failure_does_not_hang(tmp_path):
+    """Test a failing outbox transaction fails its writes instead of leaving them pending"""
+    import sqlite3
+    from app.services.outbox import WebhookOutbox
+
+    broken = WebhookOutbox(str(tmp_path / "missing" / "webhook_outbox.db"))
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(sqlite3.OperationalError):
+                await asyncio.wait_for(broken.enqueue([("id", "{}", "evt-1", b"{}")], lease=10), timeout=5)
+        assert broken.queued_writes == 0
+
+    asyncio.run(run())
+
+def test_outbox_survives_restart(monkeypatch):
+    """Test pending deliveries are kept in the outbox across restarts"""
+    from app.services import webhooks as webhook_service
+    from app.services.outbox import outbox
+    from app.models.schemas import WebhookConfig
+
+    async def failing_post(webhook, body, timeout):
+        raise RuntimeError("receiver down")
+
+    monkeypatch.setattr(webhook_service, "_post", failing_post)
+    monkeypatch.setattr(webhook_service, "compute_backoff", lambda attempts: 0)
+    monkeypatch.setattr(webhook_service, "webhooks", webhook_service.WebhookRegistry({
+        "down": WebhookConfig(url="http://localhost:8001/webhook")
+    }))
+    asyncio.run(_notify_and_wait(_make_event(1)))
+
+    # Simular un reinicio: se pierde el registro en memoria y la conexión
+    outbox.close()
+    monkeypatch.setattr(webhook_service, "webhooks", webhook_service.WebhookRegistry())
+    delivered = []
+
+    async def ok_post(webhook, body, timeout):
+        delivered.append((str(webhook.url), json.loads(body)["event_id"]))
+
+    monkeypatch.setattr(webhook_service, "_post", ok_post)
+    asyncio.run(webhook_service.retry_scheduler.run_once())
+    assert delivered == [("http://localhost:8001/webhook", "evt-1")]
+
+def test_circuit_breaker_states():
+    """Test circuit breaker opening, half-open probing and recovery"""
+    from app.services.circuit_breaker import EndpointHealth
+
+    health = EndpointHealth(failure_threshold=3, reset_timeout=10, max_reset_timeout=40)
+
+    for _ in range(3):
+        assert health.allow_request()
+        health.record_failure("boom")
+    assert health.state == "open"
+    assert not health.allow_request(now=health.opened_at + 5)
+
+    # Tras el tiempo de apertura solo se admite una prueba
+    probe_time = health.opened_at + 10
+    assert health.allow_request(now=probe_time)
+    assert health.state == "half_open"
+    assert not health.allow_request(now=probe_time)
+
+    # La prueba falla: se reabre con el doble de espera
+    health.record_failure("still down")
+    assert health.state == "open"
+    assert health.reset_timeout == 20
+
+    assert health.allow_request(now=health.opened_at + 20)
+    health.record_success(0.05)
+    assert health.state == "closed"
+    assert health.reset_timeout == 10
+    assert health.snapshot()["rejected"] == 2
+
+def test_adaptive_timeout():
+    """Test webhook timeout adapts to observed latency"""
+    from app.services.circuit_breaker import EndpointHealth
+
+    health = EndpointHealth(min_timeout=0.5, max_timeout=10)
+    assert health.timeout == 10
+
+    for _ in range(20):
+        health.record_success(0.2)
+    assert 0.5 <= health.timeout < 1.0
+
+    for _ in range(20):
+        health.record_success(8.0)
+    assert health.timeout == 10
+
+def test_open_circuit_skips_delivery(monkeypatch):
+    """Test deliveries to an open circuit are postponed without consuming attempts"""
+    from app.services import webhooks as webhook_service
+    from app.services.circuit_breaker import get_health
+    from app.services.outbox import outbox
+    from app.models.schemas import WebhookConfig
+    from app.core.config import settings
+
+    calls = []
+
+    async def failing_post(webhook, body, timeout):
+        calls.append(timeout)
+        raise RuntimeError("receiver down")
+
+    monkeypatch.setattr(webhook_service, "_post", failing_post)
+    monkeypatch.setattr(settings, "WEBHOOK_BREAKER_THRESHOLD", 2)
+    monkeypatch.setattr(webhook_service, "webhooks", webhook_service.WebhookRegistry({
+        "down": WebhookConfig(url="http://localhost:8001/webhook")
+    }))
+
+    async def run():
+        for n in range(5):
+            await _notify_and_wait(_make_event(n))
+        assert await outbox.pending_count() == 5
+
+    asyncio.run(run())
+
+    # Solo los dos primeros eventos llegan a intentarse antes de abrir el circuito
+    assert len(calls) == 2
+    assert get_health("down").state == "open"
+
+def test_webhook_payload_signed_once(monkeypatch):
+    """Test every subscriber receives the same bytes with its own HMAC signature"""
+    import httpx
+    from app.services import webhooks as webhook_service
+    from app.models.schemas import WebhookConfig
+
+    received = []
+
+    def handler(request):
+        received.append(request)
+        return httpx.Response(200)
+
+    monkeypatch.setattr(webhook_service, "http_transport", httpx.MockTransport(handler))
+    monkeypatch.setattr(webhook_service, "webhooks", webhook_service.WebhookRegistry({
+        f"wh-{i}": WebhookConfig(url=f"http://receiver.local/{i}", secret=f"secret-{i}")
+        for i in range(3)
+    }))
+
+    async def run():
+        await _notify_and_wait(_make_event(1))
+        await webhook_service.close_client()
+
+    asyncio.run(run())
+
+    assert len(received) == 3
+    bodies = {request.content for request in received}
+    assert len(bodies) == 1
+    for request in received:
+        index = request.url.path.strip("/")
+        assert "X-Webhook-Secret" not in request.headers
+        assert webhook_service.verify_signature(
+            f"secret-{index}", request.content, request.headers["X-Webhook-Signature"]
+        )
+        assert not webhook_service.verify_signature("wrong", request.content, request.headers["X-Webhook-Signature"])
+
+def test_webhook_receiver_ring_buffer():
+    """Test the receiver keeps only the most recent events"""
+    import webhook_receiver
+    from fastapi.testclient import TestClient
+
+    webhook_receiver.reset(max_events=3)
+    receiver = TestClient(webhook_receiver.app)
+    webhook_receiver.configure(verbose=False)
+    try:
+        receiver.post("/webhook", json=[_make_event(n).model_dump() for n in range(5)])
+        events = receiver.get("/events").json()
+        assert [e["event_id"] for e in events] == ["evt-2", "evt-3", "evt-4"]
+        assert receiver.get("/stats").json()["events"] == 5
+
+        webhook_receiver.configure(error_rate=1.0)
+        assert receiver.post("/webhook", json=_make_event(6).model_dump()).status_code == 503
+    finally:
+        webhook_receiver.configure(error_rate=0, verbose=True)
+        webhook_receiver.reset(max_events=10000)
+
+def test_webhook_load_harness_smoke():
+    """Test the load harness delivers every event despite receiver errors"""
+    from benchmarks.webhook_load import run_load
+
+    report = asyncio.run(run_load(webhooks=3, events=20, error_rate=0.2, drain_timeout=10))
+    assert report["delivered"] == report["expected_deliveries"] == 60
+    assert report["pending"] == 0
+    assert report["attempts"] == report["delivered"] + report["retries"]
+
+def test_webhook_registry_index():
+    """Test subscription filters are resolved through the registry index"""
+    from app.services.webhooks import WebhookRegistry
+    from app.models.schemas import WebhookConfig
+
+    url = "http://localhost:8001/webhook"
+    registry = WebhookRegistry({
+        "all": WebhookConfig(url=url),
+        "minimal": WebhookConfig(url=url, templates=["minimal"]),
+        "errors": WebhookConfig(url=url, statuses=["error"]),
+        "landing-errors": WebhookConfig(url=url, templates=["landing", "blog"], statuses=["error"]),
+        "inactive": WebhookConfig(url=url, active=False),
+    })
+
+    def matched(template, status):
+        return sorted(webhook_id for webhook_id, _ in registry.match(template, status))
+
+    assert matched("minimal", "success") == ["all", "minimal"]
+    assert matched("landing", "error") == ["all", "errors", "landing-errors"]
+    assert matched("corporate", "success") == ["all"]
+
+    # Actualizar y eliminar mantienen el índice
+    registry["minimal"] = WebhookConfig(url=url, templates=["corporate"])
+    registry["inactive"] = WebhookConfig(url=url, templates=["corporate"])
+    del registry["all"]
+    assert matched("minimal", "success") == []
+    assert matched("corporate", "success") == ["inactive", "minimal"]
+    assert len(registry) == 4
+
+def test_webhook_sampling():
+    """Test sampling is deterministic and close to the configured rate"""
+    from app.services.webhooks import is_sampled
+
+    decisions = [is_sampled("wh", f"evt-{n}", 0.25) for n in range(4000)]
+    assert decisions == [is_sampled("wh", f"evt-{n}", 0.25) for n in range(4000)]
+    assert 0.2 < sum(decisions) / len(decisions) < 0.3
+    assert all(is_sampled("wh", f"evt-{n}", 1.0) for n in range(100))
+
+def test_webhook_filters_on_notify(monkeypatch):
+    """Test events are only delivered to matching subscribers"""
+    from app.services import webhooks as webhook_service
+    from app.models.schemas import WebhookConfig
+
+    sent = []
+
+    async def fake_post(webhook, body, timeout):
+        sent.append(str(webhook.url))
+
+    monkeypatch.setattr(webhook_service, "_post", fake_post)
+    monkeypatch.setattr(webhook_service, "webhooks", webhook_service.WebhookRegistry({
+        "minimal": WebhookConfig(url="http://receiver.local/minimal", templates=["minimal"]),
+        "corporate": WebhookConfig(url="http://receiver.local/corporate", templates=["corporate"]),
+        "errors": WebhookConfig(url="http://receiver.local/errors", statuses=["error"]),
+    }))
+
+    asyncio.run(_notify_and_wait(_make_event(1)))
+    assert sent == ["http://receiver.local/minimal"]
+
+def test_webhook_filter_validation():
+    """Test invalid subscription filters are rejected"""
+    from app.models.schemas import WebhookConfig
+    from pydantic import ValidationError
+
+    for invalid in ({"statuses": ["pending"]}, {"sample_rate": 0}, {"templates": ["unknown"]}):
+        with pytest.raises(ValidationError):
+            WebhookConfig(url="http://localhost:8001/webhook", **invalid)
+
+def test_slow_receiver_does_not_delay_notify(monkeypatch):
+    """Test notify only waits for the outbox write, not for the HTTP delivery"""
+    import time
+    from app.services import webhooks as webhook_service
+    from app.services.outbox import outbox
+    from app.models.schemas import WebhookConfig
+
+    delivered = []
+
+    async def slow_post(webhook, body, timeout):
+        await asyncio.sleep(0.5)
+        delivered.append(json.loads(body)["event_id"])
+
+    monkeypatch.setattr(webhook_service, "_post", slow_post)
+    monkeypatch.setattr(webhook_service, "webhooks", webhook_service.WebhookRegistry({
+        "slow": WebhookConfig(url="http://localhost:8001/webhook")
+    }))
+
+    async def run():
+        start = time.perf_counter()
+        await webhook_service.notify_generation_event(_make_event(1))
+        elapsed = time.perf_counter() - start
+        assert delivered == [] and await outbox.pending_count() == 1
+        await webhook_service.drain_deliveries()
+        return elapsed
+
+    assert asyncio.run(run()) < 0.25
+    assert delivered == ["evt-1"]
+
+def test_cancelled_probe_releases_half_open_circuit(monkeypatch):
+    """Test a cancelled half-open probe does not leave the circuit stuck"""
+    from app.services import webhooks as webhook_service
+    from app.services.circuit_breaker import get_health
+    from app.services.outbox import outbox
+    from app.models.schemas import WebhookConfig
+
+    webhook = WebhookConfig(url="http://localhost:8001/webhook")
+    health = get_health("flaky")
+    health.state, health.probe_in_flight = "half_open", False
+
+    async def hanging_post(webhook, body, timeout):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(webhook_service, "_post", hanging_post)
+
+    async def run():
+        records = await outbox.enqueue([("flaky", webhook.model_dump_json(), "evt-1", b"{}")], lease=60)
+        task = asyncio.create_task(webhook_service.deliver(webhook, records))
+        await asyncio.sleep(0.01)
+        assert health.probe_in_flight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert health.state == "half_open" and not health.probe_in_flight
+    assert health.allow_request()
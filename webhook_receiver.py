@@ -1,26 +1,108 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 import uvicorn
+from collections import deque
 from datetime import datetime
+import argparse
+import asyncio
+import hashlib
+import hmac
 import json
+import os
+import random
 
 app = FastAPI(title="Webhook Receiver")
 
-# Almacena los eventos recibidos para pruebas
-received_events = []
+# Secreto compartido con el webhook registrado (opcional)
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+
+# Comportamiento simulado para pruebas de carga
+behavior = {
+    "latency_ms": float(os.environ.get("RECEIVER_LATENCY_MS", 0)),
+    "error_rate": float(os.environ.get("RECEIVER_ERROR_RATE", 0)),
+    "drip_ms": float(os.environ.get("RECEIVER_DRIP_MS", 0)),  # respuesta enviada byte a byte
+    "verbose": os.environ.get("RECEIVER_QUIET") is None,
+}
+
+# Almacena los últimos eventos recibidos (buffer circular para ejecuciones largas)
+received_events = deque(maxlen=int(os.environ.get("RECEIVER_MAX_EVENTS", 10000)))
+stats = {"requests": 0, "events": 0, "errors": 0}
+
+def configure(**options):
+    """Ajusta el comportamiento simulado (latencia, tasa de error, goteo, verbosidad)"""
+    unknown = set(options) - set(behavior)
+    if unknown:
+        raise ValueError(f"Unknown receiver options: {', '.join(sorted(unknown))}")
+    behavior.update(options)
+
+def reset(max_events: int = None):
+    """Vacía los eventos y estadísticas, opcionalmente con otra capacidad"""
+    global received_events
+    received_events = deque(maxlen=max_events or received_events.maxlen)
+    stats.update(requests=0, events=0, errors=0)
+
+def verify_signature(secret: str, body: bytes, signature: str) -> bool:
+    """Comprueba la cabecera X-Webhook-Signature (HMAC-SHA256 del cuerpo)"""
+    expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature or "")
+
+async def _drip(content: bytes, delay: float):
+    for i in range(len(content)):
+        await asyncio.sleep(delay)
+        yield content[i:i + 1]
 
 @app.post("/webhook")
 async def receive_webhook(request: Request):
-    """Recibe y registra las notificaciones webhook"""
-    event = await request.json()
-    print(f"\n[{datetime.now()}] Webhook recibido:")
-    print(json.dumps(event, indent=2, default=str))
-    received_events.append(event)
-    return {"status": "ok"}
+    """Recibe y registra las notificaciones webhook (evento individual o lote)"""
+    stats["requests"] += 1
+    body = await request.body()
+    if WEBHOOK_SECRET and not verify_signature(
+        WEBHOOK_SECRET, body, request.headers.get("X-Webhook-Signature")
+    ):
+        raise HTTPException(status_code=401, detail="Invalid signature")
+
+    if behavior["latency_ms"]:
+        await asyncio.sleep(behavior["latency_ms"] / 1000)
+    if behavior["error_rate"] and random.random() < behavior["error_rate"]:
+        stats["errors"] += 1
+        return JSONResponse({"status": "error"}, status_code=503)
+
+    payload = json.loads(body)
+    events = payload if isinstance(payload, list) else [payload]
+    if behavior["verbose"]:
+        print(f"\n[{datetime.now()}] Webhook recibido ({len(events)} evento(s)):")
+        print(json.dumps(payload, indent=2, default=str))
+    received_events.extend(events)
+    stats["events"] += len(events)
+
+    result = {"status": "ok", "received": len(events)}
+    if behavior["drip_ms"]:
+        content = json.dumps(result).encode()
+        return StreamingResponse(_drip(content, behavior["drip_ms"] / 1000), media_type="application/json")
+    return result
 
 @app.get("/events")
 async def list_events():
-    """Lista todos los eventos recibidos"""
-    return received_events
+    """Lista los últimos eventos recibidos"""
+    return list(received_events)
+
+@app.get("/stats")
+async def receiver_stats():
+    """Contadores acumulados del receptor"""
+    return {**stats, "buffered": len(received_events), "behavior": behavior}
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=8001)
+    parser = argparse.ArgumentParser(description="Receptor local de webhooks")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=behavior["latency_ms"])
+    parser.add_argument("--error-rate", type=float, default=behavior["error_rate"])
+    parser.add_argument("--drip-ms", type=float, default=behavior["drip_ms"])
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+    configure(
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        drip_ms=args.drip_ms,
+        verbose=behavior["verbose"] and not args.quiet
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port)